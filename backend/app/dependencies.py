@@ -4,6 +4,9 @@ import openai
 from dotenv import load_dotenv
 from app.internal.query_pipeline_manager import QueryPipelineManager
 from app.internal.db_manager import get_database_info
+from app.internal.llm_client import llm_client
+from app.internal.job_queue import job_queue
+from app.internal.request_context import RequestContext
 
 # Load environment variables
 load_dotenv()
@@ -22,17 +25,17 @@ else:
 
 def get_openai_client():
     """
-    Get OpenAI client with proper configuration validation.
+    Get the shared, pooled OpenAI client with proper configuration validation.
 
     Returns:
-        openai module if properly configured
+        OpenAI client used by the query pipeline
 
     Raises:
         RuntimeError: If OpenAI API key is not configured
     """
-    if not openai.api_key:
+    if not openai.api_key and not os.getenv("OPENAI_BASE_URL"):
         raise RuntimeError("OpenAI API key is not configured")
-    return openai
+    return llm_client.client
 
 
 # Create global query pipeline manager
@@ -44,6 +47,33 @@ except Exception as e:
     raise
 
 
+def _run_response_table_job(payload: dict, context: RequestContext) -> dict:
+    """
+    Generate the response table of a "response_table" job.
+
+    Raises:
+        RuntimeError: If generation failed, so the job is marked failed
+            instead of done
+    """
+    result = query_pipeline_manager.generate_response_table(
+        payload["prompt"], payload.get("selected_tables") or [], context=context
+    )
+    # generate_response_table reports failures in its result instead of raising
+    if "error" in result:
+        raise RuntimeError(result["error"]["message"])
+    return result
+
+
+# Pipeline work that can be submitted as a background job
+job_queue.register("response_table", _run_response_table_job)
+job_queue.register(
+    "query",
+    lambda payload, context: query_pipeline_manager.generate_input_query_response_table(
+        payload["query"], context
+    ),
+)
+
+
 def get_query_pipeline_manager() -> QueryPipelineManager:
     """
     Get the global query pipeline manager instance.
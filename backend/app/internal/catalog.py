@@ -0,0 +1,134 @@
+import re
+import threading
+import logging
+from typing import Callable, Optional
+
+import duckdb
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# DESCRIBE, SHOW, SUMMARIZE, FROM, TABLE, VALUES and PRAGMA queries parse as
+# SELECT statements too
+_READ_ONLY_STATEMENTS = (duckdb.StatementType.SELECT,)
+# EXPLAIN ANALYZE runs the statement it explains
+_EXPLAIN_PREFIX = re.compile(r"\s*explain\s*(?:\([^)]*\)|analyze\b)?", re.IGNORECASE)
+# Quoted strings and identifiers are kept as is, comments and whitespace not
+_SQL_NORMALIZE = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(?:--[^\n]*|/\*.*?\*/|\s)+", re.DOTALL
+)
+
+
+def is_read_only_query(query: str) -> bool:
+    """
+    Check whether a SQL string only reads data, using DuckDB's parser.
+
+    Function names, quoted identifiers, string literals and comments cannot
+    be mistaken for write statements; every statement of the string must
+    be a query, or an EXPLAIN of one. Strings that do not parse are not
+    read-only.
+
+    Args:
+        query: SQL query string
+
+    Returns:
+        True if the statement is a read-only query
+    """
+    try:
+        statements = duckdb.extract_statements(query or "")
+    except duckdb.Error:
+        return False
+    if not statements:
+        return False
+    for statement in statements:
+        if statement.type == duckdb.StatementType.EXPLAIN:
+            prefix = _EXPLAIN_PREFIX.match(statement.query)
+            if prefix is None or not is_read_only_query(
+                statement.query[prefix.end() :]
+            ):
+                return False
+        elif statement.type not in _READ_ONLY_STATEMENTS:
+            return False
+    return True
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize a SQL statement for comparison.
+
+    Comments are removed and whitespace is collapsed outside quoted strings
+    and identifiers; a trailing semicolon is dropped.
+    """
+    normalized = _SQL_NORMALIZE.sub(lambda m: m.group(1) or " ", query or "")
+    return normalized.strip().rstrip(";").rstrip()
+
+
+class CatalogVersions:
+    """
+    Tracks a monotonically increasing version number for every table.
+
+    Versions are bumped whenever a table is created, replaced, modified or
+    dropped, which lets caches and request coalescing detect stale data
+    without querying DuckDB. A bump without a table name invalidates every
+    table at once (used when a write statement touches unknown tables).
+    Listeners registered with add_listener are called after every bump with
+    the changed table name (or None).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._floor = 0
+        self._versions: dict[str, int] = {}
+        self._listeners: list[Callable[[Optional[str]], None]] = []
+
+    def add_listener(self, callback: Callable[[Optional[str]], None]):
+        """Call callback(table_name) after every bump."""
+        self._listeners.append(callback)
+
+    def bump(self, table_name: str = None) -> int:
+        """
+        Record a change to a table.
+
+        Args:
+            table_name: Changed table, or None if any table may have changed
+
+        Returns:
+            The new catalog version
+        """
+        with self._lock:
+            self._counter += 1
+            if table_name is None:
+                self._floor = self._counter
+            else:
+                self._versions[table_name.lower()] = self._counter
+            logger.debug("Catalog version bumped to %d (%s)", self._counter, table_name)
+            version = self._counter
+        for callback in self._listeners:
+            try:
+                callback(table_name)
+            except Exception as e:
+                logger.warning("Catalog listener failed: %s", e)
+        return version
+
+    def version(self, table_name: str) -> int:
+        """Get the current version of a single table."""
+        with self._lock:
+            return max(self._floor, self._versions.get(table_name.lower(), 0))
+
+    def versions(self, table_names: list[str]) -> tuple[int, ...]:
+        """Get the current versions of several tables, in the given order."""
+        with self._lock:
+            return tuple(
+                max(self._floor, self._versions.get(name.lower(), 0))
+                for name in table_names
+            )
+
+    def current(self) -> int:
+        """Get the global catalog version (changes on any table change)."""
+        with self._lock:
+            return self._counter
+
+
+# Global catalog version tracker
+catalog_versions = CatalogVersions()
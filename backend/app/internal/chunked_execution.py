@@ -0,0 +1,368 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from typing import Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is a declared dependency
+    pa = None
+
+from app.internal.database import cursor_pool
+from app.internal.metrics import Counter, registry
+from app.internal.query_rewriter import prepare_query
+from app.internal.result_cache import arrow_compatible
+from app.internal.sql_rewrite import (
+    alias_after,
+    apply_edits,
+    contains_aggregate,
+    column_names,
+    cte_names,
+    enclosing_selects,
+    find_llm_calls,
+    identifier_name,
+    parse_select,
+    quote_identifier,
+    token_range,
+    tokenize,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CHUNKS = registry.register(
+    Counter(
+        "flockmtl_query_chunks_total",
+        "Chunks of FlockMTL queries run in parallel, by outcome",
+        labelnames=("status",),
+    )
+)
+
+# Clauses that combine rows of different chunks, so their result is not the
+# concatenation of the chunks' results
+_UNSPLITTABLE_CLAUSES = ("group by", "having", "window", "qualify", "limit", "offset")
+
+
+class ChunkPlan:
+    """A query split into statements over disjoint rowid ranges of a table."""
+
+    def __init__(self, table: str, queries: list[str], order_by: Optional[str]):
+        self.table = table
+        self.queries = queries
+        # ORDER BY of the original query, applied again to the merged chunks
+        self.order_by = order_by
+
+
+class ChunkedExecutor:
+    """
+    Run LLM-heavy FlockMTL queries as parallel chunks.
+
+    FlockMTL evaluates a statement's llm_* calls one batch at a time, so a
+    query calling the model for many rows is bound by request latency. When
+    every output row comes from exactly one row of the first table in the
+    FROM clause, the query is split into one statement per rowid range of
+    that table. Each chunk is optimized and checked on its own, runs on its
+    own pooled cursor and is fetched as Arrow; the chunks are concatenated
+    and the original ORDER BY is applied again. A failed chunk does not fail
+    the others: the rows of the completed chunks are returned and flagged as
+    partial.
+
+    All requests share one thread pool, whose size bounds the chunks
+    running at once next to the chunk each request runs itself.
+    """
+
+    def __init__(
+        self, chunks: int, min_model_calls: int, max_concurrent: int, enabled: bool
+    ):
+        self.chunks = chunks
+        self.min_model_calls = min_model_calls
+        self.max_concurrent = max_concurrent
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(max_concurrent, 1), thread_name_prefix="query-chunk"
+        )
+        self._lock = threading.Lock()
+        self._stats = {"split_queries": 0, "partial_results": 0}
+
+    def plan(self, cursor, query: str, estimate: Optional[dict]) -> Optional[ChunkPlan]:
+        """
+        Split a query into chunks if it is worth running them in parallel.
+
+        Args:
+            cursor: DuckDB cursor the query will run on
+            query: Read-only SQL query, before any rewrite
+            estimate: LLM cost estimate of the query
+
+        Returns:
+            The chunks, or None if the query should run as a single statement
+        """
+        if (
+            not self.enabled
+            or self.chunks < 2
+            or estimate is None
+            or "sampled" in estimate
+            or estimate["model_calls"] < self.min_model_calls
+        ):
+            return None
+        try:
+            return self._plan(cursor, query.strip().rstrip(";"))
+        except Exception as e:
+            logger.debug("Query not split into chunks: %s", e)
+            return None
+
+    def _plan(self, cursor, query: str) -> Optional[ChunkPlan]:
+        tokens = tokenize(query)
+        block = parse_select(tokens, 0, len(tokens), len(query))
+        if (
+            block is None
+            or block.set_operation
+            or block.distinct
+            or "select" not in block.clauses
+            or "from" not in block.clauses
+            or block.clauses["from"][0] < block.clauses["select"][0]
+            or any(clause in block.clauses for clause in _UNSPLITTABLE_CLAUSES)
+            or contains_aggregate(tokens, block.clauses["select"])
+        ):
+            return None
+
+        # Calls in CTEs or subqueries might not be per row of the chunk
+        for call in find_llm_calls(query, tokens):
+            if (
+                not call.scalar
+                or len(enclosing_selects(query, tokens, call.open_index)) != 1
+            ):
+                return None
+
+        from_indexes = token_range(tokens, block.clauses["from"])
+        if not from_indexes:
+            return None
+        first = last = from_indexes[0]
+        if tokens[first].kind not in ("word", "ident"):
+            return None
+        while (
+            last + 2 < len(tokens)
+            and tokens[last + 1].text == "."
+            and tokens[last + 2].kind in ("word", "ident")
+        ):
+            last += 2
+        if last + 1 < len(tokens) and tokens[last + 1].text == "(":
+            # A table function
+            return None
+        if last == first and identifier_name(tokens[first]) in cte_names(tokens):
+            return None
+        if any(
+            tokens[i].depth == block.depth
+            and tokens[i].is_word("right", "full", "positional")
+            for i in from_indexes
+        ):
+            # Rows of these joins do not all come from a row of the first table
+            return None
+
+        table = query[tokens[first].start : tokens[last].end]
+        alias = alias_after(tokens, last)
+        qualifier = quote_identifier(alias) if alias else table
+        low, high = cursor.execute(
+            f"SELECT min(rowid), max(rowid) FROM {table}"
+        ).fetchone()
+        if not isinstance(low, int) or not isinstance(high, int):
+            return None
+        count = min(self.chunks, high - low + 1)
+        if count < 2:
+            return None
+
+        order_by = block.clause(query, "order by")
+        edits = []
+        if order_by is not None:
+            order_index = max(
+                i
+                for i in range(len(tokens))
+                if tokens[i].depth == block.depth
+                and tokens[i].is_word("order")
+                and tokens[i].start < block.clauses["order by"][0]
+            )
+            edits.append((tokens[order_index].start, block.clauses["order by"][1], ""))
+
+        step = -(-(high - low + 1) // count)
+        queries = []
+        for start in range(low, high + 1, step):
+            predicate = f"{qualifier}.rowid BETWEEN {start} AND {start + step - 1}"
+            where = block.clauses.get("where")
+            if where is not None:
+                chunk_edits = [
+                    (where[0], where[0], " ("),
+                    (where[1], where[1], f"\n) AND {predicate}\n"),
+                ]
+            else:
+                end = block.clauses["from"][1]
+                chunk_edits = [(end, end, f"\nWHERE {predicate}\n")]
+            queries.append(apply_edits(query, chunk_edits + edits))
+
+        # Chunks must bind to the same columns, which the ORDER BY can sort
+        described = cursor.execute(f"DESCRIBE {query}").fetchall()
+        columns = [row[0] for row in described]
+        if (
+            column_names(cursor, queries[0]) != columns
+            or len(set(columns)) != len(columns)
+            or not arrow_compatible([row[1] for row in described])
+        ):
+            return None
+        if order_by is not None:
+            cursor.execute(
+                f"DESCRIBE SELECT * FROM ({queries[0]}) __llm_chunks ORDER BY {order_by}"
+            )
+        return ChunkPlan(table, queries, order_by)
+
+    def run(self, cursor, plan: ChunkPlan, context=None) -> tuple[object, list[dict]]:
+        """
+        Run the chunks of a query and merge their results.
+
+        The first chunk runs on the caller's cursor in the calling thread.
+        The others run on the shared thread pool, each on a cursor reserved
+        up front without waiting; chunks that get no free cursor run after
+        the first one on the caller's cursor. A chunk thread never waits for
+        the cursor pool, which would deadlock once every cursor is held by a
+        request waiting for its chunks.
+
+        Args:
+            cursor: DuckDB cursor of the request
+            plan: Chunks from plan()
+            context: Request context, whose cancel() interrupts every chunk
+
+        Returns:
+            The merged result as an Arrow table and a progress entry per
+            chunk (status, rows, seconds, error)
+
+        Raises:
+            RequestCancelled: If the context was cancelled
+            Exception: The first chunk's error if every chunk failed
+        """
+        progress = [
+            {
+                "chunk": number,
+                "status": "pending",
+                "rows": None,
+                "seconds": None,
+                "error": None,
+            }
+            for number in range(len(plan.queries))
+        ]
+        if context is not None:
+            # Shared with the context, so its progress() follows the chunks
+            context.chunks = progress
+
+        chunks = list(zip(plan.queries, progress))
+        with ExitStack() as reserved:
+            futures = []
+            for sql, entry in chunks[1:]:
+                try:
+                    chunk_cursor = reserved.enter_context(cursor_pool.cursor(timeout=0))
+                except TimeoutError:
+                    break
+                futures.append(
+                    self._executor.submit(
+                        self._run_chunk, chunk_cursor, sql, entry, context
+                    )
+                )
+            local = [chunks[0], *chunks[1 + len(futures) :]]
+            if len(local) > 1:
+                logger.info(
+                    "No free cursor for %d chunk(s); running them on the request's cursor",
+                    len(local) - 1,
+                )
+            tables = [
+                self._run_chunk(cursor, sql, entry, context, own_cursor=True)
+                for sql, entry in local
+            ]
+            tables += [future.result() for future in futures]
+        if context is not None:
+            # Chunks skipped by a cancel are missing, never return the rest
+            context.check_cancelled()
+
+        failed = [entry for entry in progress if entry["status"] == "failed"]
+        logger.info(
+            "Ran query over %s in %d chunks (%d failed)",
+            plan.table,
+            len(progress),
+            len(failed),
+        )
+        if len(failed) == len(progress):
+            raise Exception(failed[0]["error"])
+        with self._lock:
+            self._stats["split_queries"] += 1
+            self._stats["partial_results"] += bool(failed)
+
+        table = pa.concat_tables([table for table in tables if table is not None])
+        if plan.order_by is not None:
+            name = f"__llm_chunks_{uuid.uuid4().hex}"
+            cursor.register(name, table)
+            try:
+                table = (
+                    cursor.execute(f"SELECT * FROM {name} ORDER BY {plan.order_by}")
+                    .fetch_record_batch()
+                    .read_all()
+                )
+            finally:
+                cursor.unregister(name)
+        return table, progress
+
+    def _run_chunk(
+        self, cursor, sql: str, entry: dict, context=None, own_cursor: bool = False
+    ):
+        """
+        Optimize, run and fetch one chunk, recording its progress.
+
+        The request's own cursor (own_cursor) is already interruptible
+        through the context; a reserved chunk cursor is made so here.
+        """
+        start_time = time.time()
+        entry["status"] = "running"
+        interruptible = (
+            context.interruptible(cursor)
+            if context is not None and not own_cursor
+            else nullcontext()
+        )
+        try:
+            with interruptible:
+                table = self._execute(cursor, sql, context)
+        except Exception as e:
+            logger.warning("Query chunk %d failed: %s", entry["chunk"], e)
+            entry.update(status="failed", error=str(e))
+            table = None
+        else:
+            entry.update(status="done", rows=table.num_rows)
+        entry["seconds"] = round(time.time() - start_time, 3)
+        CHUNKS.inc(status=entry["status"])
+        logger.debug("Query chunk %d: %s", entry["chunk"], entry)
+        return table
+
+    def _execute(self, cursor, sql: str, context=None):
+        # A cancel arriving between statements does not interrupt the cursor
+        if context is not None:
+            context.check_cancelled()
+        sql, _, _ = prepare_query(cursor, sql)
+        if context is not None:
+            context.check_cancelled()
+        return cursor.execute(sql).fetch_record_batch().read_all()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "chunks": self.chunks,
+                "min_model_calls": self.min_model_calls,
+                "max_concurrent": self.max_concurrent,
+            }
+
+
+# Global executor shared by all requests
+chunked_executor = ChunkedExecutor(
+    chunks=int(os.getenv("PARALLEL_CHUNKS", "4")),
+    min_model_calls=int(os.getenv("PARALLEL_CHUNK_MIN_MODEL_CALLS", "200")),
+    max_concurrent=int(os.getenv("PARALLEL_CHUNK_MAX_CONCURRENT", "4")),
+    enabled=os.getenv("PARALLEL_CHUNKS_ENABLED", "true").lower() == "true",
+)
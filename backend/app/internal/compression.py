@@ -0,0 +1,223 @@
+import os
+import zlib
+import logging
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Optional codecs, used when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Emit everything compressed so far without ending the stream."""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encoders() -> dict[str, tuple[type, int]]:
+    """
+    Return the usable encoders and their levels, in server preference order.
+
+    zstd and brotli are only offered when their packages are installed.
+    """
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = (ZstdEncoder, int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3")))
+    if brotli is not None:
+        encoders["br"] = (
+            BrotliEncoder,
+            int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+        )
+    encoders["gzip"] = (GzipEncoder, int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")))
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, supported: list[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header.
+
+    The highest q-value wins; ties are broken by the order of supported.
+
+    Args:
+        accept_encoding: Accept-Encoding header value
+        supported: Encodings the server can produce, most preferred first
+
+    Returns:
+        The chosen encoding, or None to send the response uncompressed
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(headers: Headers, status: int) -> bool:
+    """Check whether a response can be compressed."""
+    if status < 200 or status in (204, 304):
+        return False
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(_COMPRESSIBLE_TYPES) or "+json" in content_type
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses by content negotiation.
+
+    Supports zstd and brotli when installed, and gzip otherwise. Complete
+    responses smaller than the minimum size are sent as is. Streaming
+    responses (e.g. the NDJSON batch endpoint) are compressed incrementally
+    and flushed after every chunk, so clients still receive each result as
+    soon as it is produced.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size or int(
+            os.getenv("COMPRESSION_MIN_SIZE", "1024")
+        )
+        self.enabled = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+        self.encoders = available_encoders()
+        logger.info("Response compression encodings: %s", list(self.encoders))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), list(self.encoders)
+        )
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        encoder_class, level = self.encoders[encoding]
+        state = {"start": None, "encoder": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                # Hold the headers until the first body chunk shows the size
+                state["start"] = message
+                return
+            if message_type != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            start = state["start"]
+            if start is not None:
+                state["start"] = None
+                headers = MutableHeaders(raw=start.setdefault("headers", []))
+                if not is_compressible(headers, start["status"]) or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = state["encoder"] = encoder_class(level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                if not more_body:
+                    data = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send(start)
+
+            encoder = state["encoder"]
+            data = encoder.compress(body)
+            data += encoder.flush() if more_body else encoder.finish()
+            await send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_wrapper)
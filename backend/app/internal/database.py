@@ -1,7 +1,13 @@
 import json
 import os
+import queue
+import tempfile
 import logging
+import threading
+from contextlib import contextmanager
 from .db_manager import get_connection
+from .catalog import catalog_versions
+from .metrics import register_gauge_callback
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -15,6 +21,163 @@ except Exception as e:
     raise
 
 
+class CursorPool:
+    """
+    Bounded pool of DuckDB cursors for concurrent query execution.
+
+    A DuckDB connection must not be shared between threads; each cursor is a
+    separate connection to the same database instance, so tables, loaded
+    extensions and secrets are shared while execution state is not. Cursors
+    are created lazily and reused across requests.
+    """
+
+    def __init__(self, connection, size: int):
+        self._connection = connection
+        self._size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+    @contextmanager
+    def cursor(self, timeout: float = None):
+        """
+        Borrow a cursor from the pool, blocking while all cursors are busy.
+
+        Args:
+            timeout: Maximum seconds to wait for a free cursor (None = forever)
+
+        Raises:
+            TimeoutError: If no cursor became available in time
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a free database cursor")
+
+        try:
+            try:
+                cursor = self._idle.get_nowait()
+            except queue.Empty:
+                cursor = self._connection.cursor()
+                # Settings are per connection; progress is read by query_progress()
+                cursor.execute("SET enable_progress_bar = true")
+                cursor.execute("SET enable_progress_bar_print = false")
+                with self._lock:
+                    self._created += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield cursor
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(cursor)
+            self._slots.release()
+
+    def get_stats(self) -> dict:
+        """Return pool size and usage counters."""
+        with self._lock:
+            return {
+                "size": self._size,
+                "created": self._created,
+                "in_use": self._in_use,
+            }
+
+
+# Shared cursor pool used for all query execution outside the event loop
+cursor_pool = CursorPool(conn, int(os.getenv("DUCKDB_CURSOR_POOL_SIZE", "8")))
+
+register_gauge_callback(
+    "flockmtl_db_cursor_pool_in_use",
+    "Number of DuckDB cursors currently borrowed from the pool",
+    lambda: cursor_pool.get_stats()["in_use"],
+)
+register_gauge_callback(
+    "flockmtl_db_cursor_pool_size",
+    "Maximum number of DuckDB cursors in the pool",
+    lambda: cursor_pool.get_stats()["size"],
+)
+
+
+# Top-level DuckDB profiling metrics kept in trace summaries
+_PROFILE_METRICS = (
+    "latency",
+    "cpu_time",
+    "rows_returned",
+    "cumulative_cardinality",
+    "cumulative_rows_scanned",
+    "system_peak_buffer_memory",
+    "total_bytes_read",
+)
+
+
+def summarize_profile(profile: dict, max_operators: int = 64) -> dict:
+    """
+    Condense a DuckDB JSON query profile into headline metrics and operators.
+
+    Args:
+        profile: Parsed JSON profiling output
+        max_operators: Maximum number of operators to keep
+
+    Returns:
+        Dictionary with the query-level metrics and a flat operator list
+    """
+    summary = {key: profile[key] for key in _PROFILE_METRICS if key in profile}
+    operators = []
+    stack = [(child, 0) for child in reversed(profile.get("children", []))]
+    while stack and len(operators) < max_operators:
+        node, depth = stack.pop()
+        operators.append(
+            {
+                "operator": node.get("operator_name") or node.get("operator_type"),
+                "depth": depth,
+                "timing": node.get("operator_timing"),
+                "cardinality": node.get("operator_cardinality"),
+                "rows_scanned": node.get("operator_rows_scanned"),
+            }
+        )
+        stack.extend((child, depth + 1) for child in reversed(node.get("children", [])))
+    summary["operators"] = operators
+    return summary
+
+
+@contextmanager
+def profiled(cursor):
+    """
+    Profile the statements run on a cursor inside the block.
+
+    Yields a dictionary that is filled with the summarized profile of the
+    last statement once the block exits. Profiling is switched off again
+    afterwards, since pooled cursors are reused by other requests.
+
+    Args:
+        cursor: DuckDB cursor borrowed from the pool
+    """
+    fd, path = tempfile.mkstemp(prefix="flockmtl_profile_", suffix=".json")
+    os.close(fd)
+    profile: dict = {}
+    try:
+        cursor.execute("SET enable_profiling = 'json'")
+        cursor.execute(f"SET profiling_output = '{path}'")
+        try:
+            yield profile
+        finally:
+            # Read before resetting: the RESET statements are profiled as well
+            try:
+                with open(path) as profile_file:
+                    profile.update(summarize_profile(json.load(profile_file)))
+            except (OSError, ValueError) as e:
+                logger.debug("No query profile available: %s", e)
+            cursor.execute("RESET enable_profiling")
+            cursor.execute("RESET profiling_output")
+    finally:
+        os.remove(path)
+
+
 def _insert_data_from_csv(file_path: str, table_name: str, columns: list[str]):
     """
     Helper function to insert data from CSV file into table.
@@ -287,6 +450,7 @@ def load_sample_data():
                 f"CREATE TABLE IF NOT EXISTS {table_name} ({config['schema']});"
             )
             conn.execute(create_sql)
+            catalog_versions.bump(table_name)
             logger.info(f"✅ Table '{table_name}' created/verified")
         except Exception as e:
             logger.error(f"❌ Failed to create table '{table_name}': {e}")
@@ -299,6 +463,7 @@ def load_sample_data():
                 _insert_data_from_csv(config["file"], table_name, config["columns"])
             else:
                 _insert_data_from_json(config["file"], table_name, config["columns"])
+            catalog_versions.bump(table_name)
         except Exception as e:
             logger.error(f"❌ Failed to load data for table '{table_name}': {e}")
 
@@ -326,14 +491,15 @@ def execute_query(query: str):
         logger.debug(
             f"Executing query: {query[:100]}{'...' if len(query) > 100 else ''}"
         )
-        result = conn.execute(query).fetchall()
-        logger.debug(f"Query executed successfully, returned {len(result)} rows")
+        with cursor_pool.cursor() as cursor:
+            result = cursor.execute(query).fetchall()
+        logger.debug("Query executed successfully, returned %d rows", len(result))
         return result
 
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Query execution failed: {error_msg}")
-        logger.debug(f"Failed query: {query}")
+        logger.debug("Failed query: %s", query)
         return f"Query execution error: {error_msg}"
 
 
@@ -352,9 +518,10 @@ def get_table_schema(table_name: str):
         return "Error: No table name provided"
 
     try:
-        logger.debug(f"Getting schema for table: {table_name}")
-        schema = conn.execute(f"DESCRIBE {table_name};").fetchall()
-        logger.debug(f"Schema retrieved for '{table_name}': {len(schema)} columns")
+        logger.debug("Getting schema for table: %s", table_name)
+        with cursor_pool.cursor() as cursor:
+            schema = cursor.execute(f"DESCRIBE {table_name};").fetchall()
+        logger.debug("Schema retrieved for '%s': %d columns", table_name, len(schema))
         return schema
 
     except Exception as e:
@@ -377,53 +544,56 @@ def get_all_tables():
     """
     try:
         logger.debug("Retrieving all table information...")
-        tables = conn.execute("SHOW TABLES;").fetchall()
-
-        if not tables:
-            logger.info("No tables found in database")
-            return []
-
-        tables_info = []
-        for table_row in tables:
-            table_name = table_row[0]
-
-            try:
-                # Get row count
-                row_count_result = conn.execute(
-                    f"SELECT COUNT(*) FROM {table_name}"
-                ).fetchone()
-                row_count = row_count_result[0] if row_count_result else 0
-
-                # Get column information
-                columns_info = conn.execute(f"DESCRIBE {table_name}").fetchall()
-                columns = [col[0] for col in columns_info]
-
-                tables_info.append(
-                    {
-                        "table_name": table_name,
-                        "row_count": row_count,
-                        "columns": columns,
-                    }
-                )
-
-                logger.debug(
-                    f"Table info collected for '{table_name}': {row_count} rows, {len(columns)} columns"
-                )
-
-            except Exception as e:
-                logger.error(f"Error collecting info for table '{table_name}': {e}")
-                # Add table with error info
-                tables_info.append(
-                    {
-                        "table_name": table_name,
-                        "row_count": -1,
-                        "columns": [],
-                        "error": str(e),
-                    }
-                )
-
-        logger.info(f"Successfully retrieved information for {len(tables_info)} tables")
-        return tables_info
+        with cursor_pool.cursor() as cursor:
+            tables = cursor.execute("SHOW TABLES;").fetchall()
+
+            if not tables:
+                logger.info("No tables found in database")
+                return []
+
+            tables_info = []
+            for table_row in tables:
+                table_name = table_row[0]
+
+                try:
+                    # Get row count
+                    row_count_result = cursor.execute(
+                        f"SELECT COUNT(*) FROM {table_name}"
+                    ).fetchone()
+                    row_count = row_count_result[0] if row_count_result else 0
+
+                    # Get column information
+                    columns_info = cursor.execute(f"DESCRIBE {table_name}").fetchall()
+                    columns = [col[0] for col in columns_info]
+
+                    tables_info.append(
+                        {
+                            "table_name": table_name,
+                            "row_count": row_count,
+                            "columns": columns,
+                        }
+                    )
+
+                    logger.debug(
+                        f"Table info collected for '{table_name}': {row_count} rows, {len(columns)} columns"
+                    )
+
+                except Exception as e:
+                    logger.error(f"Error collecting info for table '{table_name}': {e}")
+                    # Add table with error info
+                    tables_info.append(
+                        {
+                            "table_name": table_name,
+                            "row_count": -1,
+                            "columns": [],
+                            "error": str(e),
+                        }
+                    )
+
+            logger.info(
+                f"Successfully retrieved information for {len(tables_info)} tables"
+            )
+            return tables_info
 
     except Exception as e:
         error_msg = str(e)
@@ -0,0 +1,67 @@
+import json
+
+import duckdb
+import pandas as pd
+
+# Functions here run in worker processes (see process_pool), so they only
+# depend on pandas, DuckDB and Arrow, never on the API's own connection
+
+
+def clean_column_name(name) -> str:
+    """Normalize an uploaded column name the way table names are normalized."""
+    return str(name).lower().replace(" ", "_").replace("-", "_")
+
+
+def read_csv_table(path: str) -> dict:
+    """
+    Parse a CSV file into an Arrow table.
+
+    pandas parses the file (it copes with the widest range of formats), and
+    a private in-memory DuckDB connection converts the DataFrame, so the
+    table gets the same column types as a DataFrame scanned by the API's
+    connection.
+
+    Returns:
+        {"csv": table}
+    """
+    df = pd.read_csv(path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    with duckdb.connect() as local:
+        return {
+            "csv": local.execute("SELECT * FROM df").fetch_record_batch().read_all()
+        }
+
+
+def list_duckdb_tables(path: str) -> list[str]:
+    """List the tables of a DuckDB database file."""
+    with duckdb.connect(path, read_only=True) as source:
+        return [row[0] for row in source.execute("SHOW TABLES").fetchall()]
+
+
+def read_duckdb_table(path: str, table_name: str) -> dict:
+    """
+    Read one table of a DuckDB database file as Arrow.
+
+    Tables are read one at a time, so importing a database only ever holds
+    one of its tables in memory. The declared column types are kept in the
+    schema metadata under "duckdb_columns" (a JSON list of [name, type]), so
+    the table can be recreated with exactly the same types.
+
+    Returns:
+        {table_name: table}
+    """
+    with duckdb.connect(path, read_only=True) as source:
+        columns = [
+            [row[0], row[1]]
+            for row in source.execute(f"DESCRIBE {table_name}").fetchall()
+        ]
+        table = (
+            source.execute(f"SELECT * FROM {table_name}")
+            .fetch_record_batch()
+            .read_all()
+        )
+    return {
+        table_name: table.replace_schema_metadata(
+            {"duckdb_columns": json.dumps(columns)}
+        )
+    }
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+from typing import Any, Callable, Optional
+
+import duckdb
+
+from app.internal.metrics import Counter, register_gauge_callback, registry
+from app.internal.request_context import RequestContext
+from app.internal.responses import dumps
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Queued jobs run in this order; jobs of the same priority run first come, first served
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+JOBS = registry.register(
+    Counter(
+        "flockmtl_jobs_total",
+        "Background jobs by kind, priority and final status",
+        labelnames=("kind", "priority", "status"),
+    )
+)
+
+
+class JobQueue:
+    """
+    Durable queue of long-running pipeline work, run by a pool of worker threads.
+
+    Jobs are submitted with a kind (whose handler does the work), a JSON
+    payload and a priority, and are recorded in a dedicated DuckDB file along
+    with their status, timestamps and (once finished) their result or error.
+    Interactive jobs are picked before batch jobs. Jobs still queued when the
+    process stopped are queued again on start; jobs that were running are
+    marked failed. Finished jobs are deleted after the retention period.
+
+    A queued job is cancelled before it starts; a running job is cancelled
+    through its request context, which interrupts its DuckDB statement.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        workers: Optional[int] = None,
+        retention_seconds: Optional[float] = None,
+    ):
+        self.path = path or os.getenv(
+            "JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "flockmtl_jobs.db")
+        )
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.retention_seconds = retention_seconds or (
+            float(os.getenv("JOB_RETENTION_HOURS", "24")) * 3600
+        )
+
+        self._handlers: dict[str, Callable[[dict, RequestContext], Any]] = {}
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = 0
+        self._threads: list[threading.Thread] = []
+        self._running: dict[str, RequestContext] = {}
+        self._last_prune = 0.0
+
+    def register(self, kind: str, handler: Callable[[dict, RequestContext], Any]):
+        """
+        Register the handler running jobs of a kind.
+
+        Args:
+            kind: Job kind, as passed to submit()
+            handler: Called with the job's payload and request context; its
+                return value (JSON serializable) is the job's result
+        """
+        self._handlers[kind] = handler
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        try:
+            self._conn = duckdb.connect(self.path)
+        except duckdb.Error as e:
+            # Another process may hold the file; keep jobs in memory instead
+            logger.warning(f"Could not open job store at {self.path}: {e}")
+            self._conn = duckdb.connect()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id VARCHAR,
+                kind VARCHAR,
+                priority VARCHAR,
+                status VARCHAR,
+                submitted_at DOUBLE,
+                started_at DOUBLE,
+                finished_at DOUBLE,
+                payload VARCHAR,
+                result VARCHAR,
+                error VARCHAR
+            )
+            """
+        )
+        return self._conn
+
+    def start(self):
+        """Start the workers, requeueing the jobs left queued by a previous process."""
+        if len(self._threads) == self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._recover(self._connect())
+            for number in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work_loop, name=f"job-worker-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _recover(self, conn):
+        """Requeue the jobs a previous process left queued; fail the running ones."""
+        conn.execute(
+            """
+            UPDATE jobs SET status = 'failed', finished_at = ?,
+                error = 'Interrupted by a server restart'
+            WHERE status = 'running'
+            """,
+            [time.time()],
+        )
+        queued = conn.execute(
+            """
+            SELECT job_id, priority FROM jobs
+            WHERE status = 'queued' ORDER BY submitted_at
+            """
+        ).fetchall()
+        for job_id, priority in queued:
+            self._enqueue(job_id, priority)
+        if queued:
+            logger.info("Requeued %d job(s) from the job store", len(queued))
+
+    def _enqueue(self, job_id: str, priority: str):
+        self._sequence += 1
+        self._queue.put((PRIORITIES.get(priority, 0), self._sequence, job_id))
+
+    def submit(self, kind: str, payload: dict, priority: str = "interactive") -> dict:
+        """
+        Queue a job.
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable arguments of the job
+            priority: "interactive" or "batch"
+
+        Returns:
+            The job's status entry
+
+        Raises:
+            ValueError: If the kind or priority is unknown
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown job priority: {priority}")
+        self.start()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if now - self._last_prune > 60:
+                self._prune(conn, now)
+                self._last_prune = now
+            conn.execute(
+                """
+                INSERT INTO jobs VALUES (?, ?, ?, 'queued', ?, NULL, NULL, ?, NULL, NULL)
+                """,
+                [job_id, kind, priority, now, json.dumps(payload)],
+            )
+            self._enqueue(job_id, priority)
+        logger.info("Queued %s job %s (%s)", kind, job_id, priority)
+        return self.get(job_id)
+
+    def _work_loop(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job {job_id} could not be run: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        context = RequestContext(request_id=job_id, endpoint="/jobs")
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                """
+                UPDATE jobs SET status = 'running', started_at = ?
+                WHERE job_id = ? AND status = 'queued'
+                RETURNING kind, priority, payload
+                """,
+                [time.time(), job_id],
+            ).fetchone()
+            if row is None:
+                # Cancelled (or deleted) while it was queued
+                return
+            self._running[job_id] = context
+        kind, priority, payload = row
+
+        try:
+            result = self._handlers[kind](json.loads(payload), context)
+            result, error, status = dumps(result).decode(), None, "done"
+        except Exception as e:
+            logger.warning("Job %s failed: %s", job_id, e)
+            result, error, status = None, str(e), "failed"
+
+        context.finish()
+        with self._lock:
+            del self._running[job_id]
+            if context.cancelled:
+                result, error, status = None, "Job was cancelled", "cancelled"
+            self._connect().execute(
+                """
+                UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?
+                WHERE job_id = ?
+                """,
+                [status, time.time(), result, error, job_id],
+            )
+        JOBS.inc(kind=kind, priority=priority, status=status)
+        logger.info("Job %s finished: %s", job_id, status)
+
+    def get(self, job_id: str, include_result: bool = False) -> Optional[dict]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: Job ID returned by submit()
+            include_result: Also return the result of a finished job
+
+        Returns:
+            The job's kind, priority, status, timestamps, error and (if
+            requested) result, or None if it is unknown or has expired
+        """
+        columns = "job_id, kind, priority, status, submitted_at, started_at, finished_at, error"
+        if include_result:
+            columns += ", result"
+        with self._lock:
+            cursor = self._connect().execute(
+                f"SELECT {columns} FROM jobs WHERE job_id = ?", [job_id]
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([column[0] for column in cursor.description], row))
+            if job["status"] == "queued":
+                job["queue_position"] = self._queue_position(job_id)
+        if job.get("result") is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def _queue_position(self, job_id: str) -> Optional[int]:
+        with self._queue.mutex:
+            waiting = sorted(self._queue.queue)
+        for position, (_, _, queued_id) in enumerate(waiting):
+            if queued_id == job_id:
+                return position
+        return None
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """
+        Cancel a queued or running job.
+
+        Returns:
+            The job's status entry after cancelling, or None if it is unknown
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'cancelled', finished_at = ?,
+                    error = 'Job was cancelled'
+                WHERE job_id = ? AND status = 'queued'
+                """,
+                [time.time(), job_id],
+            )
+            context = self._running.get(job_id)
+        if context is not None:
+            # The worker records the cancellation once the statement stops
+            context.cancel()
+        return self.get(job_id)
+
+    def _prune(self, conn, now: float):
+        conn.execute(
+            """
+            DELETE FROM jobs
+            WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?
+            """,
+            [now - self.retention_seconds],
+        )
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            counts = dict(
+                self._connect()
+                .execute("SELECT status, count(*) FROM jobs GROUP BY status")
+                .fetchall()
+            )
+            running = len(self._running)
+        return {
+            "path": self.path,
+            "workers": self.workers,
+            "retention_seconds": self.retention_seconds,
+            "running": running,
+            "queued": counts.get("queued", 0),
+            "jobs_by_status": counts,
+        }
+
+
+# Global job queue; handlers are registered with the pipeline manager
+job_queue = JobQueue()
+
+register_gauge_callback(
+    "flockmtl_jobs_queued",
+    "Number of background jobs waiting for a worker",
+    lambda: job_queue.get_stats()["queued"],
+)
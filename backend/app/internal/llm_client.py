@@ -0,0 +1,572 @@
+import os
+import time
+import random
+import logging
+import threading
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Optional
+
+import httpx
+import openai
+
+from app.internal.usage import UsageTracker, extract_usage, usage_tracker
+from app.internal.metrics import LLM_REQUEST_DURATION, register_gauge_callback
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+
+# HTTP status codes that are worth retrying: timeouts, conflicts, rate limits
+# and server-side failures. Anything else (400, 401, 404, ...) fails fast.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+# Hedging threads per client when the rate limiter caps no concurrency
+UNLIMITED_HEDGE_WORKERS = 256
+
+
+class LLMError(Exception):
+    """Raised when an LLM call fails permanently or returns an unusable response."""
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _request_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        float(os.getenv("LLM_REQUEST_TIMEOUT", "120")),
+        connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+    )
+
+
+def build_http_client() -> httpx.Client:
+    """
+    Build the shared httpx connection pool used for OpenAI requests.
+
+    Connection limits, keep-alive expiry, HTTP/2 and timeouts are read from
+    the environment. HTTP/2 falls back to HTTP/1.1 when 'h2' is missing.
+
+    Returns:
+        Configured httpx client
+    """
+    http2 = _env_bool("LLM_HTTP2", True)
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+        http2 = False
+
+    return httpx.Client(
+        http2=http2,
+        timeout=_request_timeout(),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64")),
+            max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16")),
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120")),
+        ),
+    )
+
+
+def build_openai_client(
+    http_client: httpx.Client,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> openai.OpenAI:
+    """
+    Build an OpenAI client on top of an explicit httpx pool.
+
+    Retries are disabled on the OpenAI client itself because LLMClient
+    implements them.
+
+    Args:
+        http_client: Shared httpx connection pool
+        api_key: API key, defaults to OPENAI_API_KEY
+        base_url: API base URL, defaults to OPENAI_BASE_URL (useful to point
+            the app at a local stand-in server for tests and benchmarks)
+
+    Returns:
+        Configured OpenAI client
+    """
+    return openai.OpenAI(
+        # A placeholder key keeps the app usable against keyless stand-in
+        # servers; real OpenAI calls then fail fast with a 401
+        api_key=api_key or os.getenv("OPENAI_API_KEY") or "not-configured",
+        base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+        http_client=http_client,
+        timeout=_request_timeout(),
+        max_retries=0,
+    )
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether an OpenAI error is transient and worth retrying.
+
+    Args:
+        error: Exception raised by the OpenAI client
+
+    Returns:
+        True for connection errors, timeouts, 429 and 5xx responses
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the Retry-After hint from a rate limit response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        value = response.headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Global limit on LLM traffic: a cap on concurrent requests plus a token
+    bucket for requests per minute. Either limit can be disabled with 0.
+    """
+
+    def __init__(self, max_concurrent: int = 0, requests_per_minute: float = 0):
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self._slots = (
+            threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        )
+        self._lock = threading.Lock()
+        self._capacity = max(1.0, requests_per_minute / 60.0)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        if self._slots is not None:
+            self._slots.acquire()
+        if self.requests_per_minute > 0:
+            self._take_token()
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        """Mark a request as finished."""
+        with self._lock:
+            self._in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def in_flight(self) -> int:
+        """Number of LLM requests currently being sent."""
+        with self._lock:
+            return self._in_flight
+
+    def _take_token(self):
+        rate = self.requests_per_minute / 60.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._refilled_at) * rate
+                )
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / rate
+            time.sleep(wait_seconds)
+
+
+class LLMClient:
+    """
+    Shared wrapper around OpenAI chat completions.
+
+    Every LLM call made by the pipeline goes through this class, which adds:
+    1. Retries with jittered exponential backoff on 429/5xx/connection errors
+    2. An overall retry time budget per call
+    3. Optional request hedging: when a call is slower than the observed
+       latency quantile (p95 by default), a second identical request is sent
+       and whichever answers first wins
+    4. A global rate limit shared by every caller (interactive and batch)
+    5. Response validation so callers get text or an LLMError, never None
+    6. Token, latency and cost accounting per endpoint and stage
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        http_client: Optional[httpx.Client] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        retry_budget_seconds: Optional[float] = None,
+        hedge_enabled: Optional[bool] = None,
+        hedge_quantile: Optional[float] = None,
+        hedge_min_samples: Optional[int] = None,
+        hedge_min_delay: Optional[float] = None,
+        hedge_budget: Optional[float] = None,
+        cancel_hedge_loser: Optional[bool] = None,
+        request_timeout: Optional[float] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        usage: Optional[UsageTracker] = None,
+        latency_window: int = 500,
+    ):
+        # An injected client (e.g. a stand-in for tests) is used as-is;
+        # otherwise an OpenAI client is built on the shared httpx pool
+        if client is None:
+            http_client = http_client or build_http_client()
+            client = build_openai_client(http_client)
+        self.client = client
+        self.http_client = http_client
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        )
+        self.backoff_base = (
+            backoff_base
+            if backoff_base is not None
+            else float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+        )
+        self.backoff_max = (
+            backoff_max
+            if backoff_max is not None
+            else float(os.getenv("LLM_BACKOFF_MAX", "8.0"))
+        )
+        self.retry_budget_seconds = (
+            retry_budget_seconds
+            if retry_budget_seconds is not None
+            else float(os.getenv("LLM_RETRY_BUDGET_SECONDS", "60"))
+        )
+        self.hedge_enabled = (
+            hedge_enabled
+            if hedge_enabled is not None
+            else _env_bool("LLM_HEDGE_ENABLED", False)
+        )
+        self.hedge_quantile = (
+            hedge_quantile
+            if hedge_quantile is not None
+            else float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        )
+        self.hedge_min_samples = (
+            hedge_min_samples
+            if hedge_min_samples is not None
+            else int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        )
+        self.hedge_min_delay = (
+            hedge_min_delay
+            if hedge_min_delay is not None
+            else float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+        )
+        # Maximum fraction of calls allowed to send a hedged request
+        self.hedge_budget = (
+            hedge_budget
+            if hedge_budget is not None
+            else float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+        )
+        # Only a losing attempt that has not started yet is cancelled; one
+        # already in flight runs to completion, keeping its thread and its
+        # rate limiter slot, and its result is dropped
+        self.cancel_hedge_loser = (
+            cancel_hedge_loser
+            if cancel_hedge_loser is not None
+            else _env_bool("LLM_CANCEL_HEDGE_LOSER", True)
+        )
+        # Per-attempt timeout; hedging and retries bound the total wait
+        self.request_timeout = (
+            request_timeout
+            if request_timeout is not None
+            else float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+        )
+
+        self.rate_limiter = rate_limiter or RateLimiter(
+            max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16")),
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+        )
+
+        # Hedged calls run their attempts here, two threads (a primary and
+        # its hedge) per rate limiter slot, so the pool never caps
+        # concurrency below the rate limiter
+        max_concurrent = self.rate_limiter.max_concurrent
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=2 * max_concurrent
+            if max_concurrent > 0
+            else UNLIMITED_HEDGE_WORKERS,
+            thread_name_prefix="llm-hedge",
+        )
+
+        self.usage = usage or usage_tracker
+
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._total_calls = 0
+        self._hedged_calls = 0
+
+    # Public API
+    def complete(
+        self,
+        messages: list[dict],
+        model: str = DEFAULT_MODEL,
+        stage: str = "unspecified",
+        context=None,
+        **kwargs,
+    ):
+        """
+        Create a chat completion with retries and optional hedging.
+
+        Args:
+            messages: Chat messages to send
+            model: Model identifier
+            stage: Pipeline stage making the call, used for usage accounting
+            context: RequestContext to attribute the call to, if any
+            **kwargs: Extra arguments forwarded to chat.completions.create
+
+        Returns:
+            The raw chat completion response
+
+        Raises:
+            LLMError: If the call fails permanently or the retry budget runs out
+        """
+        kwargs.setdefault("timeout", self.request_timeout)
+        start_time = time.monotonic()
+        try:
+            response = self._complete_with_retries(messages, model, kwargs)
+        except LLMError:
+            latency = time.monotonic() - start_time
+            LLM_REQUEST_DURATION.observe(latency, stage=stage, model=model)
+            call = self.usage.record(stage, model, latency, error=True)
+            if context is not None:
+                context.record_llm_call(call)
+            raise
+
+        latency = time.monotonic() - start_time
+        LLM_REQUEST_DURATION.observe(latency, stage=stage, model=model)
+        call = self.usage.record(stage, model, latency, **extract_usage(response))
+        if context is not None:
+            context.record_llm_call(call)
+        return response
+
+    def _complete_with_retries(self, messages: list[dict], model: str, kwargs: dict):
+        deadline = time.monotonic() + self.retry_budget_seconds
+        attempt = 0
+
+        while True:
+            try:
+                return self._call_with_hedge(messages, model, kwargs)
+            except Exception as e:
+                attempt += 1
+                if not is_retryable_error(e):
+                    raise LLMError(f"LLM request failed: {e}") from e
+                if attempt > self.max_retries:
+                    raise LLMError(
+                        f"LLM request failed after {attempt} attempt(s): {e}"
+                    ) from e
+
+                delay = self._backoff_delay(attempt, e)
+                if time.monotonic() + delay > deadline:
+                    raise LLMError(
+                        f"LLM retry budget of {self.retry_budget_seconds:.0f}s exhausted: {e}"
+                    ) from e
+
+                logger.warning(
+                    f"Transient LLM error ({type(e).__name__}), retrying in "
+                    f"{delay:.2f}s (attempt {attempt}/{self.max_retries})"
+                )
+                time.sleep(delay)
+
+    def complete_text(
+        self,
+        messages: list[dict],
+        model: str = DEFAULT_MODEL,
+        stage: str = "unspecified",
+        context=None,
+        **kwargs,
+    ) -> str:
+        """
+        Create a chat completion and return the stripped message content.
+
+        Raises:
+            LLMError: If the call fails or the response has no usable content
+        """
+        return self.extract_content(
+            self.complete(messages, model, stage, context, **kwargs)
+        )
+
+    @staticmethod
+    def extract_content(response) -> str:
+        """
+        Validate a chat completion response and return its message content.
+
+        Raises:
+            LLMError: If the response, choices, message or content is missing
+        """
+        if response is None:
+            raise LLMError("OpenAI API returned None response")
+        if not getattr(response, "choices", None):
+            raise LLMError("OpenAI API response has no choices")
+
+        message = getattr(response.choices[0], "message", None)
+        if message is None:
+            raise LLMError("OpenAI API response choice has no message")
+
+        content = getattr(message, "content", None)
+        if content is None:
+            raise LLMError("OpenAI API response message has no content")
+
+        content = content.strip()
+        if not content:
+            raise LLMError("OpenAI API returned empty content")
+        return content
+
+    def warm_up(self, connections: Optional[int] = None) -> int:
+        """
+        Open connections to the API ahead of the first real request.
+
+        Sends lightweight GET requests to the API base URL so the TCP and TLS
+        handshakes (and HTTP/2 negotiation) happen at startup; the connections
+        then stay in the keep-alive pool. Any HTTP status counts as success.
+
+        Args:
+            connections: Number of parallel connections to open
+
+        Returns:
+            Number of connections that were established
+        """
+        base_url = getattr(self.client, "base_url", None)
+        if self.http_client is None or base_url is None:
+            logger.debug("LLM client has no httpx pool to warm up")
+            return 0
+
+        if connections is None:
+            connections = int(os.getenv("LLM_HTTP_PREWARM_CONNECTIONS", "2"))
+
+        def _open_connection() -> bool:
+            try:
+                self.http_client.get(str(base_url), timeout=self.request_timeout)
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(f"LLM connection warm-up failed: {e}")
+                return False
+
+        if connections <= 0:
+            return 0
+        # Own threads, so warming up never takes the hedging pool's
+        with ThreadPoolExecutor(
+            max_workers=connections, thread_name_prefix="llm-warm-up"
+        ) as executor:
+            futures = [executor.submit(_open_connection) for _ in range(connections)]
+            established = sum(1 for future in futures if future.result())
+        logger.info(f"Pre-warmed {established}/{connections} LLM API connection(s)")
+        return established
+
+    def close(self):
+        """Close the underlying HTTP connection pool."""
+        if self.http_client is not None:
+            self.http_client.close()
+
+    def get_stats(self) -> dict:
+        """Return retry/hedging statistics for debugging."""
+        with self._lock:
+            return {
+                "total_calls": self._total_calls,
+                "in_flight": self.rate_limiter.in_flight(),
+                "hedged_calls": self._hedged_calls,
+                "latency_samples": len(self._latencies),
+                "hedge_delay_seconds": self._hedge_delay_locked(),
+            }
+
+    # Internal helpers
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when present."""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        delay = random.uniform(0, ceiling)
+
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _timed_call(self, messages: list[dict], model: str, kwargs: dict):
+        self.rate_limiter.acquire()
+        try:
+            start_time = time.monotonic()
+            response = self.client.chat.completions.create(
+                model=model, messages=messages, **kwargs
+            )
+            latency = time.monotonic() - start_time
+        finally:
+            self.rate_limiter.release()
+
+        with self._lock:
+            self._latencies.append(latency)
+        return response
+
+    def _hedge_delay_locked(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))
+        return max(self.hedge_min_delay, ordered[index])
+
+    def _reserve_hedge(self) -> bool:
+        """Check the hedge budget and count a hedged call if allowed."""
+        with self._lock:
+            if self._hedged_calls + 1 > self.hedge_budget * max(1, self._total_calls):
+                return False
+            self._hedged_calls += 1
+            return True
+
+    def _call_with_hedge(self, messages: list[dict], model: str, kwargs: dict):
+        with self._lock:
+            self._total_calls += 1
+            hedge_delay = self._hedge_delay_locked()
+
+        if hedge_delay is None:
+            return self._timed_call(messages, model, kwargs)
+
+        primary = self._hedge_executor.submit(self._timed_call, messages, model, kwargs)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done or not self._reserve_hedge():
+            return primary.result()
+
+        logger.info(
+            f"LLM call exceeded {hedge_delay:.2f}s hedge delay, sending hedged request"
+        )
+        hedge = self._hedge_executor.submit(self._timed_call, messages, model, kwargs)
+
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if self.cancel_hedge_loser:
+                        # Not-yet-started losers are cancelled outright; a loser
+                        # already in flight is abandoned and its result dropped.
+                        for loser in pending:
+                            loser.cancel()
+                    return future.result()
+                if first_error is None:
+                    first_error = error
+
+        raise first_error
+
+
+# Shared client used by the pipeline manager
+llm_client = LLMClient()
+
+register_gauge_callback(
+    "flockmtl_llm_requests_in_flight",
+    "Number of LLM API requests currently being sent",
+    lambda: llm_client.rate_limiter.in_flight(),
+)
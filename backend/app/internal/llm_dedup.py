@@ -0,0 +1,212 @@
+import os
+import threading
+import logging
+
+from app.internal.llm_probe import count_llm_calls
+from app.internal.metrics import Counter, registry
+from app.internal.sql_rewrite import (
+    LLMCall,
+    apply_edits,
+    call_row_source,
+    find_llm_calls,
+    preserve_column_names,
+    tokenize,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DEDUP_MODEL_CALLS = registry.register(
+    Counter(
+        "flockmtl_llm_dedup_model_calls_total",
+        "Model calls of deduplicated llm_* calls: rows before, distinct inputs after",
+        labelnames=("function", "stage"),
+    )
+)
+
+
+class DistinctInputRewriter:
+    """
+    Evaluate FlockMTL scalar calls once per distinct input.
+
+    FlockMTL calls the model for every row, even when the context columns
+    repeat the same few values (categories, types, risk profiles). For each
+    call whose inputs have far fewer distinct values than rows, this rewrite
+    computes the call over the SELECT DISTINCT inputs in a subquery and looks
+    the result up for every row, which DuckDB plans as a join.
+    """
+
+    def __init__(self, max_ratio: float, min_rows: int, enabled: bool = True):
+        # Only rewrite when distinct inputs / rows is at most this
+        self.max_ratio = max_ratio
+        self.min_rows = min_rows
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"rewritten_calls": 0, "rows": 0, "distinct_inputs": 0}
+
+    def rewrite(self, cursor, query: str) -> tuple[str, list[dict]]:
+        """
+        Rewrite a query's low-cardinality LLM calls to run on distinct inputs.
+
+        Counting the rows and distinct inputs of each call runs the cheap
+        part of the query but never calls a model. Rows are counted with a
+        dry run of the query (see llm_probe) where possible, so a call is
+        only rewritten when it really is evaluated on more rows than it has
+        distinct inputs.
+
+        Args:
+            cursor: DuckDB cursor the query will run on
+            query: Read-only SQL query
+
+        Returns:
+            The query to run and a report entry per analyzed call
+        """
+        if not self.enabled or "llm_" not in query.lower():
+            return query, []
+        original = query
+        query = query.strip().rstrip(";")
+        try:
+            tokens = tokenize(query)
+            calls = find_llm_calls(query, tokens)
+        except ValueError as e:
+            logger.debug("Distinct-input rewrite skipped: %s", e)
+            return original, []
+        sources = [
+            call_row_source(query, tokens, call)
+            if call.scalar and call.parsed and call.context and not call.nested
+            else None
+            for call in calls
+        ]
+        if not any(sources):
+            return original, []
+        try:
+            # DuckDB may evaluate a call on fewer rows than its FROM and WHERE
+            # produce, e.g. when an outer filter is pushed into a CTE
+            model_calls = count_llm_calls(cursor, query)
+        except Exception as e:
+            logger.debug("Could not count model calls: %s", e)
+            model_calls = None
+
+        edits = []
+        report = []
+        for number, (call, source) in enumerate(zip(calls, sources)):
+            if source is None:
+                continue
+            blocks, conditions = source
+            from_sql = apply_edits(query, edits, span=blocks[0].clauses["from"])
+            where_sql = " AND ".join(
+                f"({apply_edits(query, edits, span=span)})" for span in conditions
+            )
+            # CTEs the FROM clause may refer to, for counting outside the query
+            with_span = blocks[0].clauses.get("with") or blocks[-1].clauses.get("with")
+            with_sql = apply_edits(query, edits, span=with_span) if with_span else None
+            try:
+                rows, distinct = self._count_inputs(
+                    cursor, call, from_sql, where_sql, with_sql
+                )
+                if model_calls is not None:
+                    rows = model_calls[number]
+                entry = {
+                    "rule": "distinct_inputs",
+                    **call.to_dict(),
+                    "rows": rows,
+                    "distinct_inputs": distinct,
+                    "applied": False,
+                }
+                if rows >= self.min_rows and distinct <= rows * self.max_ratio:
+                    edit = (
+                        *call.span,
+                        _lookup_expression(query, call, number, from_sql, where_sql),
+                    )
+                    # Bind with the edit to make sure the subquery resolves
+                    preserve_column_names(
+                        cursor, query, apply_edits(query, [*edits, edit])
+                    )
+                    edits.append(edit)
+                    entry.update(applied=True, model_calls_saved=rows - distinct)
+            except Exception as e:
+                logger.warning(
+                    "Distinct-input rewrite skipped for %s: %s", call.function, e
+                )
+                continue
+            report.append(entry)
+            if entry["applied"]:
+                DEDUP_MODEL_CALLS.inc(rows, function=call.function, stage="rows")
+                DEDUP_MODEL_CALLS.inc(
+                    distinct, function=call.function, stage="distinct"
+                )
+                with self._lock:
+                    self._stats["rewritten_calls"] += 1
+                    self._stats["rows"] += rows
+                    self._stats["distinct_inputs"] += distinct
+
+        if not edits:
+            return original, report
+        return preserve_column_names(cursor, query, apply_edits(query, edits)), report
+
+    def _count_inputs(
+        self, cursor, call: LLMCall, from_sql: str, where_sql: str, with_sql: str
+    ) -> tuple[int, int]:
+        """Count the rows a call is evaluated on and their distinct inputs."""
+        values = ", ".join(f"({column.data})" for column in call.context)
+        count_sql = f"SELECT count(*), count(DISTINCT row({values})) FROM {from_sql}"
+        if where_sql:
+            count_sql += f" WHERE {where_sql}"
+        if with_sql:
+            count_sql = f"WITH {with_sql} {count_sql}"
+        rows, distinct = cursor.execute(count_sql).fetchone()
+        return rows, distinct
+
+    def get_stats(self) -> dict:
+        """Get rewrite statistics."""
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "max_ratio": self.max_ratio,
+                "min_rows": self.min_rows,
+            }
+
+
+def _lookup_expression(
+    query: str, call: LLMCall, number: int, from_sql: str, where_sql: str
+) -> str:
+    """
+    Replacement for a call: its output looked up by the row's context values.
+
+    The call itself moves into a subquery over the distinct context values
+    of the same rows, with the context columns reading the distinct values.
+    """
+    alias = f"__llm_dedup_{number}"
+    keys = [f"__llm_key_{i}" for i in range(len(call.context))]
+    call_sql = apply_edits(
+        query,
+        [(*column.span, key) for column, key in zip(call.context, keys)],
+        span=call.span,
+    )
+    inputs_sql = (
+        "SELECT DISTINCT "
+        + ", ".join(
+            f"{column.data} AS {key}" for column, key in zip(call.context, keys)
+        )
+        + f" FROM {from_sql}"
+    )
+    if where_sql:
+        inputs_sql += f" WHERE {where_sql}"
+    matches = " AND ".join(
+        f"{alias}.{key} IS NOT DISTINCT FROM ({column.data})"
+        for column, key in zip(call.context, keys)
+    )
+    return (
+        f"(SELECT {alias}.__llm_output FROM (SELECT {', '.join(keys)}, "
+        f"{call_sql} AS __llm_output FROM ({inputs_sql}) __llm_inputs) {alias} "
+        f"WHERE {matches})"
+    )
+
+
+# Global rewriter used for every read-only FlockMTL query
+distinct_input_rewriter = DistinctInputRewriter(
+    max_ratio=float(os.getenv("LLM_DEDUP_MAX_RATIO", "0.5")),
+    min_rows=int(os.getenv("LLM_DEDUP_MIN_ROWS", "2")),
+    enabled=os.getenv("LLM_DEDUP_ENABLED", "true").lower() == "true",
+)
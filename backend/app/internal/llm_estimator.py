@@ -0,0 +1,383 @@
+import os
+import re
+import json
+import math
+import threading
+import logging
+from typing import Optional
+
+from app.internal.llm_probe import count_llm_calls
+from app.internal.metrics import Counter, registry
+from app.internal.sql_rewrite import (
+    LLMCall,
+    call_row_source,
+    find_llm_calls,
+    sample_tables,
+    tokenize,
+)
+from app.internal.usage import usage_tracker
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# OpenAI tokenizers average about four characters of English text per token
+_CHARS_PER_TOKEN = 4
+
+_BATCH_SIZE = re.compile(r"'batch_size'\s*:\s*(\d+)", re.IGNORECASE)
+
+# Seed of the bernoulli sample, so that a sampled query reads the same rows
+# (and hits the result cache and memo) when it is run again
+_SAMPLE_SEED = 42
+
+BUDGET_CHECKS = registry.register(
+    Counter(
+        "flockmtl_llm_budget_checks_total",
+        "FlockMTL queries checked against the LLM budget, by decision",
+        labelnames=("decision",),
+    )
+)
+
+
+class LLMBudgetExceeded(Exception):
+    """Raised when a query would call the model more than the budget allows."""
+
+    def __init__(self, message: str, estimate: dict):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+class LLMCostEstimator:
+    """
+    Predict the model calls, tokens, cost and time of a FlockMTL query.
+
+    EXPLAIN gives, for free, DuckDB's estimated cardinality of the rows
+    flowing into the operators that evaluate llm_* calls. When the plan is
+    small enough, a dry run (see llm_probe) counts the exact rows each
+    scalar call is evaluated on instead; otherwise a COUNT probe over the
+    call's FROM and WHERE is used when those are known up front. Tokens are
+    estimated from the prompt and the average length of the context values
+    (with approx_count_distinct reporting how repetitive they are), cost
+    from the usage tracker's prices and time from the number of requests.
+
+    Memo hits are not subtracted, so the estimate is an upper bound.
+    """
+
+    def __init__(
+        self,
+        max_model_calls: int,
+        max_cost_usd: Optional[float],
+        action: str,
+        dry_run_max_rows: int,
+        output_tokens: int,
+        seconds_per_request: float,
+    ):
+        # Budget per query; 0 (or None for the cost) means unlimited
+        self.max_model_calls = max_model_calls
+        self.max_cost_usd = max_cost_usd
+        # "reject" or "sample" queries over the budget
+        self.action = action
+        # Largest estimated plan cardinality that is still counted exactly
+        self.dry_run_max_rows = dry_run_max_rows
+        # Completion tokens per llm_complete row (llm_filter answers one)
+        self.output_tokens = output_tokens
+        self.seconds_per_request = seconds_per_request
+        self._lock = threading.Lock()
+        self._stats = {"estimated": 0, "rejected": 0, "sampled": 0}
+
+    def estimate(self, cursor, query: str) -> Optional[dict]:
+        """
+        Estimate what running a query would cost in model calls.
+
+        Nothing calls a model: EXPLAIN and the probes only run the SQL around
+        the llm_* calls.
+
+        Args:
+            cursor: DuckDB cursor to analyze the query on
+            query: Read-only SQL query, as it will run (after rewrites)
+
+        Returns:
+            Totals and a per-call breakdown, or None if the query calls no
+            llm_* function
+        """
+        query = query.strip().rstrip(";")
+        tokens = tokenize(query)
+        calls = find_llm_calls(query, tokens)
+        if not calls:
+            return None
+
+        plan_rows, explain_rows = self._explain(cursor, query, calls)
+        counts = None
+        if plan_rows <= self.dry_run_max_rows:
+            try:
+                counts = count_llm_calls(cursor, query)
+            except Exception as e:
+                logger.debug("Dry run for the estimate failed: %s", e)
+
+        entries = []
+        for number, call in enumerate(calls):
+            rows, method = explain_rows[number], "explain"
+            if counts is not None and counts[number] is not None:
+                rows, method = counts[number], "dry_run"
+            inputs = self._input_stats(cursor, query, tokens, call)
+            if inputs is not None and method == "explain":
+                rows, method = inputs["rows"], "count"
+            entries.append(self._call_estimate(call, rows, method, inputs))
+
+        estimate = {
+            "model_calls": sum(entry["model_calls"] for entry in entries),
+            "requests": sum(entry["requests"] for entry in entries),
+            "input_tokens": sum(entry["input_tokens"] for entry in entries),
+            "output_tokens": sum(entry["output_tokens"] for entry in entries),
+            "estimated_cost_usd": round(
+                sum(entry["estimated_cost_usd"] for entry in entries), 6
+            ),
+            "estimated_seconds": round(
+                sum(entry["requests"] for entry in entries) * self.seconds_per_request,
+                1,
+            ),
+            "plan_rows": plan_rows,
+            "calls": entries,
+        }
+        estimate["within_budget"] = self._within_budget(estimate)
+        with self._lock:
+            self._stats["estimated"] += 1
+        return estimate
+
+    def check(self, cursor, query: str) -> tuple[str, Optional[dict]]:
+        """
+        Estimate a query and keep it within the budget.
+
+        A query over the budget is rejected, or with the "sample" action run
+        on a bernoulli sample of its tables small enough to fit. A failed
+        estimate never blocks the query.
+
+        Args:
+            cursor: DuckDB cursor the query will run on
+            query: Read-only SQL query, as it will run (after rewrites)
+
+        Returns:
+            The query to run and its estimate (None if it could not be made)
+
+        Raises:
+            LLMBudgetExceeded: If the query is over the budget and cannot be
+                sampled to fit
+        """
+        try:
+            estimate = self.estimate(cursor, query)
+        except Exception as e:
+            logger.warning("LLM cost estimate failed: %s", e)
+            return query, None
+        if estimate is None or estimate["within_budget"]:
+            if estimate is not None:
+                BUDGET_CHECKS.inc(decision="accepted")
+            return query, estimate
+
+        if self.action == "sample":
+            sampled = self._sample(cursor, query, estimate)
+            if sampled is not None:
+                BUDGET_CHECKS.inc(decision="sampled")
+                with self._lock:
+                    self._stats["sampled"] += 1
+                return sampled
+
+        BUDGET_CHECKS.inc(decision="rejected")
+        with self._lock:
+            self._stats["rejected"] += 1
+        limits = []
+        if self.max_model_calls:
+            limits.append(f"{self.max_model_calls:,} model calls")
+        if self.max_cost_usd:
+            limits.append(f"${self.max_cost_usd:.2f}")
+        raise LLMBudgetExceeded(
+            f"Query would make about {estimate['model_calls']:,} LLM calls "
+            f"(~${estimate['estimated_cost_usd']:.2f}, "
+            f"~{estimate['estimated_seconds']:.0f}s), over the budget of "
+            f"{' / '.join(limits)}. Add filters or a LIMIT to the query.",
+            estimate,
+        )
+
+    def _within_budget(self, estimate: dict) -> bool:
+        if self.max_model_calls and estimate["model_calls"] > self.max_model_calls:
+            return False
+        if self.max_cost_usd and estimate["estimated_cost_usd"] > self.max_cost_usd:
+            return False
+        return True
+
+    def _budget_ratio(self, estimate: dict) -> float:
+        """Fraction of the estimate that fits in the budget."""
+        ratios = [1.0]
+        if self.max_model_calls and estimate["model_calls"]:
+            ratios.append(self.max_model_calls / estimate["model_calls"])
+        if self.max_cost_usd and estimate["estimated_cost_usd"]:
+            ratios.append(self.max_cost_usd / estimate["estimated_cost_usd"])
+        return min(ratios)
+
+    def _sample(self, cursor, query: str, estimate: dict) -> Optional[tuple[str, dict]]:
+        """
+        Sample a query's tables until its estimate fits in the budget.
+
+        Joins of sampled tables shrink faster than the sampling rate, so the
+        rate is re-estimated from the sampled query a few times.
+        """
+        percent = 100.0
+        current = estimate
+        for _ in range(4):
+            # Aim a little below the budget, estimates of samples vary
+            percent *= self._budget_ratio(current) * 0.9
+            if percent < 0.001:
+                return None
+            sampled = sample_tables(
+                query,
+                f"TABLESAMPLE {percent:.4g} PERCENT (bernoulli, {_SAMPLE_SEED})",
+            )
+            if sampled is None:
+                return None
+            current = self.estimate(cursor, sampled)
+            if current is None:
+                return None
+            if current["within_budget"]:
+                break
+        else:
+            return None
+        current["sampled"] = {
+            "percent": float(f"{percent:.4g}"),
+            "unsampled_model_calls": estimate["model_calls"],
+            "unsampled_cost_usd": estimate["estimated_cost_usd"],
+        }
+        return sampled, current
+
+    def _explain(self, cursor, query: str, calls: list[LLMCall]):
+        """
+        Read DuckDB's cardinality estimates for a query.
+
+        Returns:
+            The largest estimated cardinality of any operator, and for each
+            call the estimated rows flowing into the operators evaluating
+            its function
+        """
+        rows = cursor.execute(f"EXPLAIN (FORMAT json) {query}").fetchall()
+        operators = []
+        stack = json.loads(rows[0][1])
+        while stack:
+            node = stack.pop()
+            stack.extend(node.get("children", []))
+            operators.append(node)
+
+        def cardinality(node: dict) -> int:
+            value = node.get("extra_info", {}).get("Estimated Cardinality", 0)
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return 0
+
+        plan_rows = max((cardinality(node) for node in operators), default=0)
+        inputs = {}
+        for node in operators:
+            text = json.dumps(node.get("extra_info", {})).lower()
+            rows_in = max(
+                (cardinality(child) for child in node.get("children", [])),
+                default=cardinality(node),
+            )
+            for call in calls:
+                if f"{call.function}(" in text:
+                    inputs[call.function] = max(inputs.get(call.function, 0), rows_in)
+        return plan_rows, [inputs.get(call.function, plan_rows) for call in calls]
+
+    def _input_stats(
+        self, cursor, query: str, tokens: list, call: LLMCall
+    ) -> Optional[dict]:
+        """
+        Count a call's rows and measure its context values.
+
+        Only possible when the rows of the call are known up front (see
+        call_row_source); the probe reads the call's FROM and WHERE only.
+        """
+        if not call.context:
+            return None
+        source = call_row_source(query, tokens, call)
+        if source is None:
+            return None
+        blocks, conditions = source
+        values = [f"CAST(({column.data}) AS VARCHAR)" for column in call.context]
+        sql = (
+            f"SELECT count(*), approx_count_distinct(row({', '.join(values)})), "
+            f"avg({' + '.join(f'coalesce(length({value}), 0)' for value in values)}) "
+            f"FROM {blocks[0].clause(query, 'from')}"
+        )
+        if conditions:
+            sql += " WHERE " + " AND ".join(
+                f"({query[start:end]})" for start, end in conditions
+            )
+        with_span = blocks[0].clauses.get("with") or blocks[-1].clauses.get("with")
+        if with_span:
+            sql = f"WITH {query[with_span[0] : with_span[1]]} {sql}"
+        try:
+            rows, distinct, average_chars = cursor.execute(sql).fetchone()
+        except Exception as e:
+            logger.debug("Input probe for %s failed: %s", call.function, e)
+            return None
+        return {
+            "rows": rows,
+            "distinct_inputs": distinct,
+            "average_chars": average_chars or 0,
+        }
+
+    def _call_estimate(
+        self, call: LLMCall, rows: int, method: str, inputs: Optional[dict]
+    ) -> dict:
+        """Tokens, requests and cost of one call evaluated on rows rows."""
+        match = _BATCH_SIZE.search(call.model or "")
+        # Without a batch size FlockMTL fills the context window, so one row
+        # per request is an upper bound
+        batch_size = int(match.group(1)) if match else 1
+        requests = math.ceil(rows / max(batch_size, 1))
+        prompt_tokens = math.ceil(len(call.prompt or "") / _CHARS_PER_TOKEN)
+        context_tokens = (inputs or {}).get("average_chars", 0) / _CHARS_PER_TOKEN
+        input_tokens = math.ceil(requests * prompt_tokens + rows * context_tokens)
+
+        output_rows = rows if call.scalar else requests
+        output_tokens = {
+            "llm_complete": self.output_tokens,
+            "llm_filter": 1,
+            "llm_embedding": 0,
+        }.get(call.function, self.output_tokens) * output_rows
+
+        entry = {
+            **call.to_dict(),
+            "method": method,
+            "model_calls": rows,
+            "requests": requests,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "estimated_cost_usd": round(
+                usage_tracker.estimate_cost(
+                    call.model_name or "", input_tokens, output_tokens, 0
+                ),
+                6,
+            ),
+        }
+        if inputs is not None:
+            # approx_count_distinct may overshoot by a few percent
+            entry["distinct_inputs"] = min(inputs["distinct_inputs"], rows)
+        return entry
+
+    def get_stats(self) -> dict:
+        """Get estimator statistics and the budget."""
+        with self._lock:
+            return {
+                **self._stats,
+                "max_model_calls": self.max_model_calls,
+                "max_cost_usd": self.max_cost_usd,
+                "action": self.action,
+            }
+
+
+# Global estimator checking every read-only FlockMTL query before it runs
+llm_cost_estimator = LLMCostEstimator(
+    max_model_calls=int(os.getenv("LLM_BUDGET_MAX_CALLS", "10000")),
+    max_cost_usd=float(os.getenv("LLM_BUDGET_MAX_COST_USD", "0")) or None,
+    action=os.getenv("LLM_BUDGET_ACTION", "reject").lower(),
+    dry_run_max_rows=int(os.getenv("LLM_ESTIMATE_DRY_RUN_MAX_ROWS", "1000000")),
+    output_tokens=int(os.getenv("LLM_ESTIMATE_OUTPUT_TOKENS", "100")),
+    seconds_per_request=float(os.getenv("LLM_ESTIMATE_SECONDS_PER_REQUEST", "1.0")),
+)
@@ -0,0 +1,341 @@
+import os
+import uuid
+import hashlib
+import tempfile
+import threading
+import logging
+from typing import Optional
+
+import duckdb
+
+from app.internal.catalog import normalize_sql
+from app.internal.database import conn
+from app.internal.db_manager import is_flockmtl_available
+from app.internal.llm_probe import count_llm_calls
+from app.internal.metrics import Counter, register_gauge_callback, registry
+from app.internal.sql_rewrite import (
+    SCALAR_OUTPUT_TYPES,
+    LLMCall,
+    apply_edits,
+    call_row_source,
+    find_llm_calls,
+    preserve_column_names,
+    tokenize,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MEMO_CATALOG = "flockmtl_memo"
+MEMO_TABLE = f"{MEMO_CATALOG}.llm_memo"
+
+MEMO_LOOKUPS = registry.register(
+    Counter(
+        "flockmtl_llm_memo_lookups_total",
+        "Distinct llm_* inputs looked up in the memo, by result (hit or miss)",
+        labelnames=("function", "result"),
+    )
+)
+
+
+def _quote(value: Optional[str]) -> str:
+    if value is None:
+        return "NULL"
+    return "'" + value.replace("'", "''") + "'"
+
+
+class LLMMemo:
+    """
+    Persistent memo of FlockMTL scalar function outputs.
+
+    Outputs of llm_complete, llm_filter and llm_embedding are stored in a
+    DuckDB file attached to the main connection, keyed by a hash of the
+    function, model arguments, prompt and the values of the context columns.
+    Before a query runs, the distinct inputs of each call that are not in the
+    memo yet are computed and stored; the call itself is then rewritten to
+    read the memo, and to call the model only for rows it does not cover.
+    """
+
+    def __init__(
+        self,
+        connection,
+        path: Optional[str] = None,
+        ttl_days: Optional[float] = None,
+    ):
+        self.connection = connection
+        self.path = path or os.getenv(
+            "LLM_MEMO_DB_PATH",
+            os.path.join(tempfile.gettempdir(), "flockmtl_llm_memo.db"),
+        )
+        self.ttl_days = (
+            ttl_days
+            if ttl_days is not None
+            else float(os.getenv("LLM_MEMO_TTL_DAYS", "30"))
+        )
+        self.enabled = os.getenv("LLM_MEMO_ENABLED", "true").lower() == "true"
+
+        self._attached = False
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rewritten_calls": 0, "errors": 0}
+
+    def _attach(self):
+        """Attach the memo database on first use."""
+        if self._attached:
+            return
+        with self._lock:
+            if self._attached:
+                return
+            try:
+                self.connection.execute(
+                    f"ATTACH IF NOT EXISTS {_quote(self.path)} AS {MEMO_CATALOG}"
+                )
+            except duckdb.Error as e:
+                # Another process may hold the file; memoize in memory instead
+                logger.warning(f"Could not open LLM memo at {self.path}: {e}")
+                self.connection.execute(
+                    f"ATTACH IF NOT EXISTS ':memory:' AS {MEMO_CATALOG}"
+                )
+            self.connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {MEMO_TABLE} (
+                    key VARCHAR PRIMARY KEY,
+                    function VARCHAR,
+                    model VARCHAR,
+                    prompt VARCHAR,
+                    output VARCHAR,
+                    created_at TIMESTAMP
+                )
+                """
+            )
+            if self.ttl_days > 0:
+                self.connection.execute(
+                    f"DELETE FROM {MEMO_TABLE} WHERE created_at < "
+                    f"current_timestamp::TIMESTAMP - INTERVAL ({self.ttl_days}) DAY"
+                )
+            self._attached = True
+
+    def rewrite(self, cursor, query: str) -> tuple[str, list[dict]]:
+        """
+        Fill the memo for a query's LLM calls and rewrite them to read it.
+
+        Any failure leaves the query unchanged, so memoization can only make
+        a query cheaper, never break it.
+
+        Args:
+            cursor: DuckDB cursor the query will run on
+            query: Read-only SQL query
+
+        Returns:
+            The query to run and a report entry per memoized call
+        """
+        if not self.enabled or "llm_" not in query.lower():
+            return query, []
+        if not is_flockmtl_available():
+            return query, []
+        original = query
+        # The query is wrapped in a subquery when its column names need restoring
+        query = query.strip().rstrip(";")
+        try:
+            self._attach()
+            tokens = tokenize(query)
+            numbered = [
+                (number, call)
+                for number, call in enumerate(find_llm_calls(query, tokens))
+                if _memoizable(call)
+            ]
+            if not numbered:
+                return original, []
+            calls = [call for _, call in numbered]
+
+            edits = [
+                (call.span[0], call.span[1], self._lookup_expression(query, call))
+                for call in calls
+            ]
+            # Binding the rewritten query also makes sure it is valid before
+            # any model call is paid for
+            rewritten = preserve_column_names(cursor, query, apply_edits(query, edits))
+        except Exception as e:
+            logger.warning("LLM memo rewrite skipped: %s", e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return original, []
+
+        try:
+            model_calls = count_llm_calls(cursor, query)
+        except Exception as e:
+            logger.debug("Could not count model calls: %s", e)
+            model_calls = None
+        report = [
+            self._prefill(
+                cursor,
+                query,
+                tokens,
+                call,
+                edits,
+                model_calls[number] if model_calls is not None else None,
+            )
+            for number, call in numbered
+        ]
+        with self._lock:
+            self._stats["rewritten_calls"] += len(calls)
+        return rewritten, report
+
+    def _lookup_expression(self, query: str, call: LLMCall) -> str:
+        """Replacement for a call: the memoized output, else the call itself."""
+        return (
+            f"COALESCE((SELECT CAST(__memo.output AS {SCALAR_OUTPUT_TYPES[call.function]}) "
+            f"FROM {MEMO_TABLE} __memo "
+            f"WHERE __memo.key = {_key_expression(query, call)}), {call.text(query)})"
+        )
+
+    def _prefill(
+        self,
+        cursor,
+        query: str,
+        tokens: list,
+        call: LLMCall,
+        edits: list,
+        model_calls: Optional[int] = None,
+    ) -> dict:
+        """
+        Compute and store the outputs for a call's inputs missing from the memo.
+
+        The inputs are the distinct context values over the FROM clause and the
+        cheap (LLM-free) WHERE conditions of the statement containing the call.
+        Nothing is stored when there are more missing inputs than the query
+        itself would call the model for (model_calls, if known), e.g. because
+        DuckDB pushes an outer filter into the statement.
+        """
+        report = {"rule": "llm_memo", **call.to_dict(), "prefilled": False}
+        inputs_sql = _inputs_query(query, tokens, call, edits)
+        if inputs_sql is None:
+            return report
+
+        inputs_table = f"__memo_inputs_{uuid.uuid4().hex[:12]}"
+        try:
+            cursor.execute(f"CREATE TEMP TABLE {inputs_table} AS {inputs_sql}")
+            distinct_inputs, misses = cursor.execute(
+                f"SELECT count(*), count(*) FILTER (WHERE __memo_key NOT IN "
+                f"(SELECT key FROM {MEMO_TABLE})) FROM {inputs_table}"
+            ).fetchone()
+            if model_calls is not None and misses > model_calls:
+                return report
+            if misses:
+                replacements = [
+                    (column.span[0], column.span[1], f"__memo_ctx_{i}")
+                    for i, column in enumerate(call.context)
+                ]
+                call_sql = apply_edits(query, replacements, span=call.span)
+                cursor.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {MEMO_TABLE}
+                    SELECT __memo_key, {_quote(call.function)},
+                        {_quote(call.model_name)}, {_quote(call.prompt)},
+                        CAST({call_sql} AS VARCHAR), current_timestamp
+                    FROM {inputs_table}
+                    WHERE __memo_key NOT IN (SELECT key FROM {MEMO_TABLE})
+                    """
+                )
+        except Exception as e:
+            # The rewritten query still calls the model for anything missing
+            logger.warning("LLM memo prefill failed for %s: %s", call.function, e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return report
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS {inputs_table}")
+
+        hits = distinct_inputs - misses
+        MEMO_LOOKUPS.inc(hits, function=call.function, result="hit")
+        MEMO_LOOKUPS.inc(misses, function=call.function, result="miss")
+        with self._lock:
+            self._stats["hits"] += hits
+            self._stats["misses"] += misses
+        report.update(
+            prefilled=True,
+            distinct_inputs=distinct_inputs,
+            memo_hits=hits,
+            model_calls=misses,
+        )
+        return report
+
+    def clear(self):
+        """Delete every memoized output."""
+        self._attach()
+        self.connection.execute(f"DELETE FROM {MEMO_TABLE}")
+
+    def get_stats(self) -> dict:
+        """Get memo usage statistics."""
+        with self._lock:
+            stats = {**self._stats, "enabled": self.enabled, "path": self.path}
+        if self._attached:
+            with self.connection.cursor() as cursor:
+                stats["entries"] = cursor.execute(
+                    f"SELECT count(*) FROM {MEMO_TABLE}"
+                ).fetchone()[0]
+        return stats
+
+
+def _memoizable(call: LLMCall) -> bool:
+    return call.scalar and call.parsed and not call.nested
+
+
+def _key_expression(query: str, call: LLMCall) -> str:
+    """
+    SQL expression computing a call's memo key for the current row.
+
+    The constant parts (function, model arguments, prompt text and context
+    column attributes) are hashed here; the context values are added in SQL.
+    """
+    replacements = [(*column.span, "?") for column in call.context]
+    signature = "\x1f".join(
+        (
+            call.function,
+            normalize_sql(call.model),
+            normalize_sql(apply_edits(query, replacements, span=call.prompt_span)),
+        )
+    )
+    prefix = hashlib.sha256(signature.encode("utf-8")).hexdigest()[:32]
+    values = ", ".join(f"CAST(({column.data}) AS VARCHAR)" for column in call.context)
+    return f"md5('{prefix}' || to_json([{values}]))"
+
+
+def _inputs_query(
+    query: str, tokens: list, call: LLMCall, edits: list
+) -> Optional[str]:
+    """Build the query selecting a call's distinct inputs, or None if unsafe."""
+    source = call_row_source(query, tokens, call)
+    if source is None:
+        return None
+    blocks, condition_spans = source
+    block = blocks[0]
+
+    conditions = [apply_edits(query, edits, span=span) for span in condition_spans]
+    columns = ", ".join(
+        f"{column.data} AS __memo_ctx_{i}" for i, column in enumerate(call.context)
+    )
+    sql = (
+        f"SELECT DISTINCT {_key_expression(query, call)} AS __memo_key"
+        f"{', ' + columns if columns else ''} "
+        f"FROM {apply_edits(query, edits, span=block.clauses['from'])}"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+
+    # CTEs the FROM clause may refer to, with their own calls memoized already
+    with_span = block.clauses.get("with") or (
+        blocks[-1].clauses.get("with") if len(blocks) > 1 else None
+    )
+    if with_span is not None:
+        sql = f"WITH {apply_edits(query, edits, span=with_span)} {sql}"
+    return sql
+
+
+# Global memo on the main connection, attached on first use
+llm_memo = LLMMemo(conn)
+
+register_gauge_callback(
+    "flockmtl_llm_memo_rewritten_calls",
+    "Number of llm_* calls rewritten to read the memo",
+    lambda: llm_memo.get_stats()["rewritten_calls"],
+)
@@ -0,0 +1,110 @@
+import uuid
+import logging
+from typing import Optional
+
+from app.internal.sql_rewrite import (
+    SCALAR_OUTPUT_TYPES,
+    apply_edits,
+    find_llm_calls,
+    tokenize,
+)
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is a declared dependency
+    pa = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Values returned by the stand-ins: filters keep every row, so the calls
+# after them see as many rows as they possibly could
+_PROBE_VALUES = {"llm_complete": "", "llm_filter": True, "llm_embedding": []}
+
+
+def count_llm_calls(cursor, query: str) -> Optional[list[Optional[int]]]:
+    """
+    Count the model calls a query would make, without calling any model.
+
+    The query is run with every scalar llm_* call replaced by a stand-in
+    UDF that counts the rows it is evaluated on, so the counts reflect
+    DuckDB's actual plan (filter pushdown, join order, streaming LIMIT).
+    Aggregate calls are replaced by a plain aggregate and not counted.
+
+    Args:
+        cursor: DuckDB cursor to run the query on
+        query: Read-only SQL query
+
+    Returns:
+        Number of rows each call (in text order, as found by
+        find_llm_calls) is evaluated on, None for aggregate calls; or None
+        if the query could not be counted (e.g. nested calls)
+    """
+    if pa is None:
+        return None
+    query = query.strip().rstrip(";")
+    tokens = tokenize(query)
+    calls = find_llm_calls(query, tokens)
+    if any(call.nested for call in calls):
+        return None
+
+    prefix = f"__llm_probe_{uuid.uuid4().hex[:12]}"
+    counts = [0 if call.scalar else None for call in calls]
+
+    edits = []
+    for number, call in enumerate(calls):
+        close = tokens[call.open_index].match
+        arguments = query[tokens[call.open_index].end : tokens[close].start]
+        if call.scalar:
+            # Pass the arguments so the stand-in reads the same columns
+            replacement = f"{prefix}_{number}(CAST(row({arguments}) AS VARCHAR))"
+        else:
+            replacement = f"CAST(count(row({arguments})) AS VARCHAR)"
+        edits.append((*call.span, replacement))
+
+    registered = []
+    try:
+        for number, call in enumerate(calls):
+            if not call.scalar:
+                continue
+            cursor.create_function(
+                f"{prefix}_{number}",
+                _make_probe(counts, number, call.function),
+                ["VARCHAR"],
+                SCALAR_OUTPUT_TYPES[call.function],
+                type="arrow",
+                side_effects=True,
+            )
+            registered.append(f"{prefix}_{number}")
+
+        results = cursor.execute(apply_edits(query, edits))
+        for _ in results.fetch_record_batch():
+            pass
+        return counts
+    finally:
+        for function in registered:
+            cursor.remove_function(function)
+
+
+def _make_probe(counts: list, number: int, function: str):
+    """Build a vectorized stand-in for function adding its rows to counts."""
+    value = _PROBE_VALUES[function]
+    array_type = {
+        "llm_complete": pa.string(),
+        "llm_filter": pa.bool_(),
+        "llm_embedding": pa.list_(pa.float32()),
+    }[function]
+
+    def probe(values):
+        counts[number] += len(values)
+        return pa.array([value] * len(values), array_type)
+
+    return probe
+
+
+def total_llm_calls(cursor, query: str) -> Optional[int]:
+    """Total of count_llm_calls over a query's scalar calls, None if unknown."""
+    counts = count_llm_calls(cursor, query)
+    if counts is None:
+        return None
+    return sum(count for count in counts if count is not None)
@@ -0,0 +1,605 @@
+import os
+import threading
+import logging
+from typing import Optional
+
+from app.internal.llm_probe import total_llm_calls
+from app.internal.metrics import Counter, registry
+from app.internal.sql_rewrite import (
+    LLMCall,
+    SelectBlock,
+    Token,
+    alias_after,
+    apply_edits,
+    contains_llm_call,
+    enclosing_selects,
+    find_llm_calls,
+    identifier_name,
+    is_deterministic,
+    preserve_column_names,
+    quote_identifier,
+    select_items,
+    split_conjuncts,
+    token_range,
+    tokenize,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Words after which a name starts an expression rather than naming its alias
+_EXPRESSION_KEYWORDS = {
+    "select",
+    "distinct",
+    "case",
+    "when",
+    "then",
+    "else",
+    "and",
+    "or",
+    "not",
+    "is",
+    "in",
+    "like",
+    "ilike",
+    "between",
+}
+
+PUSHDOWN_MODEL_CALLS = registry.register(
+    Counter(
+        "flockmtl_llm_pushdown_model_calls_saved_total",
+        "Model calls saved by evaluating llm_* calls after cheap filters",
+    )
+)
+
+
+class _Candidate:
+    """One possible rewrite: its edits and how to report it."""
+
+    def __init__(self, edits: list[tuple[int, int, str]], description: dict):
+        self.edits = edits
+        self.description = description
+
+
+class FilterPushdownRewriter:
+    """
+    Evaluate FlockMTL calls only on the rows that survive cheap predicates.
+
+    DuckDB pushes a filter down to the lowest operator that has its columns,
+    so an llm_filter on one side of a join runs on that whole side before
+    the join and the other filters discard most of it, and a projection
+    computing llm_complete in a subquery or CTE runs on every row before
+    the query consuming it joins or filters. Two rewrites move the calls
+    above the cheap work:
+
+    - A call in a WHERE clause is guarded by the other (deterministic,
+      LLM-free) conditions of that clause, as CASE WHEN conditions THEN
+      call END. The guard reads the columns of every condition, so DuckDB
+      can only evaluate it once they are all available, and CASE evaluates
+      the call only for the rows where they hold.
+    - An aliased call in the select list of a plain subquery or single-use
+      CTE moves to the query consuming it, which is evaluated after that
+      query's joins and filters. The subquery outputs the call's context
+      values instead. Consumers with outer joins are left alone, as these
+      turn the column into NULL rather than the call's output.
+
+    - A call in the select list of a query with a LIMIT moves to a query
+      wrapping it, so that it runs on the rows the LIMIT keeps rather than
+      on every row before ORDER BY ... LIMIT picks them. The ordering keys
+      must not read the call's output.
+
+    Each rewrite is kept only if a dry run (see llm_probe) shows that
+    it makes fewer model calls.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"rewritten_queries": 0, "model_calls_saved": 0}
+
+    def rewrite(self, cursor, query: str) -> tuple[str, list[dict]]:
+        """
+        Move a query's LLM calls after its cheap filters where that saves calls.
+
+        Args:
+            cursor: DuckDB cursor the query will run on
+            query: Read-only SQL query
+
+        Returns:
+            The query to run and its report entry, if any rewrite applied
+        """
+        if not self.enabled or "llm_" not in query.lower():
+            return query, []
+        original = query
+        query = query.strip().rstrip(";")
+        try:
+            tokens = tokenize(query)
+            calls = find_llm_calls(query, tokens)
+            candidates = _guard_candidates(query, tokens, calls)
+            candidates += _pull_up_candidates(query, tokens, calls)
+            candidates += _top_n_candidates(query, tokens, calls)
+            if not candidates:
+                return original, []
+            before = total_llm_calls(cursor, query)
+        except Exception as e:
+            logger.warning("Filter pushdown skipped: %s", e)
+            return original, []
+        if not before:
+            return original, []
+
+        edits = []
+        applied = []
+        after = before
+        for candidate in candidates:
+            trial = edits + candidate.edits
+            try:
+                rewritten = preserve_column_names(
+                    cursor, query, apply_edits(query, trial)
+                )
+                calls_made = total_llm_calls(cursor, rewritten)
+            except Exception as e:
+                logger.debug("Pushdown candidate %s rejected: %s", candidate, e)
+                continue
+            if calls_made is not None and calls_made < after:
+                edits = trial
+                applied.append(candidate.description)
+                after = calls_made
+
+        if not applied:
+            return original, []
+        PUSHDOWN_MODEL_CALLS.inc(before - after)
+        with self._lock:
+            self._stats["rewritten_queries"] += 1
+            self._stats["model_calls_saved"] += before - after
+        report = {
+            "rule": "filter_pushdown",
+            "rewrites": applied,
+            "model_calls_before": before,
+            "model_calls_after": after,
+            "model_calls_saved": before - after,
+        }
+        return preserve_column_names(cursor, query, apply_edits(query, edits)), [report]
+
+    def get_stats(self) -> dict:
+        """Get rewrite statistics."""
+        with self._lock:
+            return {**self._stats, "enabled": self.enabled}
+
+
+def _guard_candidates(
+    query: str, tokens: list[Token], calls: list[LLMCall]
+) -> list[_Candidate]:
+    """Guard each call in a WHERE clause with the clause's cheap conditions."""
+    candidates = []
+    for call in calls:
+        if not call.scalar or call.nested:
+            continue
+        blocks = enclosing_selects(query, tokens, call.open_index - 1)
+        if not blocks:
+            continue
+        block = blocks[0]
+        if block.set_operation or block.clause_at(call.span[0]) != "where":
+            continue
+        conditions = [
+            span
+            for span in split_conjuncts(tokens, block.clauses["where"])
+            if not span[0] <= call.span[0] < span[1]
+        ]
+        if not conditions or any(
+            contains_llm_call(tokens, span) or not is_deterministic(tokens, span)
+            for span in conditions
+        ):
+            continue
+        guard = " AND ".join(f"({query[start:end]})" for start, end in conditions)
+        candidates.append(
+            _Candidate(
+                [(*call.span, f"CASE WHEN {guard} THEN {call.text(query)} END")],
+                {
+                    "kind": "guard",
+                    "function": call.function,
+                    "conditions": [query[start:end] for start, end in conditions],
+                },
+            )
+        )
+    return candidates
+
+
+def _pull_up_candidates(
+    query: str, tokens: list[Token], calls: list[LLMCall]
+) -> list[_Candidate]:
+    """Move aliased calls out of subqueries into the queries consuming them."""
+    candidates = []
+    for number, call in enumerate(calls):
+        if not (call.scalar and call.parsed) or call.nested:
+            continue
+        blocks = enclosing_selects(query, tokens, call.open_index - 1)
+        if len(blocks) < 2:
+            continue
+        inner = blocks[0]
+        if not _is_plain(inner) or inner.parent_index is None:
+            continue
+        item = _aliased_item(query, tokens, inner, call)
+        if item is None or not _reads_only_context(tokens, call):
+            continue
+        name, item_span = item
+        if name is None:
+            continue
+
+        consumer = _consumer(query, tokens, inner, blocks[1])
+        if consumer is None:
+            continue
+        outer, alias, excluded = consumer
+        if _outer_joined(tokens, outer, excluded):
+            continue
+
+        context_names = [f"__llm_ctx_{number}_{i}" for i in range(len(call.context))]
+        moved_call = apply_edits(
+            query,
+            [(*column.span, ctx) for column, ctx in zip(call.context, context_names)],
+            span=call.span,
+        )
+        outputs = [f"NULL AS {quote_identifier(name)}"] + [
+            f"{column.data} AS {ctx}"
+            for column, ctx in zip(call.context, context_names)
+        ]
+        references = _references(query, tokens, outer, excluded, name, alias)
+        if references is None:
+            continue
+        edits = [(*item_span, ", ".join(outputs))]
+        for start, end, whole_item in references:
+            replacement = moved_call
+            if whole_item:
+                replacement += f" AS {quote_identifier(name)}"
+            edits.append((start, end, replacement))
+        stars = _stars(tokens, outer, alias)
+        if stars is None:
+            continue
+        modifiers = (
+            f" EXCLUDE ({', '.join(context_names)})"
+            f" REPLACE ({moved_call} AS {quote_identifier(name)})"
+        )
+        edits.extend((star, star, modifiers) for star in stars)
+        if not references and not stars:
+            # The consumer never reads the column, so DuckDB already skips it
+            continue
+        candidates.append(
+            _Candidate(
+                edits,
+                {"kind": "pull_up", "function": call.function, "column": name},
+            )
+        )
+    return candidates
+
+
+def _top_n_candidates(
+    query: str, tokens: list[Token], calls: list[LLMCall]
+) -> list[_Candidate]:
+    """Evaluate the select-list calls of LIMIT queries on the rows kept."""
+    candidates = []
+    for number, call in enumerate(calls):
+        if not (call.scalar and call.parsed) or call.nested:
+            continue
+        blocks = enclosing_selects(query, tokens, call.open_index - 1)
+        if not blocks:
+            continue
+        block = blocks[0]
+        if (
+            "limit" not in block.clauses
+            or block.set_operation
+            or block.distinct
+            or block.clause_at(call.span[0]) != "select"
+        ):
+            continue
+        item = _aliased_item(query, tokens, block, call)
+        if item is None or not _reads_only_context(tokens, call):
+            continue
+        name, item_span = item
+        if name is None:
+            if block.parent_index is not None:
+                # The column name of an enclosing query's subquery would change
+                continue
+            # Restored by preserve_column_names
+            name = f"__llm_output_{number}"
+        position = [
+            tokens[first].start for first, _ in select_items(tokens, block)
+        ].index(item_span[0])
+        if _orders_by_item(tokens, block, position + 1):
+            continue
+
+        context_names = [f"__llm_ctx_{number}_{i}" for i in range(len(call.context))]
+        moved_call = apply_edits(
+            query,
+            [(*column.span, ctx) for column, ctx in zip(call.context, context_names)],
+            span=call.span,
+        )
+        outputs = [f"NULL AS {quote_identifier(name)}"] + [
+            f"{column.data} AS {ctx}"
+            for column, ctx in zip(call.context, context_names)
+        ]
+        modifiers = f" REPLACE ({moved_call} AS {quote_identifier(name)})"
+        if context_names:
+            modifiers = f" EXCLUDE ({', '.join(context_names)})" + modifiers
+        start, end = block.span
+        candidates.append(
+            _Candidate(
+                [
+                    (start, start, f"SELECT *{modifiers} FROM ("),
+                    (*item_span, ", ".join(outputs)),
+                    # On a new line, in case the query ends with a comment
+                    (end, end, f"\n) __llm_top_n_{number}"),
+                ],
+                {"kind": "top_n", "function": call.function, "column": name},
+            )
+        )
+    return candidates
+
+
+def _orders_by_item(tokens: list[Token], block: SelectBlock, position: int) -> bool:
+    """Whether a block's ORDER BY may read its select item at a position."""
+    span = block.clauses.get("order by")
+    if span is None:
+        return False
+    if contains_llm_call(tokens, span):
+        return True
+    indexes = token_range(tokens, span)
+    for i in indexes:
+        token = tokens[i]
+        if token.depth != block.depth:
+            continue
+        if token.is_word("all"):
+            return True
+        # ORDER BY 2: a number that is a whole ordering key
+        previous = tokens[i - 1]
+        if (
+            token.kind == "number"
+            and (i == indexes[0] or previous.kind == "comma")
+            and token.text == str(position)
+        ):
+            return True
+    return False
+
+
+def _is_plain(block: SelectBlock) -> bool:
+    """Whether a block maps each input row to one output row."""
+    return (
+        "from" in block.clauses
+        and not block.set_operation
+        and not block.distinct
+        and not any(
+            clause in block.clauses
+            for clause in (
+                "group by",
+                "having",
+                "window",
+                "qualify",
+                "order by",
+                "limit",
+                "offset",
+            )
+        )
+    )
+
+
+def _aliased_item(
+    query: str, tokens: list[Token], block: SelectBlock, call: LLMCall
+) -> Optional[tuple[str, tuple[int, int]]]:
+    """
+    Find the select item that is exactly the call, with or without an alias.
+
+    Returns:
+        The alias (None if there is none) and the item's character range, or
+        None if no item is the call or its alias is used inside the block
+    """
+    for first, last in select_items(tokens, block):
+        if tokens[first].start != call.span[0]:
+            continue
+        rest = list(range(tokens[call.open_index].match + 1, last))
+        if not rest:
+            return None, call.span
+        if tokens[rest[0]].is_word("as"):
+            rest = rest[1:]
+        if len(rest) != 1 or tokens[rest[0]].kind not in ("word", "ident"):
+            return None
+        name = identifier_name(tokens[rest[0]])
+        # The alias may also be referenced inside the block, e.g. in WHERE
+        others = [
+            i
+            for i in token_range(tokens, block.span)
+            if i != rest[0] and identifier_name(tokens[i]) == name.lower()
+        ]
+        if others:
+            return None
+        return name, (call.span[0], tokens[rest[0]].end)
+    return None
+
+
+def _reads_only_context(tokens: list[Token], call: LLMCall) -> bool:
+    """Whether the call's arguments only read columns in its context columns."""
+    for i in range(call.open_index + 1, tokens[call.open_index].match):
+        token = tokens[i]
+        if any(
+            column.span[0] <= token.start < column.span[1] for column in call.context
+        ):
+            continue
+        if token.kind == "ident" or (
+            token.kind == "word" and not token.is_word("true", "false", "null")
+        ):
+            return False
+    return True
+
+
+def _consumer(
+    query: str, tokens: list[Token], inner: SelectBlock, parent: SelectBlock
+) -> Optional[tuple[SelectBlock, str, tuple[int, int]]]:
+    """
+    Find the query reading a subquery's rows.
+
+    Args:
+        inner: The subquery, a derived table or CTE body
+        parent: The block enclosing it
+
+    Returns:
+        The consuming block, the name it refers to the subquery by, and the
+        character range of the subquery (or CTE definition) to leave alone
+    """
+    open_index = inner.parent_index
+    close_index = tokens[open_index].match
+    clause = parent.clause_at(tokens[open_index].start)
+    previous = tokens[open_index - 1] if open_index > 0 else None
+
+    if clause == "from":
+        # A derived table: FROM (SELECT ...) [AS] alias
+        if previous is None or not (
+            previous.is_word("from", "join") or previous.kind == "comma"
+        ):
+            return None
+        alias = alias_after(tokens, close_index)
+        if alias is None or parent.set_operation:
+            return None
+        return parent, alias, (tokens[open_index].start, tokens[close_index].end)
+
+    if clause == "with":
+        # A CTE: name AS [NOT] [MATERIALIZED] (SELECT ...)
+        i = open_index - 1
+        while i > 0 and tokens[i].is_word("materialized", "not"):
+            i -= 1
+        if not tokens[i].is_word("as") or tokens[i - 1].kind not in ("word", "ident"):
+            return None
+        cte = identifier_name(tokens[i - 1])
+        definition = (tokens[i - 1].start, tokens[close_index].end)
+        # References as a table, not as the qualifier of a column or star
+        uses = [
+            j
+            for j, token in enumerate(tokens)
+            if identifier_name(token) == cte
+            and not definition[0] <= token.start < definition[1]
+            and not (j + 1 < len(tokens) and tokens[j + 1].text == ".")
+        ]
+        if len(uses) != 1:
+            return None
+        use = uses[0]
+        if not (
+            tokens[use - 1].is_word("from", "join") or tokens[use - 1].kind == "comma"
+        ):
+            return None
+        outer = enclosing_selects(query, tokens, use)[0]
+        if outer.set_operation or outer.clause_at(tokens[use].start) != "from":
+            return None
+        alias = alias_after(tokens, use) or cte
+        return outer, alias, definition
+
+    return None
+
+
+def _outer_joined(
+    tokens: list[Token], outer: SelectBlock, excluded: tuple[int, int]
+) -> bool:
+    """
+    Whether the consumer's FROM clause has an outer, positional or ASOF join.
+
+    Such a join pads unmatched rows with NULLs: the subquery's column is
+    NULL there, while a call moved to the consumer would run on the NULL
+    context. The side the subquery is on is not checked.
+    """
+    for i in token_range(tokens, outer.clauses.get("from", (0, 0))):
+        token = tokens[i]
+        if excluded[0] <= token.start < excluded[1]:
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token.is_word("left", "right", "full", "outer", "positional", "asof") and (
+            following is None or following.text != "("
+        ):
+            return True
+    return False
+
+
+def _references(
+    query: str,
+    tokens: list[Token],
+    outer: SelectBlock,
+    excluded: tuple[int, int],
+    name: str,
+    alias: str,
+) -> Optional[list[tuple[int, int, bool]]]:
+    """
+    Find the consumer's references to a subquery column.
+
+    Only references in the select list can be moved; the call must not be
+    needed by the consumer's filters, joins, grouping or ordering.
+
+    Returns:
+        (start, end, whether the reference is a whole select item) for each
+        reference, or None if the column is read outside the select list
+    """
+    name = name.lower()
+    select_span = outer.clauses.get("select", (0, 0))
+    whole_items = {
+        (tokens[first].start, tokens[last - 1].end)
+        for first, last in select_items(tokens, outer)
+    }
+    references = []
+    for clause, span in outer.clauses.items():
+        if clause == "with":
+            continue
+        for i in token_range(tokens, span):
+            token = tokens[i]
+            if excluded[0] <= token.start < excluded[1]:
+                continue
+            if clause == "select" and token.is_word("select", "columns"):
+                # Subqueries and COLUMNS(...) may read the column indirectly
+                return None
+            if identifier_name(token) != name:
+                continue
+            previous = tokens[i - 1]
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if following is not None and following.text == "(":
+                continue
+            if previous.text == ".":
+                if identifier_name(tokens[i - 2]) != alias:
+                    continue
+                start = tokens[i - 2].start
+            elif previous.is_word("as") or (
+                previous.kind in ("word", "ident", "number", "string", "close")
+                and previous.lower not in _EXPRESSION_KEYWORDS
+            ):
+                # The name of an output column, not a reference
+                continue
+            else:
+                start = token.start
+            if clause != "select" or not select_span[0] <= start < select_span[1]:
+                return None
+            references.append((start, token.end, (start, token.end) in whole_items))
+    return references
+
+
+def _stars(tokens: list[Token], outer: SelectBlock, alias: str) -> Optional[list[int]]:
+    """
+    Find the stars of the consumer's select list that expand the subquery.
+
+    Returns:
+        Character positions right after each star, or None if a star already
+        has EXCLUDE, REPLACE or RENAME modifiers
+    """
+    stars = []
+    for i in token_range(tokens, outer.clauses.get("select", (0, 0))):
+        token = tokens[i]
+        if token.text != "*" or token.depth != outer.depth:
+            continue
+        previous = tokens[i - 1]
+        if previous.text == ".":
+            if identifier_name(tokens[i - 2]) != alias:
+                continue
+        elif not (previous.kind == "comma" or previous.is_word("select", "distinct")):
+            # Multiplication
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if following is not None and following.is_word("exclude", "replace", "rename"):
+            return None
+        stars.append(token.end)
+    return stars
+
+
+# Global rewriter used for every read-only FlockMTL query
+filter_pushdown_rewriter = FilterPushdownRewriter(
+    enabled=os.getenv("LLM_PUSHDOWN_ENABLED", "true").lower() == "true",
+)
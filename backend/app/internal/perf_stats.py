@@ -0,0 +1,218 @@
+import os
+import math
+import threading
+from array import array
+from typing import Optional
+
+# Quantiles tracked for every operation
+TRACKED_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of floats backed by a preallocated array.
+
+    Once full, each append overwrites the oldest value, so memory use is
+    constant no matter how many values are appended.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1")
+        self.capacity = capacity
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._size = 0
+
+    def append(self, value: float):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def values(self) -> list[float]:
+        """Return the buffered values, oldest first."""
+        if self._size < self.capacity:
+            return self._values[: self._size].tolist()
+        return (self._values[self._next :] + self._values[: self._next]).tolist()
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate using the P² algorithm (Jain & Chlamtac, 1985).
+
+    Keeps five markers regardless of how many observations are added, so the
+    estimate costs O(1) memory and O(1) time per observation.
+    """
+
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self._heights: list[float] = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [
+            1,
+            1 + 2 * quantile,
+            1 + 4 * quantile,
+            3 + 2 * quantile,
+            5,
+        ]
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value: float):
+        heights = self._heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        # Find the cell containing the value, extending the extremes if needed
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        for i in range(cell + 1, 5):
+            self._positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Adjust the three middle markers towards their desired positions
+        positions = self._positions
+        for i in (1, 2, 3):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (
+                offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, step: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+
+    def value(self) -> Optional[float]:
+        """Return the current estimate, or None before any observation."""
+        heights = self._heights
+        if not heights:
+            return None
+        if len(heights) < 5:
+            # Exact nearest-rank quantile of the few values seen so far
+            rank = max(0, math.ceil(self.quantile * len(heights)) - 1)
+            return heights[rank]
+        return heights[2]
+
+
+class OperationStats:
+    """Streaming statistics for one operation, in constant memory."""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.timed_count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_timestamp: Optional[float] = None
+        self.recent = RingBuffer(window)
+        self.quantiles = {q: P2Quantile(q) for q in TRACKED_QUANTILES}
+
+    def record(self, timestamp: float, duration: Optional[float] = None):
+        self.count += 1
+        self.last_timestamp = timestamp
+        if duration is None:
+            return
+        self.timed_count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.recent.append(duration)
+        for estimator in self.quantiles.values():
+            estimator.add(duration)
+
+    def summary(self) -> dict:
+        summary = {"count": self.count, "last_timestamp": self.last_timestamp}
+        if self.timed_count:
+            summary.update(
+                {
+                    "avg_seconds": round(self.total / self.timed_count, 6),
+                    "max_seconds": round(self.max, 6),
+                    **{
+                        f"p{int(q * 100)}_seconds": round(estimator.value(), 6)
+                        for q, estimator in self.quantiles.items()
+                    },
+                }
+            )
+        return summary
+
+
+class PerformanceStats:
+    """
+    Per-operation performance statistics with bounded memory.
+
+    Each operation keeps its count, average, maximum, streaming p50/p95/p99
+    estimates and a ring buffer of its most recent durations. The number of
+    tracked operations is capped as well.
+    """
+
+    def __init__(self, window: Optional[int] = None, max_operations: int = 128):
+        self.window = window or int(os.getenv("PERF_METRICS_WINDOW", "256"))
+        self.max_operations = max_operations
+        self._lock = threading.Lock()
+        self._operations: dict[str, OperationStats] = {}
+
+    def record(self, operation: str, timestamp: float, duration: float = None):
+        """
+        Record one occurrence of an operation.
+
+        Args:
+            operation: Operation name
+            timestamp: Unix time of the occurrence
+            duration: Duration in seconds, if the operation was timed
+        """
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                if len(self._operations) >= self.max_operations:
+                    operation = "OTHER"
+                    stats = self._operations.get(operation)
+                if stats is None:
+                    stats = self._operations[operation] = OperationStats(self.window)
+            stats.record(timestamp, duration)
+
+    def recent(self, operation: str) -> list[float]:
+        """Return the most recent durations of an operation, oldest first."""
+        with self._lock:
+            stats = self._operations.get(operation)
+            return stats.recent.values() if stats else []
+
+    def summary(self) -> dict:
+        """Return a compact summary of every operation."""
+        with self._lock:
+            return {
+                operation: stats.summary()
+                for operation, stats in self._operations.items()
+            }
+
+    def total_operations(self) -> int:
+        with self._lock:
+            return sum(stats.count for stats in self._operations.values())
+
+    def clear(self):
+        with self._lock:
+            self._operations.clear()
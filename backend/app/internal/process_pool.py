@@ -0,0 +1,211 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is a declared dependency
+    pa = None
+
+from app.internal.metrics import Counter, registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+PROCESS_TASKS = registry.register(
+    Counter(
+        "flockmtl_process_pool_tasks_total",
+        "Tasks run in worker processes, by outcome",
+        labelnames=("status",),
+    )
+)
+
+
+class WorkerCrashed(Exception):
+    """Raised when a worker process died while running a task."""
+
+
+class ProcessPool:
+    """
+    Optional pool of worker processes parsing and reading uploaded files.
+
+    Only ingestion runs here: queries keep running on the API process's
+    DuckDB connection, as workers cannot open the database file it holds
+    locked, so a crashing query is not isolated. Tasks produce named Arrow
+    tables. In a worker, each table is written as
+    an Arrow IPC stream straight into a shared memory block, and the API
+    process reads it from there without copying, hands it to a callback
+    (e.g. to load it into DuckDB) and frees the block. Work in a worker does
+    not hold the API process's GIL, and a worker that crashes or runs out of
+    memory (max_memory_mb caps its address space) fails only its task; the
+    pool is then started afresh.
+
+    Workers are spawned, not forked, as forking a process running DuckDB
+    threads is unsafe. When the pool is disabled, tasks run in the calling
+    thread and their tables are passed on directly.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_memory_mb: int,
+        max_tasks_per_child: int,
+        enabled: bool,
+    ):
+        self.workers = workers
+        self.max_memory_mb = max_memory_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.enabled = enabled
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {"tasks": 0, "failures": 0, "crashes": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.max_memory_mb,),
+                    max_tasks_per_child=self.max_tasks_per_child or None,
+                )
+            return self._executor
+
+    def load_tables(
+        self,
+        function: Callable[..., dict],
+        *args,
+        consume: Callable[[str, Any], Any],
+    ) -> list:
+        """
+        Run function(*args) in a worker and pass each table it returns to consume.
+
+        Args:
+            function: Module-level function returning {name: Arrow table}
+            args: Picklable arguments of function
+            consume: Called with each name and table in the API process; the
+                table is only valid until consume returns
+
+        Returns:
+            The return values of consume, in table order
+
+        Raises:
+            WorkerCrashed: If the worker process died
+        """
+        if not self.enabled:
+            return [consume(name, table) for name, table in function(*args).items()]
+
+        with self._lock:
+            self._stats["tasks"] += 1
+        try:
+            future = self._get_executor().submit(_export_tables, function, args)
+            exported = future.result()
+        except BrokenProcessPool as e:
+            PROCESS_TASKS.inc(status="crashed")
+            with self._lock:
+                self._stats["crashes"] += 1
+                # A broken pool accepts no more tasks; start a new one
+                broken, self._executor = self._executor, None
+            if broken is not None:
+                broken.shutdown(wait=False, cancel_futures=True)
+            raise WorkerCrashed(
+                "The worker process died (it may have run out of memory)"
+            ) from e
+        except Exception:
+            PROCESS_TASKS.inc(status="failed")
+            with self._lock:
+                self._stats["failures"] += 1
+            raise
+        PROCESS_TASKS.inc(status="done")
+
+        results = []
+        blocks = [shared_memory.SharedMemory(name=block) for _, block, _ in exported]
+        try:
+            for (name, _, size), block in zip(exported, blocks):
+                results.append(consume(name, _read_table(block, size)))
+        finally:
+            for block in blocks:
+                try:
+                    block.close()
+                except BufferError:
+                    # consume kept a reference to the table; the mapping is
+                    # released with it
+                    logger.warning("Shared memory of %s still in use", block.name)
+                block.unlink()
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "running": self._executor is not None,
+                "max_memory_mb": self.max_memory_mb,
+            }
+
+
+def _init_worker(max_memory_mb: int):
+    """Cap the address space of a worker process."""
+    if max_memory_mb:
+        import resource
+
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _export_tables(function: Callable[..., dict], args) -> list[tuple[str, str, int]]:
+    """
+    Run a task in a worker and write its tables into shared memory.
+
+    Returns:
+        (name, shared memory block name, stream size) per table
+    """
+    exported = []
+    try:
+        for name, table in function(*args).items():
+            # Size the block exactly, then write the stream straight into it
+            mock = pa.MockOutputStream()
+            with pa.ipc.new_stream(mock, table.schema) as writer:
+                writer.write_table(table)
+            size = mock.size()
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            exported.append((name, block.name, size))
+            sink = pa.FixedSizeBufferWriter(pa.py_buffer(block.buf))
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            sink.close()
+            del sink, writer
+            block.close()
+    except Exception:
+        # The API process never sees these blocks
+        for _, name, _ in exported:
+            shared_memory.SharedMemory(name=name).unlink()
+        raise
+    return exported
+
+
+def _read_table(block: shared_memory.SharedMemory, size: int):
+    """Read an Arrow table from shared memory without copying it."""
+    return pa.ipc.open_stream(pa.py_buffer(block.buf[:size])).read_all()
+
+
+# Global worker pool, disabled unless PROCESS_POOL_ENABLED is set
+process_pool = ProcessPool(
+    workers=int(os.getenv("PROCESS_POOL_WORKERS", "2")),
+    max_memory_mb=int(os.getenv("PROCESS_POOL_MAX_MEMORY_MB", "0")),
+    max_tasks_per_child=int(os.getenv("PROCESS_POOL_MAX_TASKS_PER_CHILD", "0")),
+    enabled=os.getenv("PROCESS_POOL_ENABLED", "false").lower() == "true",
+)
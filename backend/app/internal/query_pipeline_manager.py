@@ -3,11 +3,43 @@ import time
 import logging
 import traceback
 import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from dotenv import load_dotenv
 import openai
 
-from app.internal.database import conn, get_all_tables, get_table_schema
+from app.internal.database import (
+    conn,
+    cursor_pool,
+    get_all_tables,
+    get_table_schema,
+    profiled,
+)
+from app.internal.catalog import catalog_versions, is_read_only_query
 from app.internal.db_manager import is_flockmtl_available, get_database_info
+from app.internal.llm_client import LLMClient, LLMError, llm_client
+from app.internal.llm_dedup import distinct_input_rewriter
+from app.internal.llm_estimator import LLMBudgetExceeded, llm_cost_estimator
+from app.internal.llm_memo import llm_memo
+from app.internal.llm_pushdown import filter_pushdown_rewriter
+from app.internal.query_rewriter import (
+    EXECUTION_REWRITERS,
+    analyze_query,
+    plan_query,
+    rewrite_query,
+)
+from app.internal.single_flight import normalize_prompt
+from app.internal.metrics import STAGE_DURATION
+from app.internal.perf_stats import PerformanceStats
+from app.internal.process_pool import process_pool
+from app.internal.request_context import RequestContext
+from app.internal.chunked_execution import chunked_executor
+from app.internal.job_queue import job_queue
+from app.internal.result_cache import result_cache
+from app.internal.result_handles import TooManyPending, result_handles
+from app.internal.sql_rewrite import sample_tables
+from app.internal.structured_logging import log_event
 from app.internal.templates import (
     SYSTEM_GENERATION_PROMPT,
     SYSTEM_TABLE_SELECTION,
@@ -20,8 +52,7 @@ from app.internal.templates import (
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Set up detailed logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging
 logger = logging.getLogger(__name__)
 
 
@@ -35,26 +66,29 @@ class QueryPipelineManager:
     3. Query execution with proper timeout handling
     4. Pipeline operations and refinement
     5. Debug information collection
+
+    The manager holds no per-request state: everything a request produces is
+    kept on the RequestContext passed through the pipeline methods, so a
+    single instance can serve many concurrent requests.
     """
 
-    def __init__(self):
+    def __init__(self, llm: LLMClient = None):
         """
         Initialize the QueryPipelineManager with OpenAI API and DuckDB connection.
+
+        Args:
+            llm: LLM client wrapper to use, defaults to the shared client
         """
-        self.openai = openai
+        self.llm = llm or llm_client
         self.conn = conn
 
-        # Enhanced debug information structure
-        self.debug_info = {
-            "last_prompt": None,
-            "last_generated_query": None,
-            "last_execution_error": None,
-            "last_execution_result": None,
-            "last_openai_response": None,
-            "table_selection_info": None,
-            "performance_metrics": {},
-            "database_info": None,
-        }
+        self.database_info = None
+
+        # Per-operation timing statistics, bounded in memory
+        self.performance_stats = PerformanceStats()
+
+        # Rows sampled from each table for the preview of progressive execution
+        self.preview_sample_rows = int(os.getenv("PROGRESSIVE_SAMPLE_ROWS", "50"))
 
         # Initialize database info
         self._update_database_info()
@@ -64,62 +98,55 @@ class QueryPipelineManager:
         try:
             from app.internal.db_manager import get_database_info
 
-            self.debug_info["database_info"] = get_database_info()
+            self.database_info = get_database_info()
         except Exception as e:
             logger.warning(f"Could not get database info: {e}")
-            self.debug_info["database_info"] = {"error": str(e)}
-
-    def log_debug(self, operation: str, data: dict):
-        """Log debug information with structured format and performance tracking"""
-        timestamp = time.time()
+            self.database_info = {"error": str(e)}
 
-        logger.debug(f"\n{'=' * 50}")
-        logger.debug(f"OPERATION: {operation} - {time.strftime('%H:%M:%S')}")
-        logger.debug(f"{'=' * 50}")
-
-        for key, value in data.items():
-            if isinstance(value, str) and len(value) > 200:
-                logger.debug(f"{key.upper()}: {value[:200]}...")
-            else:
-                logger.debug(f"{key.upper()}: {value}")
+    def log_debug(self, operation: str, data, duration: float = None):
+        """
+        Log debug information with structured format and performance tracking.
 
-        logger.debug(f"{'=' * 50}\n")
+        The details are only built and formatted when DEBUG logging is enabled
+        (and the event is not sampled out), so pass expensive payloads as a
+        callable.
 
+        Args:
+            operation: Operation name
+            data: Details to log, or a zero-argument callable returning them
+            duration: Duration of the operation in seconds, if it was timed
+        """
         # Store performance metrics
-        if operation not in self.debug_info["performance_metrics"]:
-            self.debug_info["performance_metrics"][operation] = []
+        self.performance_stats.record(operation, time.time(), duration)
+        log_event(logger, operation, data)
 
-        self.debug_info["performance_metrics"][operation].append(
-            {
-                "timestamp": timestamp,
-                "data_size": len(str(data)),
-            }
-        )
+    def get_debug_info(self, context: RequestContext = None):
+        """
+        Return comprehensive debug information.
 
-    def get_debug_info(self):
-        """Return comprehensive debug information"""
+        Args:
+            context: Request whose debug information to include, if any
+        """
         return {
-            **self.debug_info,
+            **(context.to_debug_info() if context is not None else {}),
+            "database_info": self.database_info,
+            "performance_metrics": self.performance_stats.summary(),
+            "result_cache": result_cache.get_stats(),
+            "llm_memo": llm_memo.get_stats(),
+            "llm_dedup": distinct_input_rewriter.get_stats(),
+            "llm_pushdown": filter_pushdown_rewriter.get_stats(),
+            "llm_budget": llm_cost_estimator.get_stats(),
+            "result_handles": result_handles.get_stats(),
+            "parallel_chunks": chunked_executor.get_stats(),
+            "jobs": job_queue.get_stats(),
+            "process_pool": process_pool.get_stats(),
             "timestamp": time.time(),
-            "total_operations": sum(
-                len(ops) for ops in self.debug_info["performance_metrics"].values()
-            ),
+            "total_operations": self.performance_stats.total_operations(),
         }
 
     def clear_debug_info(self):
-        """Clear debug information while preserving database info"""
-        database_info = self.debug_info.get("database_info")
-
-        self.debug_info = {
-            "last_prompt": None,
-            "last_generated_query": None,
-            "last_execution_error": None,
-            "last_execution_result": None,
-            "last_openai_response": None,
-            "table_selection_info": None,
-            "performance_metrics": {},
-            "database_info": database_info,
-        }
+        """Clear the aggregated performance metrics while preserving database info"""
+        self.performance_stats.clear()
 
     def fetch_table_names(self):
         """
@@ -158,7 +185,7 @@ class QueryPipelineManager:
                     table_name.upper().startswith(prefix)
                     for prefix in excluded_prefixes
                 ):
-                    logger.debug(f"Excluding system table: {table_name}")
+                    logger.debug("Excluding system table: %s", table_name)
                     continue
 
                 # Skip tables with errors
@@ -178,10 +205,11 @@ class QueryPipelineManager:
                     "table_names": table_names,
                     "execution_time": f"{execution_time:.3f}s",
                 },
+                duration=execution_time,
             )
 
             logger.info(
-                f"Found {len(table_names)} valid tables in {execution_time:.3f}s"
+                "Found %d valid tables in %.3fs", len(table_names), execution_time
             )
             return table_names
 
@@ -196,12 +224,15 @@ class QueryPipelineManager:
 
             return []
 
-    def fetch_table_schema(self, table_names: list[str]):
+    @STAGE_DURATION.time(stage="schema_fetch")
+    def fetch_table_schema(self, table_names: list[str], schema_cache: dict = None):
         """
         Fetch table schemas with improved error handling and validation.
 
         Args:
             table_names: List of table names to get schemas for
+            schema_cache: Optional dict of already fetched schemas by table name,
+                shared across calls (e.g. by all prompts of a batch)
 
         Returns:
             List of dictionaries with table schema information
@@ -220,6 +251,10 @@ class QueryPipelineManager:
                     logger.warning(f"Invalid table name: {table_name}")
                     continue
 
+                if schema_cache is not None and table_name in schema_cache:
+                    table_schemas.append(schema_cache[table_name])
+                    continue
+
                 # Use the existing get_table_schema function
                 schema_result = get_table_schema(table_name)
 
@@ -247,16 +282,17 @@ class QueryPipelineManager:
                             }
                         )
 
-                table_schemas.append(
-                    {
-                        "table_name": table_name,
-                        "schema": schema_data,
-                        "column_count": len(schema_data),
-                    }
-                )
+                table_schema = {
+                    "table_name": table_name,
+                    "schema": schema_data,
+                    "column_count": len(schema_data),
+                }
+                table_schemas.append(table_schema)
+                if schema_cache is not None:
+                    schema_cache[table_name] = table_schema
 
                 logger.debug(
-                    f"Schema fetched for '{table_name}': {len(schema_data)} columns"
+                    "Schema fetched for '%s': %d columns", table_name, len(schema_data)
                 )
 
             except Exception as e:
@@ -267,7 +303,7 @@ class QueryPipelineManager:
 
         self.log_debug(
             "FETCH_TABLE_SCHEMA",
-            {
+            lambda: {
                 "requested_tables": len(table_names),
                 "successful_schemas": len(table_schemas),
                 "execution_time": f"{execution_time:.3f}s",
@@ -276,22 +312,39 @@ class QueryPipelineManager:
                     for schema in table_schemas
                 ],
             },
+            duration=execution_time,
         )
 
         logger.info(
-            f"Fetched schemas for {len(table_schemas)}/{len(table_names)} tables in {execution_time:.3f}s"
+            "Fetched schemas for %d/%d tables in %.3fs",
+            len(table_schemas),
+            len(table_names),
+            execution_time,
         )
         return table_schemas
 
-    def choose_table_based_on_prompt(self, prompt: str):
+    @STAGE_DURATION.time(stage="table_selection")
+    def choose_table_based_on_prompt(
+        self,
+        prompt: str,
+        table_names: list[str] = None,
+        context: RequestContext = None,
+    ):
         """
         Selects the appropriate tables based on the user's prompt.
+
+        Args:
+            prompt: User prompt
+            table_names: Available tables, fetched from the database if not given
+            context: Request context recording the selection
         """
-        logger.debug(f"Starting table selection for prompt: {prompt}")
+        context = context or RequestContext()
+        logger.debug("Starting table selection for prompt: %s", prompt)
 
-        table_names = self.fetch_table_names()
+        if table_names is None:
+            table_names = self.fetch_table_names()
         if not table_names:
-            self.debug_info["table_selection_info"] = {
+            context.table_selection_info = {
                 "available_tables": [],
                 "selected_tables": [],
                 "error": "No tables available",
@@ -311,16 +364,15 @@ class QueryPipelineManager:
         )
 
         try:
-            response = self.openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
+            raw_response = self.llm.complete_text(
+                [
                     {"role": "system", "content": table_selection_prompt},
                     {"role": "user", "content": prompt},
                 ],
+                stage="table_selection",
+                context=context,
             )
-
-            raw_response = response.choices[0].message.content
-            logger.debug(f"OpenAI table selection response: {raw_response}")
+            logger.debug("OpenAI table selection response: %s", raw_response)
 
             # Try to safely evaluate the response
             result = eval(raw_response)
@@ -332,20 +384,21 @@ class QueryPipelineManager:
             else:
                 selected_tables = []
 
-            self.debug_info["table_selection_info"] = {
+            context.table_selection_info = {
                 "available_tables": table_names,
                 "selected_tables": selected_tables,
                 "raw_response": raw_response,
                 "success": True,
             }
 
-            logger.debug(f"Selected tables: {selected_tables}")
+            logger.debug("Selected tables: %s", selected_tables)
             return selected_tables
 
         except Exception as e:
             error_msg = f"Table selection failed: {str(e)}"
             logger.error(error_msg)
-            self.debug_info["table_selection_info"] = {
+            context.record_error(error_msg)
+            context.table_selection_info = {
                 "available_tables": table_names,
                 "selected_tables": table_names,  # fallback
                 "error": error_msg,
@@ -354,39 +407,56 @@ class QueryPipelineManager:
             # If evaluation fails, return all available tables as fallback
             return table_names
 
-    def generate_sql_query(self, prompt: str, selected_tables: list[str] = None):
+    def generate_sql_query(
+        self,
+        prompt: str,
+        selected_tables: list[str] = None,
+        available_tables: list[str] = None,
+        schema_cache: dict = None,
+        context: RequestContext = None,
+    ):
         """
         Generates an SQL query based on the user's prompt and the selected table schema.
+
+        Args:
+            prompt: User prompt
+            selected_tables: Tables chosen by the user, auto-selected if empty
+            available_tables: Pre-fetched table names for auto-selection
+            schema_cache: Shared schema cache, see fetch_table_schema
+            context: Request context recording the generation
         """
-        logger.debug(f"Starting SQL generation for prompt: {prompt}")
-        if selected_tables:
-            logger.debug(f"Using user-selected tables: {selected_tables}")
+        context = context or RequestContext()
+        logger.debug("Starting SQL generation for prompt: %s", prompt)
 
-        self.debug_info["last_prompt"] = prompt
+        context.prompt = prompt
 
         # Use user-selected tables if provided, otherwise auto-select based on prompt
         if selected_tables and len(selected_tables) > 0:
             table_names = selected_tables
-            logger.info(f"Using {len(table_names)} user-selected tables: {table_names}")
-
-            # Log each selected table for debugging
-            for table in table_names:
-                logger.debug(f"User selected table: {table}")
+            logger.info(
+                "Using %d user-selected tables: %s", len(table_names), table_names
+            )
         else:
-            table_names = self.choose_table_based_on_prompt(prompt)
+            with context.timed("table_selection"):
+                table_names = self.choose_table_based_on_prompt(
+                    prompt, available_tables, context
+                )
             logger.info(
-                f"Auto-selected {len(table_names)} tables based on prompt: {table_names}"
+                "Auto-selected %d tables based on prompt: %s",
+                len(table_names),
+                table_names,
             )
 
         if not table_names:
             error_msg = "No tables available. Please upload some data first."
-            self.debug_info["last_execution_error"] = error_msg
+            context.execution_error = error_msg
             return f"SELECT '{error_msg}' AS error_message;"
 
-        table_schema = self.fetch_table_schema(table_names)
+        with context.timed("schema_fetch"):
+            table_schema = self.fetch_table_schema(table_names, schema_cache)
         if not table_schema:
             error_msg = "Could not retrieve table schema. Please check your tables."
-            self.debug_info["last_execution_error"] = error_msg
+            context.execution_error = error_msg
             return f"SELECT '{error_msg}' AS error_message;"
 
         generation_prompt = SYSTEM_GENERATION_PROMPT.format(
@@ -395,7 +465,7 @@ class QueryPipelineManager:
 
         self.log_debug(
             "SQL_GENERATION",
-            {
+            lambda: {
                 "user_prompt": prompt,
                 "selected_tables": table_names,
                 "table_schemas": table_schema,
@@ -407,56 +477,19 @@ class QueryPipelineManager:
         )
 
         try:
-            response = self.openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": generation_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-
-            # Check if response is None
-            if response is None:
-                error_msg = "OpenAI API returned None response"
-                logger.error(error_msg)
-                self.debug_info["last_execution_error"] = error_msg
-                return f"SELECT '{error_msg}' AS error_message;"
-
-            # Check if response has choices
-            if not hasattr(response, "choices") or not response.choices:
-                error_msg = "OpenAI API response has no choices"
-                logger.error(error_msg)
-                self.debug_info["last_execution_error"] = error_msg
-                return f"SELECT '{error_msg}' AS error_message;"
-
-            # Check if first choice has message
-            if (
-                not hasattr(response.choices[0], "message")
-                or response.choices[0].message is None
+            with (
+                STAGE_DURATION.time(stage="llm_generation"),
+                context.timed("llm_generation"),
             ):
-                error_msg = "OpenAI API response choice has no message"
-                logger.error(error_msg)
-                self.debug_info["last_execution_error"] = error_msg
-                return f"SELECT '{error_msg}' AS error_message;"
-
-            # Check if message has content
-            if (
-                not hasattr(response.choices[0].message, "content")
-                or response.choices[0].message.content is None
-            ):
-                error_msg = "OpenAI API response message has no content"
-                logger.error(error_msg)
-                self.debug_info["last_execution_error"] = error_msg
-                return f"SELECT '{error_msg}' AS error_message;"
-
-            generated_query = response.choices[0].message.content.strip()
-
-            # Check if generated query is empty
-            if not generated_query:
-                error_msg = "OpenAI API returned empty query content"
-                logger.error(error_msg)
-                self.debug_info["last_execution_error"] = error_msg
-                return f"SELECT '{error_msg}' AS error_message;"
+                response = self.llm.complete(
+                    [
+                        {"role": "system", "content": generation_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stage="sql_generation",
+                    context=context,
+                )
+            generated_query = self.llm.extract_content(response)
 
             # Clean up any markdown code blocks if they somehow got through
             if generated_query.startswith("```sql"):
@@ -466,7 +499,7 @@ class QueryPipelineManager:
             elif generated_query.startswith("```"):
                 generated_query = generated_query.replace("```", "").strip()
 
-            self.debug_info["last_openai_response"] = {
+            context.openai_response = {
                 "model": "gpt-4o",
                 "prompt_tokens": response.usage.prompt_tokens
                 if hasattr(response, "usage") and response.usage
@@ -477,33 +510,39 @@ class QueryPipelineManager:
                 "raw_response": generated_query,
             }
 
-            self.debug_info["last_generated_query"] = generated_query
+            context.generated_query = generated_query
 
-            logger.info(
-                f"Generated SQL query: {generated_query[:200]}{'...' if len(generated_query) > 200 else ''}"
-            )
-            logger.debug(f"Full generated SQL query: {generated_query}")
+            logger.info("Generated SQL query: %.200s", generated_query)
+            logger.debug("Full generated SQL query: %s", generated_query)
 
             return generated_query
 
-        except Exception as e:
+        except LLMError as e:
             error_msg = f"SQL generation failed: {str(e)}"
             logger.error(error_msg)
             logger.error(f"Full traceback: {traceback.format_exc()}")
-            self.debug_info["last_execution_error"] = error_msg
-            return f"SELECT '{error_msg}' AS error_message;"
+            context.execution_error = error_msg
+            context.record_error(error_msg)
+            raise
 
     def regenerate_sql_query(
-        self, prompt: str, generated_query: str, selected_tables: list[str] = None
+        self,
+        prompt: str,
+        generated_query: str,
+        selected_tables: list[str] = None,
+        context: RequestContext = None,
     ):
         """
         Regenerates an SQL query based on the user's prompt and the generated query.
         """
+        context = context or RequestContext()
+        context.prompt = prompt
+
         # Use user-selected tables if provided, otherwise auto-select based on prompt
         if selected_tables and len(selected_tables) > 0:
             table_names = selected_tables
         else:
-            table_names = self.choose_table_based_on_prompt(prompt)
+            table_names = self.choose_table_based_on_prompt(prompt, context=context)
 
         if not table_names:
             return "SELECT 'No tables available. Please upload some data first.' AS error_message;"
@@ -525,9 +564,8 @@ class QueryPipelineManager:
         generation_prompt = SYSTEM_GENERATION_PROMPT.format(
             table_name=formatted_table_names, table_schema=formatted_schema
         )
-        response = self.openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        return self.llm.complete_text(
+            [
                 {"role": "system", "content": generation_prompt},
                 {
                     "role": "system",
@@ -536,28 +574,36 @@ class QueryPipelineManager:
                 {"role": "user", "content": prompt},
                 {"role": "user", "content": generated_query},
             ],
+            stage="sql_regeneration",
+            context=context,
         )
-        return response.choices[0].message.content
 
-    def generate_pipeline_for_query(self, query: str):
+    def generate_pipeline_for_query(self, query: str, context: RequestContext = None):
         """
         Generates a query execution pipeline based on the SQL query.
         """
-        response = self.openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        content = self.llm.complete_text(
+            [
                 {"role": "system", "content": SYSTEM_PIPELINE_GENERATION},
                 {"role": "user", "content": query},
             ],
+            stage="pipeline_generation",
+            context=context,
             response_format={"type": "json_object"},
         )
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
 
-    def execute_sql_query(self, query: str):
+    @STAGE_DURATION.time(stage="sql_execution")
+    def execute_sql_query(self, query: str, context: RequestContext = None):
         """
         Executes the SQL query on the database and returns the results.
+
+        Args:
+            query: SQL query to execute
+            context: Request context recording the execution result or error
         """
-        logger.debug(f"Executing SQL query: {query}")
+        context = context or RequestContext()
+        logger.debug("Executing SQL query: %s", query)
 
         self.log_debug(
             "SQL_EXECUTION",
@@ -569,10 +615,6 @@ class QueryPipelineManager:
         )
 
         try:
-            # Clear previous execution info
-            self.debug_info["last_execution_error"] = None
-            self.debug_info["last_execution_result"] = None
-
             start_time = time.time()
 
             # Check if this is a FlockMTL query (contains llm_ functions)
@@ -584,25 +626,90 @@ class QueryPipelineManager:
             if is_flockmtl_query:
                 logger.info("Detected FlockMTL query - setting higher timeout")
 
-            results = self.conn.execute(query)
-            rows = results.fetchall()
-            columns = [column[0] for column in results.description]
+            # Run on a pooled cursor so concurrent requests never share a connection
+            # Requests asking for it also keep DuckDB's profile of the query
+            profile_query = context.trace is not None and context.trace.profile_queries
+            read_only = is_read_only_query(query)
+            profile = None
+            with (
+                context.timed("sql_execution"),
+                cursor_pool.cursor() as cursor,
+                context.interruptible(cursor),
+            ):
+                # Read-only results are reused until a table they read changes
+                cache_key = result_cache.make_key(cursor, query) if read_only else None
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    columns, execution_result = cached
+                else:
+                    query_to_run = query
+                    chunks = None
+                    if read_only and is_flockmtl_query:
+                        # Calls run on fewer rows, reusing earlier outputs, and
+                        # queries over the LLM budget are sampled or rejected
+                        query_to_run, context.rewrites, context.llm_estimate = (
+                            plan_query(cursor, query)
+                        )
+                        context.check_cancelled()
+                        if context.llm_estimate and "sampled" in context.llm_estimate:
+                            # A sample is not the query's result; never serve it
+                            # from the cache
+                            cache_key = None
+                        # Queries calling the model for many rows run as parallel
+                        # chunks, each optimized on its own
+                        chunks = chunked_executor.plan(
+                            cursor, query, context.llm_estimate
+                        )
+                        if chunks is None:
+                            query_to_run, memo_rewrites = rewrite_query(
+                                cursor, query_to_run, EXECUTION_REWRITERS
+                            )
+                            context.rewrites += memo_rewrites
+                    if chunks is not None:
+                        table, context.chunks = chunked_executor.run(
+                            cursor, chunks, context
+                        )
+                        # Rows of failed chunks are missing, so never cache them
+                        partial = any(
+                            entry["status"] == "failed" for entry in context.chunks
+                        )
+                        columns, execution_result = result_cache.fetch_table(
+                            table, None if partial else cache_key
+                        )
+                    else:
+                        profiler = profiled(cursor) if profile_query else nullcontext()
+                        context.check_cancelled()
+                        with profiler as profile:
+                            results = cursor.execute(query_to_run)
+                            columns, execution_result = result_cache.fetch(
+                                results, cache_key
+                            )
             end_time = time.time()
+            context.profile = profile or None
 
-            execution_result = [dict(zip(columns, row)) for row in rows]
+            if not read_only:
+                # The statement may have changed any table
+                catalog_versions.bump()
 
-            self.debug_info["last_execution_result"] = {
+            context.execution_result = {
                 "rows_returned": len(execution_result),
                 "columns": columns,
                 "execution_time_seconds": end_time - start_time,
                 "sample_data": execution_result[:3] if execution_result else [],
                 "success": True,
                 "is_flockmtl_query": is_flockmtl_query,
+                "cached": cached is not None,
+                "rewrites": context.rewrites,
+                "llm_estimate": context.llm_estimate,
+                "chunks": context.chunks,
+                "partial": any(
+                    entry["status"] == "failed" for entry in context.chunks or []
+                ),
             }
 
             self.log_debug(
                 "SQL_EXECUTION_SUCCESS",
-                {
+                lambda: {
                     "rows_returned": len(execution_result),
                     "columns": columns,
                     "execution_time": f"{end_time - start_time:.3f}s",
@@ -610,7 +717,10 @@ class QueryPipelineManager:
                     if execution_result
                     else "No data",
                     "is_flockmtl_query": is_flockmtl_query,
+                    "cached": cached is not None,
+                    "rewrites": context.rewrites,
                 },
+                duration=end_time - start_time,
             )
 
             return execution_result
@@ -621,6 +731,9 @@ class QueryPipelineManager:
 
             # Enhanced error classification
             error_type = type(e).__name__
+            is_budget_error = isinstance(e, LLMBudgetExceeded)
+            if is_budget_error:
+                context.llm_estimate = e.estimate
             is_timeout_error = any(
                 keyword in error_msg.lower()
                 for keyword in ["timeout", "connection", "socket", "network", "hang up"]
@@ -637,24 +750,31 @@ class QueryPipelineManager:
                 "execution_time_seconds": execution_time,
                 "is_timeout_error": is_timeout_error,
                 "is_flockmtl_error": is_flockmtl_error,
+                "is_budget_error": is_budget_error,
+                "llm_estimate": context.llm_estimate,
                 "traceback": traceback.format_exc(),
             }
 
-            self.debug_info["last_execution_error"] = error_details
+            context.execution_error = error_details
+            context.record_error(error_msg)
 
             logger.error(f"SQL execution failed: {error_msg}")
             logger.error(f"Execution time: {execution_time:.3f}s")
             logger.error(f"Error type: {error_type}")
             logger.error(f"Is timeout error: {is_timeout_error}")
             logger.error(f"Is FlockMTL error: {is_flockmtl_error}")
-            logger.debug(f"Full traceback: {traceback.format_exc()}")
+            logger.debug("Full traceback", exc_info=True)
 
             self.log_debug("SQL_EXECUTION_ERROR", error_details)
 
             # Create a more user-friendly error message
-            user_friendly_error = self._create_user_friendly_error_message(
-                error_msg, error_type, is_timeout_error, is_flockmtl_error
-            )
+            if is_budget_error:
+                # The message already explains the estimate and the budget
+                user_friendly_error = error_msg
+            else:
+                user_friendly_error = self._create_user_friendly_error_message(
+                    error_msg, error_type, is_timeout_error, is_flockmtl_error
+                )
 
             # Create a new exception with the user-friendly message
             raise Exception(user_friendly_error)
@@ -710,24 +830,47 @@ class QueryPipelineManager:
         # If none of the patterns match, return a generic friendly message with the original error
         return f"Query execution failed: {original_error}. Please check your query and data, then try again."
 
-    def generate_response_table(self, prompt: str, selected_tables: list[str] = None):
+    def generate_response_table(
+        self,
+        prompt: str,
+        selected_tables: list[str] = None,
+        include_debug: bool = False,
+        available_tables: list[str] = None,
+        schema_cache: dict = None,
+        context: RequestContext = None,
+        progressive: bool = False,
+    ):
         """
         Generates a response table based on the user's prompt.
+
+        Args:
+            prompt: User prompt
+            selected_tables: Tables chosen by the user, auto-selected if empty
+            include_debug: Whether to embed full debug information in the result;
+                a compact timing summary is always included
+            available_tables: Pre-fetched table names, see generate_sql_query
+            schema_cache: Shared schema cache, see fetch_table_schema
+            context: Request context, a new one is created if not given
+            progressive: Return a preview computed on a sample of the tables,
+                with the full result delivered through a result handle
         """
-        logger.info("=== STARTING RESPONSE TABLE GENERATION ===")
-        logger.info(f"Prompt: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
-        logger.info(f"Selected tables from frontend: {selected_tables}")
+        context = context or RequestContext()
         logger.info(
-            f"Number of selected tables: {len(selected_tables) if selected_tables else 0}"
+            "Starting response table generation for prompt: %.100s "
+            "(selected tables: %s)",
+            prompt,
+            selected_tables or [],
         )
 
-        if selected_tables:
-            logger.debug(f"Using selected tables: {selected_tables}")
-
         try:
-            query = self.generate_sql_query(prompt, selected_tables)
+            query = self.generate_sql_query(
+                prompt, selected_tables, available_tables, schema_cache, context
+            )
             time_start = time.time()
-            table = self.execute_sql_query(query)
+            if progressive:
+                table, preview = self.execute_progressively(query, context)
+            else:
+                table, preview = self.execute_sql_query(query, context), None
             time_end = time.time()
 
             result = {
@@ -736,8 +879,16 @@ class QueryPipelineManager:
                 "table": table,
                 "execution_time": round(time_end - time_start, 3),
                 "selected_tables": selected_tables or [],
-                "debug_info": self.get_debug_info(),
+                "timings": context.timing_summary(),
             }
+            if context.llm_estimate is not None:
+                result["llm_estimate"] = context.llm_estimate
+            if context.chunks is not None:
+                result["chunks"] = context.chunks
+            if preview is not None:
+                result["progressive"] = preview
+            if include_debug:
+                result["debug_info"] = self.get_debug_info(context)
 
             self.log_debug(
                 "RESPONSE_TABLE_SUCCESS",
@@ -747,17 +898,26 @@ class QueryPipelineManager:
                     "table_rows": len(table),
                     "execution_time": f"{time_end - time_start:.3f}s",
                 },
+                duration=time_end - time_start,
             )
 
             return result
 
         except Exception as e:
             error_msg = str(e)
-            debug_info = self.get_debug_info() or {}
-            execution_debug = debug_info.get("last_execution_error") or {}
+            execution_debug = context.execution_error or {}
 
             # Enhanced error message based on error type
-            if isinstance(execution_debug, dict) and execution_debug.get(
+            if isinstance(e, LLMError):
+                user_friendly_error = (
+                    "The language model request failed. Please check your OpenAI "
+                    "configuration or try again in a moment."
+                )
+            elif isinstance(execution_debug, dict) and execution_debug.get(
+                "is_budget_error"
+            ):
+                user_friendly_error = execution_debug["error_message"]
+            elif isinstance(execution_debug, dict) and execution_debug.get(
                 "is_timeout_error"
             ):
                 user_friendly_error = (
@@ -779,17 +939,14 @@ class QueryPipelineManager:
             logger.error(f"Response table generation failed: {error_msg}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
 
-            return {
+            result = {
                 "prompt": prompt,
-                "query": self.debug_info.get(
-                    "last_generated_query", "Query generation failed"
-                ),
+                "query": context.generated_query or "Query generation failed",
                 "table": [{"error": user_friendly_error}],
                 "execution_time": execution_debug.get("execution_time_seconds", 0)
                 if isinstance(execution_debug, dict)
                 else 0,
                 "selected_tables": selected_tables or [],
-                "debug_info": debug_info,
                 "error": {
                     "message": user_friendly_error,
                     "technical_details": error_msg,
@@ -797,37 +954,230 @@ class QueryPipelineManager:
                     if isinstance(execution_debug, dict)
                     else type(e).__name__,
                 },
+                "timings": context.timing_summary(),
             }
+            if context.llm_estimate is not None:
+                result["llm_estimate"] = context.llm_estimate
+            if include_debug:
+                result["debug_info"] = self.get_debug_info(context)
+            return result
+
+    def generate_response_table_batch(
+        self,
+        prompts: list[str],
+        selected_tables: list[str] = None,
+        max_concurrency: int = None,
+    ):
+        """
+        Generates response tables for many prompts, yielding each result as it finishes.
+
+        Shared work is done once per batch: duplicate prompts are computed once,
+        available table names are fetched once and table schemas are cached
+        across prompts. Every distinct prompt gets its own request context.
+        Prompts run concurrently; LLM calls are bounded by the
+        LLM client's global rate limit and executions by the cursor pool.
+
+        Args:
+            prompts: User prompts
+            selected_tables: Tables chosen by the user, applied to every prompt
+            max_concurrency: Number of prompts processed at once
 
-    def generate_input_query_response_table(self, query: str):
+        Yields:
+            Result dictionaries with the index of the originating prompt
+        """
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+        # Group duplicate prompts so each distinct prompt runs once
+        indices_by_prompt: dict[str, list[int]] = {}
+        first_prompt: dict[str, str] = {}
+        for index, prompt in enumerate(prompts):
+            key = normalize_prompt(prompt)
+            indices_by_prompt.setdefault(key, []).append(index)
+            first_prompt.setdefault(key, prompt)
+
+        schema_cache: dict = {}
+        available_tables = None
+        if selected_tables:
+            self.fetch_table_schema(selected_tables, schema_cache)
+        else:
+            available_tables = self.fetch_table_names()
+
+        logger.info(
+            "Running batch of %d prompts (%d distinct, concurrency %d)",
+            len(prompts),
+            len(indices_by_prompt),
+            max_concurrency,
+        )
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, max_concurrency), thread_name_prefix="batch"
+        )
+        try:
+            # Each prompt runs in a copy of the caller's context so usage is
+            # still attributed to the batch endpoint
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.generate_response_table,
+                    first_prompt[key],
+                    selected_tables,
+                    False,
+                    available_tables,
+                    schema_cache,
+                ): key
+                for key in indices_by_prompt
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                for index in indices_by_prompt[futures[future]]:
+                    yield {**result, "index": index, "prompt": prompts[index]}
+        finally:
+            # Stop queued prompts if the client went away mid-stream
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_input_query_response_table(
+        self, query: str, context: RequestContext = None, progressive: bool = False
+    ):
         """
         Generates a response table based on the user's query.
+
+        With progressive, the table is a preview and the full result is
+        delivered through a result handle, see execute_progressively.
         """
+        context = context or RequestContext()
         time_start = time.time()
-        table = self.execute_sql_query(query)
+        if progressive:
+            table, preview = self.execute_progressively(query, context)
+        else:
+            table, preview = self.execute_sql_query(query, context), None
         time_end = time.time()
-        return {
+        result = {
             "query": query,
             "table": table,
             "execution_time": round(time_end - time_start, 3),
+            "llm_estimate": context.llm_estimate,
         }
+        if preview is not None:
+            result["progressive"] = preview
+        return result
 
-    def generate_query_plan(self, query: str):
+    def execute_progressively(self, query: str, context: RequestContext = None):
+        """
+        Preview a query on a sample of its tables and run it in full in the background.
+
+        The preview reads PROGRESSIVE_SAMPLE_ROWS rows of each base table, so
+        it returns within seconds however large the tables (and however many
+        LLM calls the full query makes). The full query starts first and its
+        result is kept in the result handle store, unless too many full runs
+        are pending already (the preview then has no result handle).
+
+        Args:
+            query: SQL query to execute
+            context: Request context recording the preview's execution
+
+        Returns:
+            The preview rows, and a dictionary with the result handle of the
+            full run; None instead of the dictionary if the query could not
+            be sampled and was executed in full right away
+        """
+        context = context or RequestContext()
+        sampled = None
+        if is_read_only_query(query):
+            # Seeded, so the estimate and a repeated preview see the same rows
+            sampled = sample_tables(
+                query.strip().rstrip(";"),
+                f"TABLESAMPLE {self.preview_sample_rows} ROWS (reservoir, 42)",
+            )
+        if sampled is None:
+            return self.execute_sql_query(query, context), None
+
+        preview = {
+            "preview": True,
+            "sample_rows_per_table": self.preview_sample_rows,
+        }
+        try:
+            preview["result_handle"] = result_handles.submit(
+                self._execute_in_background, query
+            )
+        except TooManyPending as e:
+            # Only the preview is returned; the client can ask again later
+            logger.warning(f"Full run not started: {e}")
+            preview["result_handle"] = None
+            preview["full_run_error"] = str(e)
+        try:
+            table = self.execute_sql_query(sampled, context)
+        except Exception as e:
+            # The full run is independent, its outcome is behind the handle
+            logger.warning(f"Query preview failed: {e}")
+            table = []
+            preview["preview_error"] = str(e)
+        return table, preview
+
+    def _execute_in_background(self, query: str, context: RequestContext) -> dict:
+        """Execute a query in full for a result handle."""
+        time_start = time.time()
+        table = self.execute_sql_query(query, context)
+        return {
+            "query": query,
+            "table": table,
+            "execution_time": round(time.time() - time_start, 3),
+            "llm_estimate": context.llm_estimate,
+            "chunks": context.chunks,
+        }
+
+    def generate_query_plan(self, query: str, context: RequestContext = None):
         """
         Generates a query plan based on the user's query.
         """
-        pipeline = self.generate_pipeline_for_query(query)
-        return {"query": query, "pipeline": pipeline}
+        pipeline = self.generate_pipeline_for_query(query, context)
+        return {
+            "query": query,
+            "pipeline": pipeline,
+            **self.analyze_query(query),
+        }
+
+    def analyze_query(self, query: str) -> dict:
+        """
+        Report the optimizer rewrites and the LLM cost of executing a query.
+
+        No model is called, so this is cheap enough to run before deciding
+        whether to execute the query at all.
+
+        Args:
+            query: SQL query
+
+        Returns:
+            Dictionary with the rewrite report entries ("rewrites", empty if
+            the query is not a read-only FlockMTL query or could not be
+            analyzed) and the estimate ("estimate", None if not available)
+        """
+        if not is_read_only_query(query):
+            return {"rewrites": [], "estimate": None}
+        try:
+            with cursor_pool.cursor() as cursor:
+                rewrites, estimate = analyze_query(cursor, query)
+        except Exception as e:
+            logger.warning("Could not analyze query rewrites: %s", e)
+            return {"rewrites": [], "estimate": None}
+        return {"rewrites": rewrites, "estimate": estimate}
 
     def regenerate_response_table(
-        self, prompt: str, generated_query: str, selected_tables: list[str] = None
+        self,
+        prompt: str,
+        generated_query: str,
+        selected_tables: list[str] = None,
+        context: RequestContext = None,
     ):
         """
         Regenerates the response table based on the user's prompt and the generated query.
         """
-        query = self.regenerate_sql_query(prompt, generated_query, selected_tables)
+        context = context or RequestContext()
+        query = self.regenerate_sql_query(
+            prompt, generated_query, selected_tables, context
+        )
         time_start = time.time()
-        table = self.execute_sql_query(query)
+        table = self.execute_sql_query(query, context)
         time_end = time.time()
         return {
             "prompt": prompt,
@@ -837,11 +1187,13 @@ class QueryPipelineManager:
             "selected_tables": selected_tables or [],
         }
 
-    def refine_query_based_on_pipeline(self, query: str, pipeline: dict):
+    def refine_query_based_on_pipeline(
+        self, query: str, pipeline: dict, context: RequestContext = None
+    ):
         """
         Refines the SQL query based on the pipeline and user prompt.
         """
-        table_names = self.choose_table_based_on_prompt(query)
+        table_names = self.choose_table_based_on_prompt(query, context=context)
         if not table_names:
             return "SELECT 'No tables available. Please upload some data first.' AS error_message;"
 
@@ -862,9 +1214,8 @@ class QueryPipelineManager:
         generation_prompt = SYSTEM_GENERATION_PROMPT.format(
             table_name=formatted_table_names, table_schema=formatted_schema
         )
-        response = self.openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        return self.llm.complete_text(
+            [
                 {"role": "system", "content": generation_prompt},
                 {
                     "role": "system",
@@ -873,22 +1224,27 @@ class QueryPipelineManager:
                     ),
                 },
             ],
+            stage="query_refinement",
+            context=context,
         )
 
-        return response.choices[0].message.content
-
     def run_pipeline_with_refinement(
-        self, query: str, pipeline: dict, original_prompt: str = ""
+        self,
+        query: str,
+        pipeline: dict,
+        original_prompt: str = "",
+        context: RequestContext = None,
     ):
         """
         Runs the pipeline by refining the query based on the pipeline and re-executing it.
         """
-        new_query = self.refine_query_based_on_pipeline(query, pipeline)
+        context = context or RequestContext()
+        new_query = self.refine_query_based_on_pipeline(query, pipeline, context)
         time_start = time.time()
-        table = self.execute_sql_query(new_query)
+        table = self.execute_sql_query(new_query, context)
         time_end = time.time()
 
-        new_pipeline = self.generate_pipeline_for_query(new_query)
+        new_pipeline = self.generate_pipeline_for_query(new_query, context)
         return {
             "prompt": original_prompt,  # Include the original prompt in response
             "query": new_query,
@@ -897,14 +1253,15 @@ class QueryPipelineManager:
             "pipeline": new_pipeline,
         }
 
-    def generate_plot_config(self, prompt: str, table: any):
+    def generate_plot_config(
+        self, prompt: str, table: any, context: RequestContext = None
+    ):
         """
         Generates a plot configuration based on the user's prompt and the table data.
         """
 
-        response = self.openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        content = self.llm.complete_text(
+            [
                 {
                     "role": "system",
                     "content": SYSTEM_PLOT_CONFIG.format(
@@ -912,7 +1269,9 @@ class QueryPipelineManager:
                     ),
                 }
             ],
+            stage="plot_config",
+            context=context,
             response_format={"type": "json_object"},
         )
 
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
@@ -0,0 +1,103 @@
+import logging
+from typing import Optional
+
+from app.internal.llm_dedup import distinct_input_rewriter
+from app.internal.llm_estimator import llm_cost_estimator
+from app.internal.llm_memo import llm_memo
+from app.internal.llm_pushdown import filter_pushdown_rewriter
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rewrites that only restructure the query, in the order they are applied:
+# calls are first moved after the cheap filters, then deduplicated over the
+# rows that remain
+PLAN_REWRITERS = (filter_pushdown_rewriter, distinct_input_rewriter)
+
+# Rewrites that may call models themselves (the memo computes missing
+# outputs up front), so they only run once the query is within its budget;
+# the memo memoizes the calls in their final (e.g. deduplicated) form
+EXECUTION_REWRITERS = (llm_memo,)
+
+
+def rewrite_query(cursor, query: str, rewriters=PLAN_REWRITERS):
+    """
+    Apply LLM call optimizations to a read-only FlockMTL query.
+
+    Each rewriter leaves the query unchanged when it does not apply or
+    fails, so the result always computes the same rows as the original.
+
+    Args:
+        cursor: DuckDB cursor the query will run on
+        query: Read-only SQL query
+        rewriters: Rewriters to apply, in order
+
+    Returns:
+        The query to run and the report entries of every rewriter
+    """
+    rewrites = []
+    for rewriter in rewriters:
+        query, report = rewriter.rewrite(cursor, query)
+        rewrites.extend(report)
+    return query, rewrites
+
+
+def plan_query(cursor, query: str) -> tuple[str, list[dict], Optional[dict]]:
+    """
+    Restructure a read-only FlockMTL query and check it against the LLM budget.
+
+    No model is called; the memo is applied by prepare_query().
+
+    Args:
+        cursor: DuckDB cursor the query will run on
+        query: Read-only SQL query
+
+    Returns:
+        The query to run, the rewrite report entries and the LLM cost
+        estimate (None if it could not be made)
+
+    Raises:
+        LLMBudgetExceeded: If the query is over the budget
+    """
+    query, rewrites = rewrite_query(cursor, query)
+    query, estimate = llm_cost_estimator.check(cursor, query)
+    return query, rewrites, estimate
+
+
+def prepare_query(cursor, query: str) -> tuple[str, list[dict], Optional[dict]]:
+    """
+    Optimize a read-only FlockMTL query and check it against the LLM budget.
+
+    Args:
+        cursor: DuckDB cursor the query will run on
+        query: Read-only SQL query
+
+    Returns:
+        The query to run, the rewrite report entries and the LLM cost
+        estimate (None if it could not be made)
+
+    Raises:
+        LLMBudgetExceeded: If the query is over the budget
+    """
+    query, rewrites, estimate = plan_query(cursor, query)
+    query, memo_rewrites = rewrite_query(cursor, query, EXECUTION_REWRITERS)
+    return query, rewrites + memo_rewrites, estimate
+
+
+def analyze_query(cursor, query: str) -> tuple[list[dict], Optional[dict]]:
+    """
+    Report the rewrites and LLM cost estimate execution would produce.
+
+    Only the rewriters that restructure the query run, so no model is called.
+
+    Returns:
+        The rewrite report entries and the estimate (None if it could not
+        be made)
+    """
+    query, rewrites = rewrite_query(cursor, query)
+    try:
+        estimate = llm_cost_estimator.estimate(cursor, query)
+    except Exception as e:
+        logger.warning("LLM cost estimate failed: %s", e)
+        estimate = None
+    return rewrites, estimate
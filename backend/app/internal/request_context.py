@@ -0,0 +1,295 @@
+import time
+import uuid
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from app.internal.usage import current_endpoint
+from app.internal.tracing import current_trace, truncate_text
+
+
+# Requests in flight by request ID and trace ID, for progress lookups; an
+# entry is removed by finish(), or once nothing holds on to its context
+_active_contexts: "weakref.WeakValueDictionary[str, RequestContext]" = (
+    weakref.WeakValueDictionary()
+)
+_active_lock = threading.Lock()
+
+
+class RequestCancelled(Exception):
+    """Raised when a request is cancelled before or while running SQL."""
+
+
+class RequestContext:
+    """
+    Execution state of a single pipeline request.
+
+    One context is created per request and passed through the pipeline
+    methods, so everything a request learns along the way (prompt, selected
+    tables, generated SQL, execution result or error, stage timings and LLM
+    usage) stays with that request instead of on the shared pipeline manager.
+    Contexts created while an HTTP request is being traced are attached to
+    its trace and persisted to the trace store when the request completes.
+    """
+
+    def __init__(self, request_id: Optional[str] = None, endpoint: str = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.endpoint = endpoint or current_endpoint()
+        self.started_at = time.time()
+        self.trace = current_trace.get()
+        self.trace_id = self.trace.trace_id if self.trace is not None else None
+
+        self.prompt: Optional[str] = None
+        self.generated_query: Optional[str] = None
+        self.table_selection_info: Optional[dict] = None
+        self.openai_response: Optional[dict] = None
+        self.execution_result: Optional[dict] = None
+        self.execution_error: Any = None
+        self.profile: Optional[dict] = None
+        # Optimizer rewrites applied to the generated SQL before it ran
+        self.rewrites: list[dict] = []
+        # Predicted LLM calls, tokens and cost of the executed SQL
+        self.llm_estimate: Optional[dict] = None
+        # Progress of the parallel chunks the SQL ran in, if it was split
+        self.chunks: Optional[list[dict]] = None
+
+        self.timings: dict[str, float] = {}
+        self.llm_calls: list[dict] = []
+        self.errors: list[str] = []
+        # LLM calls may be recorded from helper threads (e.g. hedged requests)
+        self._lock = threading.Lock()
+        # Set by cancel(), which also interrupts the statements now running
+        self.cancelled = False
+        self._running_cursors: list = []
+        # Pipeline stage now running, see timed()
+        self.stage: Optional[str] = None
+
+        if self.trace is not None:
+            self.trace.add_context(self)
+        with _active_lock:
+            _active_contexts[self.request_id] = self
+            if self.trace_id is not None:
+                # The request's own context, not background work it started
+                _active_contexts.setdefault(self.trace_id, self)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Add the wall time of the enclosed block to the stage's timing."""
+        start_time = time.perf_counter()
+        previous_stage, self.stage = self.stage, stage
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.stage = previous_stage
+            with self._lock:
+                self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    @contextmanager
+    def interruptible(self, cursor):
+        """
+        Let cancel() interrupt the statements run on cursor in the enclosed block.
+
+        Raises:
+            RequestCancelled: If the request was already cancelled
+        """
+        with self._lock:
+            self.check_cancelled()
+            self._running_cursors.append(cursor)
+        try:
+            yield cursor
+        finally:
+            with self._lock:
+                self._running_cursors.remove(cursor)
+
+    def check_cancelled(self):
+        """
+        Stop the request if it was cancelled; called before each statement.
+
+        DuckDB ignores an interrupt on a cursor that is not running a
+        statement, so a cancel() arriving between two statements is only
+        seen here.
+
+        Raises:
+            RequestCancelled: If the request was cancelled
+        """
+        if self.cancelled:
+            raise RequestCancelled("Request was cancelled")
+
+    def cancel(self):
+        """
+        Cancel the request, interrupting any DuckDB statement it is running.
+
+        Statements not yet started are stopped by check_cancelled().
+        """
+        with self._lock:
+            self.cancelled = True
+            cursors = list(self._running_cursors)
+        for cursor in cursors:
+            cursor.interrupt()
+
+    def progress(self) -> dict:
+        """
+        Snapshot of how far the request has got, taken while it runs.
+
+        The percentage comes from DuckDB's query_progress() of the statements
+        now running (averaged over parallel chunks, finished ones counting as
+        complete). DuckDB only reports a percentage, so rows processed are
+        counted from finished chunks, or otherwise estimated from the
+        percentage and the planner's row estimate (rows_estimated is True).
+        """
+        with self._lock:
+            cursors = list(self._running_cursors)
+            timings = {stage: round(value, 3) for stage, value in self.timings.items()}
+        running = [
+            percentage
+            for percentage in (cursor.query_progress() for cursor in cursors)
+            if percentage >= 0
+        ]
+        chunks = self.chunks
+        rows_processed, rows_estimated = None, False
+        if chunks:
+            finished = sum(entry["status"] in ("done", "failed") for entry in chunks)
+            percentage = min((100.0 * finished + sum(running)) / len(chunks), 100.0)
+            rows_processed = sum(entry["rows"] or 0 for entry in chunks)
+        else:
+            percentage = max(running) if running else None
+            plan_rows = (self.llm_estimate or {}).get("plan_rows")
+            if percentage is not None and plan_rows:
+                rows_processed = round(plan_rows * percentage / 100)
+                rows_estimated = True
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "stage": self.stage,
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            "percentage": round(percentage, 1) if percentage is not None else None,
+            "rows_processed": rows_processed,
+            "rows_estimated": rows_estimated,
+            "chunks": [entry["status"] for entry in chunks] if chunks else None,
+            "completed_stages": timings,
+            "cancelled": self.cancelled,
+        }
+
+    def finish(self):
+        """Mark the request as finished, which ends progress reports for it."""
+        with _active_lock:
+            for key in (self.request_id, self.trace_id):
+                if key is not None and _active_contexts.get(key) is self:
+                    del _active_contexts[key]
+
+    def record_llm_call(self, call: dict):
+        """Attach one LLM call, as returned by UsageTracker.record."""
+        with self._lock:
+            self.llm_calls.append(call)
+
+    def record_error(self, error: str):
+        with self._lock:
+            self.errors.append(error)
+
+    def llm_usage(self) -> dict:
+        """Return the request's LLM usage totals."""
+        with self._lock:
+            calls = list(self.llm_calls)
+        return {
+            "calls": len(calls),
+            "errors": sum(1 for call in calls if call["error"]),
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in calls),
+            "latency_seconds": round(sum(call["latency_seconds"] for call in calls), 6),
+            "estimated_cost_usd": sum(call["estimated_cost_usd"] for call in calls),
+        }
+
+    def timing_summary(self) -> dict:
+        """Return stage timings and the total elapsed time, in seconds."""
+        with self._lock:
+            timings = {stage: round(value, 3) for stage, value in self.timings.items()}
+        timings["total"] = round(time.time() - self.started_at, 3)
+        return timings
+
+    def to_debug_info(self) -> dict:
+        """Return this request's debug information."""
+        with self._lock:
+            timings = {stage: round(value, 6) for stage, value in self.timings.items()}
+            errors = list(self.errors)
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "endpoint": self.endpoint,
+            "started_at": self.started_at,
+            "elapsed_seconds": round(time.time() - self.started_at, 6),
+            "prompt": self.prompt,
+            "generated_query": self.generated_query,
+            "table_selection_info": self.table_selection_info,
+            "openai_response": self.openai_response,
+            "execution_result": self.execution_result,
+            "execution_error": self.execution_error,
+            "rewrites": self.rewrites,
+            "llm_estimate": self.llm_estimate,
+            "chunks": self.chunks,
+            "timings": timings,
+            "llm_usage": self.llm_usage(),
+            "errors": errors,
+        }
+
+    def to_trace(self, text_limit: int) -> dict:
+        """
+        Return this request's trace entry.
+
+        Prompts and queries are truncated to text_limit characters and result
+        rows are left out, so trace entries stay small.
+        """
+        with self._lock:
+            timings = {stage: round(value, 6) for stage, value in self.timings.items()}
+            llm_calls = list(self.llm_calls)
+            errors = [truncate_text(error, text_limit) for error in self.errors]
+        execution_result = self.execution_result
+        if isinstance(execution_result, dict):
+            execution_result = {
+                key: value
+                for key, value in execution_result.items()
+                if key != "sample_data"
+            }
+        execution_error = self.execution_error
+        if isinstance(execution_error, dict):
+            execution_error = {
+                key: truncate_text(value, text_limit)
+                for key, value in execution_error.items()
+            }
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "started_at": self.started_at,
+            "elapsed_seconds": round(time.time() - self.started_at, 6),
+            "prompt": truncate_text(self.prompt, text_limit),
+            "generated_query": truncate_text(self.generated_query, text_limit),
+            "selected_tables": (self.table_selection_info or {}).get("selected_tables"),
+            "timings": timings,
+            "llm_calls": llm_calls,
+            "llm_usage": self.llm_usage(),
+            "execution_result": execution_result,
+            "execution_error": truncate_text(execution_error, text_limit),
+            "rewrites": self.rewrites,
+            "llm_estimate": self.llm_estimate,
+            "chunks": self.chunks,
+            "duckdb_profile": self.profile,
+            "errors": errors,
+        }
+
+
+def request_progress(request_id: str) -> Optional[dict]:
+    """
+    Progress of a request in flight.
+
+    Args:
+        request_id: Request ID, job ID or trace ID (e.g. sent by the client
+            in the X-Trace-Id header)
+
+    Returns:
+        RequestContext.progress() of the request, or None if it is not running
+    """
+    with _active_lock:
+        context = _active_contexts.get(request_id)
+    return context.progress() if context is not None else None
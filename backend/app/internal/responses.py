@@ -0,0 +1,130 @@
+import json
+import uuid
+import hashlib
+import datetime
+from decimal import Decimal
+from typing import Any, Optional
+from uuid import UUID
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.internal.metrics import STAGE_DURATION
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is a declared dependency
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy comes with pandas
+    np = None
+
+
+def json_default(obj: Any) -> Any:
+    """
+    Convert values the JSON serializer does not handle natively.
+
+    Covers the Python types DuckDB returns (Decimal, INTERVAL as timedelta,
+    BLOB as bytes, ...) plus NumPy values and Pydantic models, matching what
+    FastAPI's jsonable_encoder would produce for them.
+    """
+    if isinstance(obj, Decimal):
+        # Same rule as jsonable_encoder: integral decimals become ints
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode(errors="replace")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    if hasattr(obj, "isoformat"):
+        # pandas Timestamp and similar
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        """Serialize content to JSON bytes."""
+        return orjson.dumps(content, default=json_default, option=_ORJSON_OPTIONS)
+
+else:
+
+    def dumps(content: Any) -> bytes:
+        """Serialize content to JSON bytes."""
+        return json.dumps(
+            content,
+            default=json_default,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response serialized with orjson, timed in the stage metrics.
+
+    Endpoints returning large results should return an instance directly:
+    FastAPI then skips jsonable_encoder, which otherwise walks every row
+    before the response class gets to serialize it.
+    """
+
+    def render(self, content) -> bytes:
+        with STAGE_DURATION.time(stage="serialization"):
+            return dumps(content)
+
+
+# Changes on every restart: catalog versions start from zero again, so
+# ETags from a previous process must not match
+_ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a weak ETag from the values a response is derived from.
+
+    Callers pass catalog versions plus any request parameters that change the
+    payload (e.g. a preview limit). The tag is weak because compression
+    changes the bytes on the wire but not the content.
+    """
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{_ETAG_EPOCH}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    """Headers making clients revalidate with If-None-Match on every request."""
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    """Build an empty 304 response for a matching If-None-Match."""
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,320 @@
+import os
+import re
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from app.internal.catalog import catalog_versions, normalize_sql
+from app.internal.metrics import Counter, register_gauge_callback, registry
+from app.internal.sql_rewrite import VOLATILE_FUNCTIONS
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is a declared dependency
+    pa = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+
+# Catalog listings, whose results change without their tables being bumped
+_CATALOG_SOURCES = re.compile(
+    r"\b(information_schema|pg_catalog|duckdb_\w+|pragma_\w+|sqlite_master)\b",
+    re.IGNORECASE,
+)
+
+# Column types whose Arrow export converts back to different Python values
+# than fetchall() returns (MAP as key/value pairs, HUGEINT as Decimal, ...)
+_NON_ARROW_TYPES = re.compile(
+    r"\b(MAP|UNION|UUID|HUGEINT|UHUGEINT|BIT|VARINT|BIGNUM|INTERVAL)\b"
+    r"|WITH TIME ZONE",
+    re.IGNORECASE,
+)
+
+CACHE_REQUESTS = registry.register(
+    Counter(
+        "flockmtl_result_cache_requests_total",
+        "Result cache lookups by outcome (hit, miss or uncacheable)",
+        labelnames=("result",),
+    )
+)
+
+
+class ResultCache:
+    """
+    LRU cache of query results bounded by their size in bytes.
+
+    Results are keyed by the normalized SQL text plus the catalog versions of
+    the tables the query reads (views are resolved to their base tables by
+    DuckDB's binder), and stored as zstd-compressed Arrow IPC streams. When a
+    table changes, the entries reading it are dropped right away; the
+    versions in the key additionally keep results computed concurrently with
+    a change from ever being served.
+    """
+
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        # Entries bigger than this would evict most of the cache
+        self.max_entry_bytes = max_bytes // 4
+        self.enabled = enabled and pa is not None and max_bytes > 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[bytes, list[str]]] = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Catalog version and names of the views reading files or the catalog
+        self._untracked_views: tuple[int, frozenset] = (-1, frozenset())
+
+    def make_key(self, cursor, query: str) -> Optional[tuple]:
+        """
+        Build the cache key for a query.
+
+        Args:
+            cursor: DuckDB cursor used to resolve the tables the query reads
+            query: Read-only SQL query
+
+        Returns:
+            Key of (normalized SQL, referenced tables, their versions), or None
+            if the query's result may change without a catalog change: it
+            calls a volatile function, scans files or the catalog (directly
+            or through a view), or reads no table at all
+        """
+        if not self.enabled:
+            return None
+        literal_free = _STRING_LITERALS.sub("''", query)
+        if VOLATILE_FUNCTIONS.search(literal_free) or _CATALOG_SOURCES.search(
+            literal_free
+        ):
+            CACHE_REQUESTS.inc(result="uncacheable")
+            return None
+        try:
+            tables = tuple(
+                sorted({name.lower() for name in cursor.get_table_names(query)})
+            )
+            untracked_views = self._get_untracked_views(cursor)
+        except Exception as e:
+            logger.debug("Could not resolve tables for result cache: %s", e)
+            CACHE_REQUESTS.inc(result="uncacheable")
+            return None
+        if (
+            not tables
+            or any("/" in table or "." in table or ":" in table for table in tables)
+            or any(
+                word in untracked_views
+                for word in re.findall(r"\w+", literal_free.lower())
+            )
+        ):
+            # Direct file or URL scans (e.g. FROM 'data.csv') and sources
+            # the binder does not resolve to tables, such as views over files
+            CACHE_REQUESTS.inc(result="uncacheable")
+            return None
+        return (normalize_sql(query), tables, catalog_versions.versions(list(tables)))
+
+    def _get_untracked_views(self, cursor) -> frozenset:
+        """
+        Names of the views reading files or the catalog, directly or through
+        other views; looked up again whenever the catalog changes.
+        """
+        version = catalog_versions.current()
+        with self._lock:
+            cached_version, views = self._untracked_views
+        if cached_version == version:
+            return views
+
+        definitions = {
+            name.lower(): _STRING_LITERALS.sub("''", sql or "").lower()
+            for name, sql in cursor.execute(
+                "SELECT view_name, sql FROM duckdb_views() WHERE NOT internal"
+            ).fetchall()
+        }
+        untracked = {
+            name
+            for name, sql in definitions.items()
+            if VOLATILE_FUNCTIONS.search(sql) or _CATALOG_SOURCES.search(sql)
+        }
+        # Views over untracked views are untracked too
+        changed = True
+        while changed:
+            changed = False
+            for name, sql in definitions.items():
+                if name not in untracked and untracked & set(re.findall(r"\w+", sql)):
+                    untracked.add(name)
+                    changed = True
+
+        views = frozenset(untracked)
+        with self._lock:
+            self._untracked_views = (version, views)
+        return views
+
+    def get(self, key: Optional[tuple]) -> Optional[tuple[list[str], list[dict]]]:
+        """
+        Look up a cached result.
+
+        Returns:
+            (columns, rows) with rows as dictionaries, or None on a miss
+        """
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+        if entry is None:
+            CACHE_REQUESTS.inc(result="miss")
+            return None
+        CACHE_REQUESTS.inc(result="hit")
+
+        blob, columns = entry
+        return columns, _to_rows(columns, pa.ipc.open_stream(blob).read_all())
+
+    def fetch(self, results, key: Optional[tuple]) -> tuple[list[str], list[dict]]:
+        """
+        Fetch the rows of an executed query, caching them under key.
+
+        Cacheable results are fetched from DuckDB as Arrow, which is also the
+        stored format, so caching costs no extra conversion.
+
+        Args:
+            results: DuckDB cursor the query was executed on
+            key: Key from make_key, computed before the query ran
+
+        Returns:
+            (columns, rows) with rows as dictionaries
+        """
+        description = results.description
+        columns = [column[0] for column in description]
+        if key is None or not arrow_compatible(
+            [str(column[1]) for column in description]
+        ):
+            return columns, [dict(zip(columns, row)) for row in results.fetchall()]
+
+        return self.fetch_table(results.fetch_record_batch().read_all(), key)
+
+    def fetch_table(self, table, key: Optional[tuple]) -> tuple[list[str], list[dict]]:
+        """
+        Convert a result already fetched as Arrow, caching it under key.
+
+        Args:
+            table: Result as an Arrow table
+            key: Key from make_key, computed before the query ran, or None
+                to not cache the result
+
+        Returns:
+            (columns, rows) with rows as dictionaries
+        """
+        columns = table.column_names
+        if key is not None:
+            self.put(key, columns, table)
+        return columns, _to_rows(columns, table)
+
+    def put(self, key: tuple, columns: list[str], table) -> bool:
+        """
+        Store a query result.
+
+        Args:
+            key: Key from make_key, computed before the query ran
+            columns: Result column names
+            table: Result as an Arrow table
+
+        Returns:
+            True if the result was cached
+        """
+        _, tables, versions = key
+        if catalog_versions.versions(list(tables)) != versions:
+            # A referenced table changed while the query was running
+            return False
+
+        blob = _to_ipc(table)
+        if len(blob) > self.max_entry_bytes:
+            return False
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (blob, columns)
+            self._bytes += len(blob)
+            self._stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats["evictions"] += 1
+        return True
+
+    def invalidate(self, table_name: str = None):
+        """
+        Drop the cached results reading a table.
+
+        Args:
+            table_name: Changed table, or None to drop every entry
+        """
+        with self._lock:
+            if table_name is None:
+                stale = list(self._entries)
+            else:
+                table_name = table_name.lower()
+                stale = [key for key in self._entries if table_name in key[1]]
+            for key in stale:
+                self._bytes -= len(self._entries.pop(key)[0])
+        if stale:
+            logger.debug(
+                "Invalidated %d cached results (%s)", len(stale), table_name or "all"
+            )
+
+    def clear(self):
+        """Drop every entry."""
+        self.invalidate()
+
+    def get_stats(self) -> dict:
+        """Get cache usage statistics."""
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def arrow_compatible(types: list[str]) -> bool:
+    """Whether columns of these DuckDB types convert the same through Arrow."""
+    return not any(_NON_ARROW_TYPES.search(column_type) for column_type in types)
+
+
+def _to_rows(columns: list[str], table) -> list[dict]:
+    """Convert an Arrow table to row dictionaries, like the fetchall() path."""
+    values = [column.to_pylist() for column in table.columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _to_ipc(table) -> bytes:
+    """Serialize an Arrow table as a zstd-compressed Arrow IPC stream."""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# Global result cache, invalidated on every catalog change
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+    enabled=os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true",
+)
+catalog_versions.add_listener(result_cache.invalidate)
+
+register_gauge_callback(
+    "flockmtl_result_cache_bytes",
+    "Size of the cached query results in bytes",
+    lambda: result_cache.get_stats()["bytes"],
+)
+register_gauge_callback(
+    "flockmtl_result_cache_entries",
+    "Number of cached query results",
+    lambda: result_cache.get_stats()["entries"],
+)
@@ -0,0 +1,213 @@
+import os
+import time
+import uuid
+import threading
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.internal.metrics import register_gauge_callback
+from app.internal.request_context import RequestContext
+from app.internal.tracing import current_trace
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TooManyPending(Exception):
+    """Raised when max_pending runs are already queued or running."""
+
+
+class ResultHandleStore:
+    """
+    Results of work running in the background, looked up by handle.
+
+    Submitted work runs on a small thread pool, in a copy of the submitter's
+    context (so LLM usage and logs keep its endpoint and trace) and with a
+    request context of its own whose request ID is the handle. That context
+    is kept out of the submitter's trace, whose contexts are finished when
+    the submitting request completes. The result (or error) is kept in
+    memory for retention_seconds after the run finishes.
+    At most max_pending runs are queued or running at a time, and at most
+    max_entries finished results are kept, the oldest are dropped first.
+    Work is cancelled through cancel(), which interrupts its DuckDB
+    statements.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        retention_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.max_workers = max_workers or int(os.getenv("RESULT_HANDLE_WORKERS", "4"))
+        self.retention_seconds = retention_seconds or float(
+            os.getenv("RESULT_HANDLE_RETENTION_SECONDS", "1800")
+        )
+        self.max_entries = max_entries or int(
+            os.getenv("RESULT_HANDLE_MAX_ENTRIES", "100")
+        )
+        self.max_pending = max_pending or int(
+            os.getenv("RESULT_HANDLE_MAX_PENDING", str(2 * self.max_workers))
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="result-handle"
+        )
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._running: dict[str, RequestContext] = {}
+
+    def submit(self, function: Callable[..., Any], *args) -> str:
+        """
+        Run function(*args, context) in the background.
+
+        Args:
+            function: Called with args and the run's request context
+            args: Arguments of function
+
+        Returns:
+            The handle to look the result up with
+
+        Raises:
+            TooManyPending: If max_pending runs are already queued or running
+        """
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._prune(time.time())
+            pending = sum(
+                entry["finished_at"] is None for entry in self._entries.values()
+            )
+            if pending >= self.max_pending:
+                raise TooManyPending(
+                    f"{pending} background runs are already pending, try again later"
+                )
+            self._entries[handle] = {
+                "handle": handle,
+                "status": "queued",
+                "submitted_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        self._executor.submit(
+            contextvars.copy_context().run, self._run, handle, function, args
+        )
+        return handle
+
+    def _run(self, handle: str, function: Callable[..., Any], args):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None or entry["status"] != "queued":
+                # Cancelled (or expired) while it was queued
+                return
+            # Only this run may finish its context, not the submitter's trace
+            token = current_trace.set(None)
+            try:
+                context = RequestContext(request_id=handle)
+            finally:
+                current_trace.reset(token)
+            entry["status"] = "running"
+            self._running[handle] = context
+
+        try:
+            result, error, status = function(*args, context), None, "done"
+        except Exception as e:
+            logger.warning("Background work for handle %s failed: %s", handle, e)
+            result, error, status = None, str(e), "failed"
+
+        context.finish()
+        with self._lock:
+            del self._running[handle]
+            if context.cancelled:
+                result, error, status = None, "Run was cancelled", "cancelled"
+            entry = self._entries.get(handle)
+            if entry is not None:
+                entry.update(
+                    status=status,
+                    finished_at=time.time(),
+                    result=result,
+                    error=error,
+                )
+
+    def cancel(self, handle: str) -> Optional[dict[str, Any]]:
+        """
+        Cancel queued or running work.
+
+        Returns:
+            Its state after cancelling, or None if the handle is unknown or
+            has expired
+        """
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            if entry["status"] == "queued":
+                entry.update(
+                    status="cancelled",
+                    finished_at=time.time(),
+                    error="Run was cancelled",
+                )
+            context = self._running.get(handle)
+        if context is not None:
+            # The worker records the cancellation once the statement stops
+            context.cancel()
+        return self.get(handle)
+
+    def get(self, handle: str) -> Optional[dict[str, Any]]:
+        """
+        Look up the state of background work.
+
+        Returns:
+            Its status ("queued", "running", "done", "failed" or
+            "cancelled"), timestamps, result and error, or None if the
+            handle is unknown or has expired
+        """
+        with self._lock:
+            self._prune(time.time())
+            entry = self._entries.get(handle)
+            return dict(entry) if entry is not None else None
+
+    def _prune(self, now: float):
+        finished = sorted(
+            (entry["finished_at"], handle)
+            for handle, entry in self._entries.items()
+            if entry["finished_at"] is not None
+        )
+        expired = [
+            handle
+            for finished_at, handle in finished
+            if finished_at < now - self.retention_seconds
+        ]
+        overflow = len(finished) - len(expired) - self.max_entries
+        if overflow > 0:
+            expired += [handle for _, handle in finished[len(expired) :]][:overflow]
+        for handle in expired:
+            del self._entries[handle]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            queued = sum(
+                entry["status"] == "queued" for entry in self._entries.values()
+            )
+            running = len(self._running)
+            return {
+                "queued": queued,
+                "running": running,
+                "finished": len(self._entries) - queued - running,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "max_entries": self.max_entries,
+                "retention_seconds": self.retention_seconds,
+            }
+
+
+# Global store for full query results computed after a preview
+result_handles = ResultHandleStore()
+
+register_gauge_callback(
+    "flockmtl_result_handles_running",
+    "Number of queries running in the background behind a result handle",
+    lambda: result_handles.get_stats()["running"],
+)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.internal.catalog import catalog_versions
+from app.internal.metrics import register_gauge_callback
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt for comparison: collapse whitespace and ignore case."""
+    return " ".join((prompt or "").split()).casefold()
+
+
+def make_request_key(
+    endpoint: str, prompt: str, selected_tables: list[str] = None
+) -> tuple:
+    """
+    Build the coalescing key for a pipeline request.
+
+    Args:
+        endpoint: Endpoint name the request was made to
+        prompt: User prompt
+        selected_tables: Tables selected by the user, if any
+
+    Returns:
+        Hashable key of (endpoint, normalized prompt, tables, catalog version)
+    """
+    tables = tuple(sorted({table.lower() for table in selected_tables or []}))
+    return (endpoint, normalize_prompt(prompt), tables, catalog_versions.current())
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests into a single computation.
+
+    The first caller for a key runs the computation; callers arriving with the
+    same key while it is still in flight await the same result (or exception)
+    instead of starting their own. Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run func once per key among concurrent callers.
+
+        The computation runs as a task of its own that every caller, the
+        first one included, awaits through asyncio.shield, so a caller that
+        is cancelled (e.g. its client disconnected) stops waiting without
+        cancelling the computation for the others.
+
+        Args:
+            key: Hashable request key
+            func: Zero-argument coroutine function computing the result
+
+        Returns:
+            The result of the (possibly shared) computation
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            logger.info("Coalescing duplicate in-flight request")
+        else:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            self._stats["leaders"] += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark exceptions as retrieved when every caller stopped waiting
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> dict:
+        """Return coalescing statistics."""
+        return {**self._stats, "in_flight": len(self._in_flight)}
+
+
+# Global coalescer for pipeline requests
+request_coalescer = SingleFlight()
+
+register_gauge_callback(
+    "flockmtl_coalesced_requests_in_flight",
+    "Number of distinct pipeline computations currently shared by coalescing",
+    lambda: request_coalescer.get_stats()["in_flight"],
+)
@@ -0,0 +1,807 @@
+import re
+import logging
+from typing import Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+LLM_SCALAR_FUNCTIONS = ("llm_complete", "llm_filter", "llm_embedding")
+LLM_AGGREGATE_FUNCTIONS = ("llm_reduce", "llm_rerank", "llm_first", "llm_last")
+LLM_FUNCTIONS = LLM_SCALAR_FUNCTIONS + LLM_AGGREGATE_FUNCTIONS
+
+# SQL type of each scalar function's result
+SCALAR_OUTPUT_TYPES = {
+    "llm_complete": "VARCHAR",
+    "llm_filter": "BOOLEAN",
+    "llm_embedding": "FLOAT[]",
+}
+
+# Functions whose result changes between runs, and table functions reading
+# data outside the catalog (files, URLs, attached databases)
+VOLATILE_FUNCTIONS = re.compile(
+    r"\b(random|setseed|uuid|gen_random_uuid|uuidv4|uuidv7|nextval|currval|now"
+    r"|today|current_timestamp|current_date|current_time|current_localtime"
+    r"|current_localtimestamp|get_current_time|get_current_timestamp"
+    r"|transaction_timestamp|read_\w+|\w+_scan|glob|sniff_csv)\b",
+    re.IGNORECASE,
+)
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<ident>"(?:[^"]|"")*")
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<open>[(\[{])
+    |(?P<close>[)\]}])
+    |(?P<comma>,)
+    |(?P<op>::|->>|->|<=|>=|<>|!=|\|\||\*\*|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Clause keywords of a SELECT statement, in the order they may appear
+_CLAUSE_KEYWORDS = (
+    "with",
+    "select",
+    "from",
+    "where",
+    "group by",
+    "having",
+    "window",
+    "qualify",
+    "order by",
+    "limit",
+    "offset",
+)
+_SET_OPERATIONS = ("union", "intersect", "except")
+
+# Aggregates or windows in an expression mean its values are not per input row
+_AGGREGATE_WORDS = (
+    "count",
+    "sum",
+    "avg",
+    "min",
+    "max",
+    "string_agg",
+    "group_concat",
+    "list",
+    "array_agg",
+    "any_value",
+    "first",
+    "last",
+    "median",
+    "mode",
+    "over",
+)
+
+
+# Words that may follow a FROM item but are not its alias
+_NOT_ALIASES = {
+    "where",
+    "join",
+    "inner",
+    "left",
+    "right",
+    "full",
+    "outer",
+    "cross",
+    "natural",
+    "positional",
+    "asof",
+    "semi",
+    "anti",
+    "lateral",
+    "on",
+    "using",
+    "group",
+    "order",
+    "limit",
+    "offset",
+    "having",
+    "qualify",
+    "window",
+    "union",
+    "except",
+    "intersect",
+    "select",
+    "tablesample",
+}
+
+
+class Token:
+    """A lexical SQL token with its position and parenthesis depth."""
+
+    __slots__ = ("kind", "text", "start", "end", "depth", "match")
+
+    def __init__(self, kind: str, text: str, start: int, end: int, depth: int):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        # Brackets carry the depth outside of them, their contents one more
+        self.depth = depth
+        # Index of the matching bracket for open and close tokens
+        self.match: Optional[int] = None
+
+    @property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    def is_word(self, *words: str) -> bool:
+        return self.kind == "word" and self.text.lower() in words
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r}, {self.start})"
+
+
+def tokenize(sql: str) -> list[Token]:
+    """
+    Split SQL into significant tokens (whitespace and comments are dropped).
+
+    Raises:
+        ValueError: If brackets are unbalanced
+    """
+    tokens: list[Token] = []
+    stack: list[int] = []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        token = Token(kind, match.group(), match.start(), match.end(), len(stack))
+        if kind == "open":
+            stack.append(len(tokens))
+        elif kind == "close":
+            if not stack:
+                raise ValueError(f"Unbalanced '{token.text}' at {token.start}")
+            opening = stack.pop()
+            token.depth = len(stack)
+            token.match = opening
+            tokens[opening].match = len(tokens)
+        tokens.append(token)
+    if stack:
+        raise ValueError(f"Unbalanced '{tokens[stack[-1]].text}'")
+    return tokens
+
+
+def apply_edits(
+    sql: str, edits: list[tuple[int, int, str]], span: tuple[int, int] = None
+) -> str:
+    """
+    Replace character ranges of sql.
+
+    Args:
+        sql: SQL text
+        edits: Non-overlapping (start, end, replacement) ranges
+        span: Only return this (start, end) range of the edited text, applying
+            the edits that fall inside it
+
+    Returns:
+        The edited text
+    """
+    start, end = span or (0, len(sql))
+    parts = []
+    position = start
+    for edit_start, edit_end, replacement in sorted(edits):
+        if edit_start < start or edit_end > end:
+            continue
+        parts.append(sql[position:edit_start])
+        parts.append(replacement)
+        position = edit_end
+    parts.append(sql[position:end])
+    return "".join(parts)
+
+
+class ContextColumn:
+    """One entry of an LLM function's context_columns list."""
+
+    def __init__(self, data: str, span: tuple[int, int], attributes: dict):
+        # SQL expression of the column values, and its range in the query
+        self.data = data
+        self.span = span
+        # The other literal keys, e.g. name, type and detail
+        self.attributes = attributes
+
+
+class LLMCall:
+    """
+    A FlockMTL function call found in a query.
+
+    The model and prompt arguments are kept as text; context columns are
+    parsed when the prompt argument is a struct literal, which is how the
+    generation prompt instructs the model to write them.
+    """
+
+    def __init__(self, function: str, span: tuple[int, int], open_index: int):
+        self.function = function
+        self.span = span
+        # Index of the call's opening parenthesis in the token list
+        self.open_index = open_index
+        self.model: Optional[str] = None
+        self.model_name: Optional[str] = None
+        self.prompt: Optional[str] = None
+        self.prompt_struct: Optional[str] = None
+        self.prompt_span: Optional[tuple[int, int]] = None
+        self.context: Optional[list[ContextColumn]] = None
+        # Whether the arguments contain another llm_* call
+        self.nested = False
+
+    @property
+    def scalar(self) -> bool:
+        return self.function in LLM_SCALAR_FUNCTIONS
+
+    @property
+    def parsed(self) -> bool:
+        """Whether model, prompt and context columns were all understood."""
+        return (
+            self.model is not None
+            and self.prompt is not None
+            and self.context is not None
+        )
+
+    def text(self, sql: str) -> str:
+        return sql[self.span[0] : self.span[1]]
+
+    def to_dict(self) -> dict:
+        return {
+            "function": self.function,
+            "model_name": self.model_name,
+            "context_columns": [column.data for column in self.context or []],
+        }
+
+
+def _literal(token: Token) -> Optional[str]:
+    """Value of a string literal token, or None for anything else."""
+    if token.kind != "string":
+        return None
+    return token.text[1:-1].replace("''", "'")
+
+
+def _split_top_level(tokens: list[Token], first: int, last: int) -> list[tuple]:
+    """Split tokens[first:last] on commas at the depth of tokens[first]."""
+    if first >= last:
+        return []
+    depth = tokens[first].depth
+    parts, start = [], first
+    for i in range(first, last):
+        if tokens[i].kind == "comma" and tokens[i].depth == depth:
+            parts.append((start, i))
+            start = i + 1
+    parts.append((start, last))
+    return parts
+
+
+def _parse_struct(tokens: list[Token], index: int) -> Optional[dict]:
+    """
+    Parse a {'key': value, ...} literal starting at tokens[index].
+
+    Returns:
+        Dict of key to (first, last) token index range of the value, or None
+    """
+    if tokens[index].text != "{":
+        return None
+    fields = {}
+    for first, last in _split_top_level(tokens, index + 1, tokens[index].match):
+        if last - first < 3 or tokens[first + 1].text != ":":
+            return None
+        key = _literal(tokens[first])
+        if key is None:
+            return None
+        fields[key.lower()] = (first + 2, last)
+    return fields
+
+
+def _value_text(sql: str, tokens: list[Token], value: tuple) -> str:
+    first, last = value
+    return sql[tokens[first].start : tokens[last - 1].end]
+
+
+def _parse_call(sql: str, tokens: list[Token], call: LLMCall):
+    """Fill in model, prompt and context columns of a call, when literal."""
+    close = tokens[call.open_index].match
+    call.nested = any(
+        token.is_word(*LLM_FUNCTIONS) for token in tokens[call.open_index + 1 : close]
+    )
+    arguments = _split_top_level(tokens, call.open_index + 1, close)
+    if len(arguments) != 2:
+        return
+    (model_first, model_last), (prompt_first, prompt_last) = arguments
+
+    model = _parse_struct(tokens, model_first)
+    if model is None or tokens[model_first].match != model_last - 1:
+        return
+    if "model_name" in model:
+        call.model_name = _literal(tokens[model["model_name"][0]])
+    call.model = _value_text(sql, tokens, (model_first, model_last))
+
+    prompt = _parse_struct(tokens, prompt_first)
+    if prompt is None or tokens[prompt_first].match != prompt_last - 1:
+        return
+    call.prompt_struct = _value_text(sql, tokens, (prompt_first, prompt_last))
+    call.prompt_span = (tokens[prompt_first].start, tokens[prompt_last - 1].end)
+    if "prompt" in prompt:
+        call.prompt = _literal(tokens[prompt["prompt"][0]])
+
+    columns = []
+    if "context_columns" in prompt:
+        first, last = prompt["context_columns"]
+        if tokens[first].text != "[" or tokens[first].match != last - 1:
+            return
+        for item_first, _ in _split_top_level(tokens, first + 1, last - 1):
+            item = _parse_struct(tokens, item_first)
+            if item is None or "data" not in item:
+                return
+            data_first, data_last = item["data"]
+            attributes = {
+                key: _literal(tokens[value[0]])
+                for key, value in item.items()
+                if key != "data"
+            }
+            columns.append(
+                ContextColumn(
+                    _value_text(sql, tokens, item["data"]),
+                    (tokens[data_first].start, tokens[data_last - 1].end),
+                    attributes,
+                )
+            )
+    call.context = columns
+
+
+def find_llm_calls(sql: str, tokens: list[Token] = None) -> list[LLMCall]:
+    """
+    Find the FlockMTL function calls of a query, in text order.
+
+    Args:
+        sql: SQL query
+        tokens: Tokens of sql, if already computed
+
+    Returns:
+        The calls, with their arguments parsed where possible
+    """
+    tokens = tokens if tokens is not None else tokenize(sql)
+    calls = []
+    for i, token in enumerate(tokens[:-1]):
+        if token.is_word(*LLM_FUNCTIONS) and tokens[i + 1].text == "(":
+            close = tokens[i + 1].match
+            call = LLMCall(token.lower, (token.start, tokens[close].end), i + 1)
+            _parse_call(sql, tokens, call)
+            calls.append(call)
+    return calls
+
+
+class SelectBlock:
+    """
+    The clauses of one SELECT statement, as character ranges of the query.
+
+    Only the clauses at the statement's own depth are split out: subqueries,
+    CTE bodies and function arguments stay inside the clause containing them.
+    """
+
+    def __init__(self, span: tuple[int, int], depth: int, parent_index: int = None):
+        self.span = span
+        self.depth = depth
+        # Index of the parenthesis enclosing the block, None at top level
+        self.parent_index = parent_index
+        self.clauses: dict[str, tuple[int, int]] = {}
+        self.set_operation = False
+        self.distinct = False
+
+    def clause(self, sql: str, name: str) -> Optional[str]:
+        span = self.clauses.get(name)
+        return sql[span[0] : span[1]].strip() if span else None
+
+    def clause_at(self, position: int) -> Optional[str]:
+        """Name of the clause containing a character position."""
+        for name, (start, end) in self.clauses.items():
+            if start <= position < end:
+                return name
+        return None
+
+
+def parse_select(
+    tokens: list[Token], first: int, last: int, sql_length: int
+) -> Optional[SelectBlock]:
+    """
+    Split the statement in tokens[first:last] into its clauses.
+
+    Returns:
+        The block, or None if the tokens do not form a SELECT statement
+    """
+    # Drop trailing semicolons of a top-level statement
+    while last > first and tokens[last - 1].text == ";":
+        last -= 1
+    if first >= last or not tokens[first].is_word("select", "with", "from"):
+        return None
+
+    depth = tokens[first].depth
+    parent = first - 1 if first > 0 and tokens[first - 1].text == "(" else None
+    end = tokens[last].start if last < len(tokens) else sql_length
+    block = SelectBlock((tokens[first].start, end), depth, parent)
+
+    starts = []
+    i = first
+    while i < last:
+        token = tokens[i]
+        if token.depth != depth or token.kind != "word":
+            i += 1
+            continue
+        word = token.lower
+        following = tokens[i + 1] if i + 1 < last else None
+        if word in _SET_OPERATIONS:
+            block.set_operation = True
+        elif word in ("group", "order") and following and following.is_word("by"):
+            starts.append((f"{word} by", i, following.end))
+            i += 2
+            continue
+        elif word in _CLAUSE_KEYWORDS:
+            if word == "with" and i != first:
+                # WITH inside e.g. "WITH ORDINALITY" or a recursive clause
+                i += 1
+                continue
+            if word == "select" and following and following.is_word("distinct"):
+                block.distinct = True
+            starts.append((word, i, token.end))
+        i += 1
+
+    seen = set()
+    for index, (name, _, body_start) in enumerate(starts):
+        if name in seen:
+            # A second SELECT or FROM at this depth: not a plain statement
+            block.set_operation = True
+            continue
+        seen.add(name)
+        clause_end = (
+            tokens[starts[index + 1][1]].start if index + 1 < len(starts) else end
+        )
+        block.clauses[name] = (body_start, clause_end)
+    if "select" not in block.clauses and "from" not in block.clauses:
+        return None
+    return block
+
+
+def enclosing_selects(sql: str, tokens: list[Token], index: int) -> list[SelectBlock]:
+    """
+    Find the SELECT statements enclosing a token, innermost first.
+
+    Args:
+        sql: SQL query
+        tokens: Tokens of sql
+        index: Index of the token
+
+    Returns:
+        The enclosing blocks; the last one is the whole statement
+    """
+    blocks = []
+    depth = tokens[index].depth
+    i = index
+    while depth > 0:
+        # Walk back to the parenthesis opening the current depth
+        while i >= 0 and not (tokens[i].text in "([{" and tokens[i].depth == depth - 1):
+            i -= 1
+        if i < 0:
+            break
+        if tokens[i].text == "(":
+            block = parse_select(tokens, i + 1, tokens[i].match, len(sql))
+            if block is not None:
+                blocks.append(block)
+        depth -= 1
+    top = parse_select(tokens, 0, len(tokens), len(sql))
+    if top is not None:
+        blocks.append(top)
+    return blocks
+
+
+def split_conjuncts(
+    tokens: list[Token], span: tuple[int, int]
+) -> list[tuple[int, int]]:
+    """
+    Split a boolean expression into its top-level AND operands.
+
+    Args:
+        tokens: Tokens of the query
+        span: Character range of the expression (e.g. a WHERE clause)
+
+    Returns:
+        Character ranges of the operands
+    """
+    inside = [i for i, token in enumerate(tokens) if span[0] <= token.start < span[1]]
+    if not inside:
+        return []
+    depth = min(tokens[i].depth for i in inside)
+    if any(tokens[i].depth == depth and tokens[i].is_word("or") for i in inside):
+        # OR binds weaker than AND: the expression is a single operand
+        return [(tokens[inside[0]].start, tokens[inside[-1]].end)]
+    conjuncts = []
+    start = tokens[inside[0]].start
+    pending_between = False
+    previous_end = start
+    for i in inside:
+        token = tokens[i]
+        if token.depth == depth and token.is_word("between"):
+            pending_between = True
+        elif token.depth == depth and token.is_word("and"):
+            if pending_between:
+                pending_between = False
+            else:
+                conjuncts.append((start, previous_end))
+                start = None
+                previous_end = token.end
+                continue
+        if start is None:
+            start = token.start
+        previous_end = token.end
+    if start is not None:
+        conjuncts.append((start, previous_end))
+    return conjuncts
+
+
+def contains_llm_call(tokens: list[Token], span: tuple[int, int]) -> bool:
+    """Whether a character range of the query calls any llm_* function."""
+    return any(
+        token.is_word(*LLM_FUNCTIONS) and span[0] <= token.start < span[1]
+        for token in tokens
+    )
+
+
+def contains_aggregate(tokens: list[Token], span: tuple[int, int]) -> bool:
+    """Whether a character range of the query may aggregate or window rows."""
+    return any(
+        token.is_word(*_AGGREGATE_WORDS) and span[0] <= token.start < span[1]
+        for token in tokens
+    )
+
+
+def call_row_source(
+    sql: str, tokens: list[Token], call: LLMCall
+) -> Optional[tuple[list[SelectBlock], list[tuple[int, int]]]]:
+    """
+    Find the rows a scalar LLM call is evaluated on.
+
+    These are the rows of the FROM clause of the SELECT containing the call
+    that pass its WHERE conditions. They are only known up front when the
+    call is in the select list or WHERE clause of a plain SELECT, the other
+    WHERE conditions do not call a model themselves (the call could
+    otherwise see rows they would have filtered out), its context columns
+    are not aggregates, and no enclosing statement has a LIMIT without ORDER
+    BY, which may stop before reading every row.
+
+    Args:
+        sql: SQL query
+        tokens: Tokens of sql
+        call: The call, as found by find_llm_calls
+
+    Returns:
+        The enclosing blocks (innermost first) and the character ranges of
+        the WHERE conditions, or None if the rows are not known up front
+    """
+    blocks = enclosing_selects(sql, tokens, call.open_index - 1)
+    if not blocks:
+        return None
+    block = blocks[0]
+    clause = block.clause_at(call.span[0])
+    if block.set_operation or "from" not in block.clauses:
+        return None
+    if clause not in ("select", "where"):
+        return None
+    if clause == "select" and ("having" in block.clauses or "qualify" in block.clauses):
+        return None
+    if any("limit" in b.clauses and "order by" not in b.clauses for b in blocks):
+        return None
+    for column in call.context or []:
+        if contains_aggregate(tokens, column.span):
+            return None
+
+    conditions = []
+    for span in split_conjuncts(tokens, block.clauses.get("where", (0, 0))):
+        if span[0] <= call.span[0] < span[1]:
+            # The condition calling the model itself
+            continue
+        if contains_llm_call(tokens, span):
+            return None
+        conditions.append(span)
+    return blocks, conditions
+
+
+def _alias_index(tokens: list[Token], index: int) -> Optional[int]:
+    """Index of the alias following the FROM item ending at tokens[index]."""
+    i = index + 1
+    if i < len(tokens) and tokens[i].is_word("as"):
+        i += 1
+    if i >= len(tokens):
+        return None
+    token = tokens[i]
+    if token.kind == "ident" or (
+        token.kind == "word" and token.lower not in _NOT_ALIASES
+    ):
+        return i
+    return None
+
+
+def alias_after(tokens: list[Token], index: int) -> Optional[str]:
+    """Alias following the FROM item ending at tokens[index], if any."""
+    i = _alias_index(tokens, index)
+    return identifier_name(tokens[i]) if i is not None else None
+
+
+def identifier_name(token: Token) -> Optional[str]:
+    """Lowercase name of a word or quoted identifier token."""
+    if token.kind == "word":
+        return token.lower
+    if token.kind == "ident":
+        return token.text[1:-1].replace('""', '"').lower()
+    return None
+
+
+def cte_names(tokens: list[Token]) -> set[str]:
+    """Names defined as CTEs: name [(columns)] AS [[NOT] MATERIALIZED] (...)."""
+    names = set()
+    for i, token in enumerate(tokens[1:-1], start=1):
+        following = tokens[i + 1]
+        if not token.is_word("as") or not (
+            following.text == "(" or following.is_word("materialized", "not")
+        ):
+            continue
+        name = i - 1
+        if tokens[name].kind == "close":
+            name = tokens[name].match - 1
+        if name >= 0 and identifier_name(tokens[name]):
+            names.add(identifier_name(tokens[name]))
+    return names
+
+
+def sample_tables(sql: str, clause: str) -> Optional[str]:
+    """
+    Add a sampling clause to every base table a query reads.
+
+    Tables are the names after FROM, JOIN or a comma of a FROM clause that
+    are neither CTEs nor table functions. Derived tables are left alone;
+    the tables they read are sampled themselves.
+
+    Args:
+        sql: SQL query
+        clause: Clause to add after each table and its alias, e.g.
+            "TABLESAMPLE 10 PERCENT (bernoulli, 42)"
+
+    Returns:
+        The sampled query, or None if it reads no table or already samples
+    """
+    tokens = tokenize(sql)
+    for i, token in enumerate(tokens[:-1]):
+        if token.is_word("tablesample") or (
+            token.is_word("using") and tokens[i + 1].is_word("sample")
+        ):
+            return None
+    ctes = cte_names(tokens)
+
+    edits = []
+    for i, token in enumerate(tokens):
+        if not token.is_word("from"):
+            continue
+        depth = token.depth
+        if depth > 0:
+            # FROM inside e.g. EXTRACT(year FROM d) rather than a subquery
+            opening = i
+            while not (
+                tokens[opening].text == "(" and tokens[opening].depth == depth - 1
+            ):
+                opening -= 1
+            if not tokens[opening + 1].is_word("select", "with", "from"):
+                continue
+
+        starts = [i + 1]
+        j = i + 1
+        while j < len(tokens) and tokens[j].depth >= depth:
+            current = tokens[j]
+            if current.depth == depth:
+                if current.is_word(
+                    *_CLAUSE_KEYWORDS, *_SET_OPERATIONS, "group", "order"
+                ):
+                    break
+                if current.kind == "comma" or current.is_word("join"):
+                    starts.append(j + 1)
+            j += 1
+
+        for start in starts:
+            if start >= len(tokens) or tokens[start].kind not in ("word", "ident"):
+                continue
+            last = start
+            while (
+                last + 2 < len(tokens)
+                and tokens[last + 1].text == "."
+                and tokens[last + 2].kind in ("word", "ident")
+            ):
+                last += 2
+            following = tokens[last + 1] if last + 1 < len(tokens) else None
+            if following is not None and following.text == "(":
+                # A table function
+                continue
+            if last == start and identifier_name(tokens[start]) in ctes:
+                continue
+            end = _alias_index(tokens, last)
+            if end is None:
+                end = last
+            elif end + 1 < len(tokens) and tokens[end + 1].text == "(":
+                # Column aliases: t AS x(a, b)
+                end = tokens[end + 1].match
+            edits.append((tokens[end].end, tokens[end].end, f" {clause}"))
+    if not edits:
+        return None
+    return apply_edits(sql, edits)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def column_names(cursor, sql: str) -> list[str]:
+    """Bind a query without running it and return its column names."""
+    return [row[0] for row in cursor.execute(f"DESCRIBE {sql}").fetchall()]
+
+
+def preserve_column_names(cursor, sql: str, rewritten: str) -> str:
+    """
+    Give a rewritten query the column names of the original.
+
+    Unaliased expressions are named after their text, so replacing a call
+    renames its column. Both queries are bound, which also checks that the
+    rewritten one is valid before anything runs.
+
+    Args:
+        cursor: DuckDB cursor to bind the queries on
+        sql: Original query, without a trailing semicolon
+        rewritten: Rewritten query, without a trailing semicolon
+
+    Returns:
+        The rewritten query, wrapped in a projection renaming its columns
+        if needed
+
+    Raises:
+        duckdb.Error: If either query does not bind
+    """
+    columns = column_names(cursor, sql)
+    if column_names(cursor, rewritten) == columns:
+        return rewritten
+    projection = ", ".join(
+        f"#{i} AS {quote_identifier(name)}" for i, name in enumerate(columns, start=1)
+    )
+    return f"SELECT {projection} FROM ({rewritten}) __rewritten_query"
+
+
+def token_range(tokens: list[Token], span: tuple[int, int]) -> list[int]:
+    """Indexes of the tokens starting inside a character range."""
+    return [i for i, token in enumerate(tokens) if span[0] <= token.start < span[1]]
+
+
+def select_items(tokens: list[Token], block: SelectBlock) -> list[tuple[int, int]]:
+    """
+    Split a block's select list into its items.
+
+    Returns:
+        (first, last) token index ranges of the items, without DISTINCT
+    """
+    indexes = token_range(tokens, block.clauses.get("select", (0, 0)))
+    if indexes and tokens[indexes[0]].is_word("distinct"):
+        indexes = indexes[1:]
+    items = []
+    first = None
+    for i in indexes:
+        if tokens[i].depth == block.depth and tokens[i].kind == "comma":
+            if first is not None:
+                items.append((first, i))
+            first = None
+        elif first is None:
+            first = i
+    if first is not None:
+        items.append((first, indexes[-1] + 1))
+    return items
+
+
+def is_deterministic(tokens: list[Token], span: tuple[int, int]) -> bool:
+    """Whether a character range of the query calls no volatile function."""
+    return not any(
+        token.kind == "word" and VOLATILE_FUNCTIONS.fullmatch(token.text)
+        for token in tokens
+        if span[0] <= token.start < span[1]
+    )
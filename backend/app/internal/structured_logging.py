@@ -0,0 +1,120 @@
+import os
+import json
+import random
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, Union
+
+from app.internal.tracing import current_trace
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RESERVED_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as single-line JSON objects.
+
+    Fields passed with `extra=` are included as top-level keys, and the trace
+    ID of the HTTP request being served (if any) is added so log lines can be
+    joined with /debug/trace/{trace_id}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds")
+            .replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace = current_trace.get()
+        if trace is not None:
+            entry["trace_id"] = trace.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging():
+    """
+    Configure the root logger from the environment.
+
+    LOG_LEVEL sets the level (default INFO) and LOG_FORMAT selects "json"
+    (default) or "text" output.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+    else:
+        handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+
+
+def _truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "..."
+    if isinstance(value, (list, tuple)) and len(value) > 20:
+        return list(value[:20]) + [f"... {len(value) - 20} more"]
+    return value
+
+
+def log_event(
+    logger: logging.Logger,
+    event: str,
+    fields: Union[dict, Callable[[], dict], None] = None,
+    level: int = logging.DEBUG,
+    sample_rate: Optional[float] = None,
+    max_length: int = 200,
+):
+    """
+    Emit a structured log event, doing no work when it would be discarded.
+
+    The level check (and optional sampling) happens before anything is
+    formatted, and fields may be given as a callable so that expensive
+    payloads are only built for events that are actually emitted.
+
+    Args:
+        logger: Logger to emit on
+        event: Event name
+        fields: Event fields, or a zero-argument callable returning them
+        level: Logging level
+        sample_rate: Fraction of events to keep, defaults to LOG_SAMPLE_RATE
+            for DEBUG events and 1.0 otherwise
+        max_length: Strings longer than this are truncated
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate is None:
+        sample_rate = DEBUG_SAMPLE_RATE if level <= logging.DEBUG else 1.0
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+
+    if callable(fields):
+        fields = fields()
+    logger.log(
+        level,
+        event,
+        extra={
+            "event": event,
+            "fields": {
+                key: _truncate(value, max_length)
+                for key, value in (fields or {}).items()
+            },
+        },
+    )
+
+
+# Fraction of DEBUG events kept by log_event
+DEBUG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import duckdb
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+# Requests sending "X-DuckDB-Profile: true" keep DuckDB's profile of their queries
+PROFILE_HEADER = "X-DuckDB-Profile"
+_VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def truncate_text(value: Any, limit: int) -> Any:
+    """Truncate long strings, leaving other values untouched."""
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + f"... [{len(value) - limit} more characters]"
+    return value
+
+
+class Trace:
+    """
+    Everything recorded while serving one HTTP request.
+
+    Request contexts created while the request is being served register
+    themselves here (including those created on worker threads that run in a
+    copy of the request's context), so a batch request yields one trace with
+    an entry per prompt.
+    """
+
+    def __init__(
+        self, trace_id: str, method: str, path: str, profile_queries: bool = False
+    ):
+        self.trace_id = trace_id
+        self.method = method
+        self.path = path
+        # Whether DuckDB profiles the queries the request runs
+        self.profile_queries = profile_queries
+        self.created_at = time.time()
+        self.contexts: list = []
+        self._lock = threading.Lock()
+
+    def add_context(self, context):
+        with self._lock:
+            self.contexts.append(context)
+
+    def to_record(self, status: int, duration: float, text_limit: int) -> dict:
+        with self._lock:
+            contexts = list(self.contexts)
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "created_at": self.created_at,
+            "duration_seconds": round(duration, 6),
+            "requests": [context.to_trace(text_limit) for context in contexts],
+        }
+
+
+# Trace of the HTTP request currently being served, set by the middleware
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class TraceStore:
+    """
+    Bounded on-disk store of request traces, kept in a dedicated DuckDB file.
+
+    Traces are written by a background thread so requests never wait on the
+    store. Entries older than the retention period are deleted, and when the
+    store holds more than max_entries traces the least recently used ones
+    (by creation or last lookup) are evicted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        retention_seconds: Optional[float] = None,
+        text_limit: Optional[int] = None,
+    ):
+        self.path = path or os.getenv(
+            "TRACE_DB_PATH", os.path.join(tempfile.gettempdir(), "flockmtl_traces.db")
+        )
+        self.max_entries = max_entries or int(os.getenv("TRACE_MAX_ENTRIES", "10000"))
+        self.retention_seconds = retention_seconds or (
+            float(os.getenv("TRACE_RETENTION_HOURS", "24")) * 3600
+        )
+        self.text_limit = text_limit or int(os.getenv("TRACE_MAX_TEXT_LENGTH", "2000"))
+        self.enabled = _env_bool("TRACE_ENABLED", "true")
+        # Profiling writes and parses a file per query, so by default only
+        # requests sending PROFILE_HEADER are profiled
+        self.profile_queries = _env_bool("TRACE_DUCKDB_PROFILE", "false")
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=1000)
+        self._writer: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._dropped = 0
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        try:
+            self._conn = duckdb.connect(self.path)
+        except duckdb.Error as e:
+            # Another process may hold the file; keep traces in memory instead
+            logger.warning(f"Could not open trace store at {self.path}: {e}")
+            self._conn = duckdb.connect()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS traces (
+                trace_id VARCHAR,
+                created_at DOUBLE,
+                last_accessed DOUBLE,
+                method VARCHAR,
+                path VARCHAR,
+                status INTEGER,
+                duration_seconds DOUBLE,
+                payload VARCHAR
+            )
+            """
+        )
+        return self._conn
+
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name="trace-writer", daemon=True
+                    )
+                    self._writer.start()
+
+    def submit(self, record: dict):
+        """Queue a trace record for writing without blocking the caller."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            # Write whatever else has queued up in the same transaction
+            while len(records) < 100:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(records)
+            except Exception as e:
+                logger.error(f"Failed to write {len(records)} trace(s): {e}")
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def _write(self, records: list[dict]):
+        now = time.time()
+        rows = [
+            (
+                record["trace_id"],
+                record["created_at"],
+                now,
+                record["method"],
+                record["path"],
+                record["status"],
+                record["duration_seconds"],
+                json.dumps(record, default=str),
+            )
+            for record in records
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if now - self._last_prune > 60:
+                self._prune(conn, now)
+                self._last_prune = now
+
+    def _prune(self, conn, now: float):
+        conn.execute(
+            "DELETE FROM traces WHERE created_at < ?", [now - self.retention_seconds]
+        )
+        conn.execute(
+            """
+            DELETE FROM traces WHERE trace_id IN (
+                SELECT trace_id FROM traces
+                ORDER BY last_accessed DESC
+                OFFSET ?
+            )
+            """,
+            [self.max_entries],
+        )
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        """
+        Look up a trace by ID.
+
+        Args:
+            trace_id: Trace ID returned in the X-Trace-Id response header
+
+        Returns:
+            The trace, or None if it is unknown or has expired
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                """
+                SELECT payload FROM traces
+                WHERE trace_id = ? AND created_at >= ?
+                ORDER BY created_at DESC
+                LIMIT 1
+                """,
+                [trace_id, time.time() - self.retention_seconds],
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE traces SET last_accessed = ? WHERE trace_id = ?",
+                [time.time(), trace_id],
+            )
+        return json.loads(row[0])
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until queued traces have been written (used at shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            count = self._connect().execute("SELECT count(*) FROM traces").fetchone()
+        return {
+            "path": self.path,
+            "entries": count[0],
+            "max_entries": self.max_entries,
+            "retention_seconds": self.retention_seconds,
+            "queued": self._queue.qsize(),
+            "dropped": self._dropped,
+        }
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware giving every HTTP request a trace ID.
+
+    The ID is returned in the X-Trace-Id header (a well-formed ID sent by the
+    client is reused). Queries are profiled when TRACE_DUCKDB_PROFILE is set
+    or the request sends "X-DuckDB-Profile: true". Requests that ran
+    pipeline work are persisted to the trace store once the response,
+    including any streamed body, is complete.
+    """
+
+    def __init__(self, app, store: "TraceStore" = None):
+        self.app = app
+        self.store = store or trace_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.store.enabled:
+            return await self.app(scope, receive, send)
+
+        trace_id = None
+        profile_queries = self.store.profile_queries
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER.lower().encode():
+                candidate = value.decode("latin-1")
+                if _VALID_TRACE_ID.match(candidate):
+                    trace_id = candidate
+            elif name == PROFILE_HEADER.lower().encode():
+                profile_queries = value.decode("latin-1").lower() == "true"
+        trace = Trace(
+            trace_id or uuid.uuid4().hex,
+            scope["method"],
+            scope["path"],
+            profile_queries,
+        )
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (TRACE_HEADER.lower().encode(), trace.trace_id.encode())
+                ]
+            await send(message)
+
+        token = current_trace.set(trace)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            if trace.contexts:
+                self.store.submit(
+                    trace.to_record(
+                        status["code"],
+                        time.perf_counter() - start_time,
+                        self.store.text_limit,
+                    )
+                )
+                for context in trace.contexts:
+                    context.finish()
+
+
+# Global trace store
+trace_store = TraceStore()
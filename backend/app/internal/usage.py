@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# ASGI scope of the HTTP request currently being served, set by the middleware
+_current_scope: ContextVar[Optional[dict]] = ContextVar("current_scope", default=None)
+
+
+def current_endpoint() -> str:
+    """
+    Endpoint label of the HTTP request currently being served.
+
+    Returns:
+        Its route template (e.g. /jobs/{job_id}), as MetricsMiddleware labels
+        requests; "unmatched" if no route serves it and "internal" outside
+        HTTP requests
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        return "internal"
+    # The router records the matched route in the scope before the endpoint runs
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+# USD per 1M tokens: (input, cached input, output). Override or extend with
+# LLM_PRICING_JSON, e.g. '{"my-model": [1.0, 0.5, 4.0]}'.
+DEFAULT_MODEL_PRICING = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+}
+
+OVERFLOW_KEY = ("other", "other", "other")
+
+
+def _load_pricing() -> dict[str, tuple[float, float, float]]:
+    pricing = dict(DEFAULT_MODEL_PRICING)
+    override = os.getenv("LLM_PRICING_JSON")
+    if override:
+        try:
+            pricing.update(
+                {model: tuple(prices) for model, prices in json.loads(override).items()}
+            )
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring invalid LLM_PRICING_JSON: {e}")
+    return pricing
+
+
+def extract_usage(response) -> dict[str, int]:
+    """
+    Read token counts from an OpenAI chat completion response.
+
+    Returns:
+        Dictionary with input_tokens, output_tokens and cached_tokens
+    """
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "output_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+    }
+
+
+class UsageTracker:
+    """
+    Aggregates LLM token usage, latency and estimated cost in memory.
+
+    Counters are kept per (endpoint, stage, model). The number of distinct
+    keys is bounded; once the limit is reached, new combinations are folded
+    into a single "other" bucket so memory stays constant.
+    """
+
+    def __init__(self, max_keys: Optional[int] = None):
+        self.max_keys = max_keys or int(os.getenv("LLM_USAGE_MAX_KEYS", "256"))
+        self.pricing = _load_pricing()
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, str, str], dict[str, Any]] = {}
+        self._started_at = time.time()
+
+    def estimate_cost(
+        self, model: str, input_tokens: int, output_tokens: int, cached_tokens: int
+    ) -> float:
+        """
+        Estimate the USD cost of a call from its token counts.
+
+        Unknown models are matched by longest known prefix (so dated model
+        snapshots use their base model's price) and cost 0 otherwise.
+        """
+        prices = self.pricing.get(model)
+        if prices is None:
+            matches = [name for name in self.pricing if model.startswith(name)]
+            if not matches:
+                return 0.0
+            prices = self.pricing[max(matches, key=len)]
+
+        input_price, cached_price, output_price = prices
+        uncached_tokens = max(0, input_tokens - cached_tokens)
+        return (
+            uncached_tokens * input_price
+            + cached_tokens * cached_price
+            + output_tokens * output_price
+        ) / 1_000_000
+
+    def record(
+        self,
+        stage: str,
+        model: str,
+        latency: float,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        cached_tokens: int = 0,
+        error: bool = False,
+        endpoint: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """
+        Record one LLM call.
+
+        Args:
+            stage: Pipeline stage that made the call (e.g. "sql_generation")
+            model: Model identifier
+            latency: Wall time of the call in seconds, including retries
+            input_tokens: Prompt tokens
+            output_tokens: Completion tokens
+            cached_tokens: Prompt tokens served from the provider's cache
+            error: Whether the call failed
+            endpoint: Endpoint label, defaults to the current request's endpoint
+
+        Returns:
+            The recorded call, including its estimated cost
+        """
+        endpoint = endpoint or current_endpoint()
+        cost = self.estimate_cost(model, input_tokens, output_tokens, cached_tokens)
+        key = (endpoint, stage, model)
+
+        with self._lock:
+            counters = self._counters.get(key)
+            if counters is None:
+                if len(self._counters) >= self.max_keys:
+                    key = OVERFLOW_KEY
+                    counters = self._counters.get(key)
+                if counters is None:
+                    counters = self._counters[key] = {
+                        "calls": 0,
+                        "errors": 0,
+                        "input_tokens": 0,
+                        "output_tokens": 0,
+                        "cached_tokens": 0,
+                        "latency_seconds_total": 0.0,
+                        "latency_seconds_max": 0.0,
+                        "estimated_cost_usd": 0.0,
+                    }
+
+            counters["calls"] += 1
+            counters["errors"] += int(error)
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+            counters["cached_tokens"] += cached_tokens
+            counters["latency_seconds_total"] += latency
+            counters["latency_seconds_max"] = max(
+                counters["latency_seconds_max"], latency
+            )
+            counters["estimated_cost_usd"] += cost
+
+        return {
+            "endpoint": endpoint,
+            "stage": stage,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_seconds": latency,
+            "estimated_cost_usd": cost,
+            "error": error,
+        }
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return all counters plus totals, grouped by endpoint and stage."""
+        with self._lock:
+            entries = [
+                {"endpoint": endpoint, "stage": stage, "model": model, **counters}
+                for (endpoint, stage, model), counters in self._counters.items()
+            ]
+
+        totals = {
+            field: sum(entry[field] for entry in entries)
+            for field in (
+                "calls",
+                "errors",
+                "input_tokens",
+                "output_tokens",
+                "cached_tokens",
+                "estimated_cost_usd",
+            )
+        }
+        for entry in entries:
+            entry["latency_seconds_avg"] = (
+                entry["latency_seconds_total"] / entry["calls"] if entry["calls"] else 0
+            )
+
+        return {
+            "since": self._started_at,
+            "totals": totals,
+            "by_endpoint_stage": sorted(
+                entries, key=lambda entry: entry["estimated_cost_usd"], reverse=True
+            ),
+        }
+
+    def reset(self):
+        """Clear all counters."""
+        with self._lock:
+            self._counters.clear()
+            self._started_at = time.time()
+
+
+class UsageContextMiddleware:
+    """
+    ASGI middleware that labels LLM usage with the request's route template.
+
+    Templates rather than raw paths keep one usage key per endpoint, however
+    many table names or job IDs its paths carry.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
+
+
+# Global usage tracker
+usage_tracker = UsageTracker()
@@ -1,14 +1,23 @@
+import os
 import logging
 import time
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import pipeline, data
+from starlette.concurrency import run_in_threadpool
+from app.routers import pipeline, data, monitoring
 from app.dependencies import get_system_status
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+from app.internal.job_queue import job_queue
+from app.internal.llm_client import llm_client
+from app.internal.process_pool import process_pool
+from app.internal.usage import UsageContextMiddleware
+from app.internal.metrics import MetricsMiddleware
+from app.internal.responses import FastJSONResponse
+from app.internal.tracing import TRACE_HEADER, TraceMiddleware, trace_store
+from app.internal.structured_logging import configure_logging
+from app.internal.compression import CompressionMiddleware
+
+# Configure logging (JSON lines by default, see LOG_LEVEL and LOG_FORMAT)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app with metadata
@@ -18,6 +27,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
 )
 
 # Configure CORS
@@ -27,11 +37,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER],
 )
 
+# Content-negotiated response compression (zstd/brotli when installed, gzip)
+app.add_middleware(CompressionMiddleware)
+
+# Attribute LLM usage to the endpoint that triggered it
+app.add_middleware(UsageContextMiddleware)
+
+# Trace ID per request; pipeline traces are kept for /debug/trace/{trace_id}
+app.add_middleware(TraceMiddleware)
+
+# Request latency histograms and in-flight gauge for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(pipeline.router, tags=["pipeline"])
 app.include_router(data.router, prefix="/data", tags=["data"])
+app.include_router(monitoring.router, tags=["monitoring"])
 
 
 @app.get("/", summary="Root endpoint", description="Basic health check endpoint")
@@ -117,6 +141,13 @@ async def startup_event():
         if system_status.get("environment", {}).get("load_sample_data"):
             logger.info("  - Sample data loading: ENABLED")
 
+        # Open LLM API connections now so the first request skips the handshakes
+        if system_status.get("openai_configured") or os.getenv("OPENAI_BASE_URL"):
+            await run_in_threadpool(llm_client.warm_up)
+
+        # Resume background jobs queued before a restart
+        job_queue.start()
+
         logger.info("FlockMTL API startup completed successfully")
 
     except Exception as e:
@@ -127,5 +158,7 @@ async def startup_event():
 async def shutdown_event():
     """Application shutdown event handler."""
     logger.info("Shutting down FlockMTL API...")
-    # Add any cleanup operations here if needed
+    llm_client.close()
+    process_pool.shutdown()
+    trace_store.flush()
     logger.info("FlockMTL API shutdown completed")
@@ -1,15 +1,36 @@
+import time
+import json
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from typing import List
-import pandas as pd
-import duckdb
 import os
 import tempfile
 from pathlib import Path
 
-from app.internal.database import conn, get_all_tables, get_table_schema, execute_query
+from app.internal.database import (
+    conn,
+    cursor_pool,
+    get_all_tables,
+    get_table_schema,
+    execute_query,
+)
+from app.internal.ingestion import (
+    list_duckdb_tables,
+    read_csv_table,
+    read_duckdb_table,
+)
+from app.internal.process_pool import process_pool
 from app.internal.db_manager import get_database_info
+from app.internal.catalog import catalog_versions
+from app.internal.metrics import STAGE_DURATION
+from app.internal.responses import (
+    FastJSONResponse as JSONResponse,
+    cache_headers,
+    etag_matches,
+    make_etag,
+    not_modified,
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -24,6 +45,7 @@ async def upload_csv(files: List[UploadFile] = File(...)):
         uploaded_tables = []
 
         for file in files:
+            start_time = time.perf_counter()
             if not file.filename.endswith(".csv"):
                 raise HTTPException(
                     status_code=400, detail=f"File {file.filename} is not a CSV file"
@@ -43,20 +65,25 @@ async def upload_csv(files: List[UploadFile] = File(...)):
                 tmp_file_path = tmp_file.name
 
             try:
-                # Read CSV with pandas to handle various formats
-                df = pd.read_csv(tmp_file_path)
 
-                # Clean column names
-                df.columns = [
-                    col.lower().replace(" ", "_").replace("-", "_")
-                    for col in df.columns
-                ]
-
-                # Drop existing table if it exists
-                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
-
-                # Create table from DataFrame
-                conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df")
+                def create_table(_, uploaded):
+                    with cursor_pool.cursor() as cursor:
+                        # Drop existing table if it exists
+                        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+                        # Create table from the parsed CSV
+                        cursor.execute(
+                            f"CREATE TABLE {table_name} AS SELECT * FROM uploaded"
+                        )
+
+                # Parsed in a worker process when the process pool is enabled
+                await run_in_threadpool(
+                    process_pool.load_tables,
+                    read_csv_table,
+                    tmp_file_path,
+                    consume=create_table,
+                )
+                catalog_versions.bump(table_name)
 
                 # Get table info
                 row_count = conn.execute(
@@ -75,6 +102,9 @@ async def upload_csv(files: List[UploadFile] = File(...)):
                         "columns": columns,
                     }
                 )
+                STAGE_DURATION.observe(
+                    time.perf_counter() - start_time, stage="upload_ingestion"
+                )
 
             finally:
                 # Clean up temporary file
@@ -94,6 +124,7 @@ async def upload_csv(files: List[UploadFile] = File(...)):
 @router.post("/upload-duckdb")
 async def upload_duckdb(file: UploadFile = File(...)):
     """Upload a DuckDB database file"""
+    start_time = time.perf_counter()
     try:
         if not file.filename.endswith(".db") and not file.filename.endswith(".duckdb"):
             raise HTTPException(
@@ -110,55 +141,47 @@ async def upload_duckdb(file: UploadFile = File(...)):
             tmp_file_path = tmp_file.name
 
         try:
-            # Connect to the uploaded database
-            uploaded_conn = duckdb.connect(tmp_file_path, read_only=True)
-
-            # Get all tables from uploaded database
-            tables = uploaded_conn.execute("SHOW TABLES").fetchall()
 
+            def import_table(table_name, uploaded):
+                columns_info = json.loads(uploaded.schema.metadata[b"duckdb_columns"])
+                with cursor_pool.cursor() as cursor:
+                    # Copy table to main connection
+                    cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+                    # Create table structure
+                    column_defs = [
+                        f"{col_name} {col_type}" for col_name, col_type in columns_info
+                    ]
+                    cursor.execute(
+                        f"CREATE TABLE {table_name} ({', '.join(column_defs)})"
+                    )
+
+                    # Insert data
+                    cursor.execute(f"INSERT INTO {table_name} SELECT * FROM uploaded")
+                catalog_versions.bump(table_name)
+
+                return {
+                    "table_name": table_name,
+                    "row_count": uploaded.num_rows,
+                    "columns": [col_name for col_name, _ in columns_info],
+                }
+
+            # One table at a time, each read in a worker process when the
+            # process pool is enabled
             imported_tables = []
-
-            for table_row in tables:
-                table_name = table_row[0]
-
-                # Copy table to main connection
-                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
-
-                # Get data from uploaded database and create table in main database
-                data = uploaded_conn.execute(f"SELECT * FROM {table_name}").fetchall()
-                columns_info = uploaded_conn.execute(
-                    f"DESCRIBE {table_name}"
-                ).fetchall()
-
-                # Create table structure
-                column_defs = []
-                for col_info in columns_info:
-                    col_name, col_type = col_info[0], col_info[1]
-                    column_defs.append(f"{col_name} {col_type}")
-
-                create_table_sql = (
-                    f"CREATE TABLE {table_name} ({', '.join(column_defs)})"
-                )
-                conn.execute(create_table_sql)
-
-                # Insert data
-                if data:
-                    placeholders = ", ".join(["?"] * len(columns_info))
-                    insert_sql = f"INSERT INTO {table_name} VALUES ({placeholders})"
-                    conn.executemany(insert_sql, data)
-
-                row_count = len(data)
-                columns = [col_info[0] for col_info in columns_info]
-
-                imported_tables.append(
-                    {
-                        "table_name": table_name,
-                        "row_count": row_count,
-                        "columns": columns,
-                    }
+            for table_name in await run_in_threadpool(
+                list_duckdb_tables, tmp_file_path
+            ):
+                imported_tables += await run_in_threadpool(
+                    process_pool.load_tables,
+                    read_duckdb_table,
+                    tmp_file_path,
+                    table_name,
+                    consume=import_table,
                 )
-
-            uploaded_conn.close()
+            STAGE_DURATION.observe(
+                time.perf_counter() - start_time, stage="upload_ingestion"
+            )
 
         finally:
             # Clean up temporary file
@@ -176,34 +199,52 @@ async def upload_duckdb(file: UploadFile = File(...)):
 
 
 @router.get("/tables")
-async def get_tables():
+async def get_tables(request: Request):
     """Get list of all available tables"""
+    # Any table change bumps the global version, row counts included
+    etag = make_etag("tables", catalog_versions.current())
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
     try:
-        tables_info = get_all_tables()
-        return JSONResponse(content={"tables": tables_info})
+        # Waits for a pooled cursor, which LLM queries may hold for long
+        tables_info = await run_in_threadpool(get_all_tables)
+        return JSONResponse(
+            content={"tables": tables_info}, headers=cache_headers(etag)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/tables/{table_name}/schema")
-async def get_table_schema_endpoint(table_name: str):
+async def get_table_schema_endpoint(table_name: str, request: Request):
     """Get schema for a specific table"""
+    etag = make_etag("schema", table_name.lower(), catalog_versions.version(table_name))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
     try:
-        schema = get_table_schema(table_name)
-        return JSONResponse(content={"table_name": table_name, "schema": schema})
+        schema = await run_in_threadpool(get_table_schema, table_name)
+        return JSONResponse(
+            content={"table_name": table_name, "schema": schema},
+            headers=cache_headers(etag),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/tables/{table_name}/preview")
-async def get_table_preview(table_name: str, limit: int = 10):
+async def get_table_preview(table_name: str, request: Request, limit: int = 10):
     """Get a preview of table data"""
+    etag = make_etag(
+        "preview", table_name.lower(), limit, catalog_versions.version(table_name)
+    )
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
     try:
         query = f"SELECT * FROM {table_name} LIMIT {limit}"
-        result = execute_query(query)
+        result = await run_in_threadpool(execute_query, query)
 
         # Get column names
-        columns_info = get_table_schema(table_name)
+        columns_info = await run_in_threadpool(get_table_schema, table_name)
         columns = [col[0] for col in columns_info]
 
         # Convert result to list of dictionaries
@@ -215,7 +256,8 @@ async def get_table_preview(table_name: str, limit: int = 10):
                 "columns": columns,
                 "data": preview_data,
                 "showing": min(limit, len(result)),
-            }
+            },
+            headers=cache_headers(etag),
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -226,6 +268,7 @@ async def delete_table(table_name: str):
     """Delete a table"""
     try:
         conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        catalog_versions.bump(table_name)
         logger.info(f"Table '{table_name}' deleted successfully")
         return JSONResponse(
             content={"message": f"Table {table_name} deleted successfully"}
@@ -243,7 +286,7 @@ async def get_data_status():
         db_info = get_database_info()
 
         # Get table information
-        tables_info = get_all_tables()
+        tables_info = await run_in_threadpool(get_all_tables)
 
         # Calculate statistics
         total_tables = len(tables_info) if isinstance(tables_info, list) else 0
@@ -0,0 +1,38 @@
+import logging
+from typing import Any
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.internal.usage import usage_tracker
+from app.internal.metrics import registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Expose stage latency histograms and runtime gauges in Prometheus text format."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/usage")
+async def get_usage() -> Any:
+    """Get LLM token usage, latency and estimated cost per endpoint and stage."""
+    try:
+        return usage_tracker.snapshot()
+    except Exception as e:
+        error_msg = f"Failed to get usage snapshot: {str(e)}"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+
+@router.post("/usage/reset")
+async def reset_usage() -> Any:
+    """Reset the aggregated LLM usage counters."""
+    usage_tracker.reset()
+    logger.info("Usage counters reset")
+    return {"status": "usage counters reset"}
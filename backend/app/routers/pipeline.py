@@ -1,25 +1,54 @@
+import os
+import time
+import asyncio
 import logging
-from typing import Any
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
+from typing import Any, Literal, Optional
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 from app.dependencies import query_pipeline_manager
+from app.internal.single_flight import make_request_key, request_coalescer
+from app.internal.metrics import STAGE_DURATION
+from app.internal.responses import FastJSONResponse, dumps
+from app.internal.request_context import RequestContext, request_progress
+from app.internal.job_queue import job_queue
+from app.internal.result_handles import result_handles
+from app.internal.tracing import trace_store
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Seconds between progress events, and how long a progress stream waits for
+# a request that has not started yet
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL_SECONDS", "0.5"))
+PROGRESS_WAIT = float(os.getenv("PROGRESS_WAIT_SECONDS", "10"))
+
 
 # Request/Response Models
 class GeneratePipelineRequest(BaseModel):
     prompt: str
     selected_tables: list[str] = []
+    include_debug: bool = False  # Embed full debug info (also via X-Debug header)
+    progressive: bool = False  # Return a sampled preview, full result via handle
+
+
+class GenerateResponseTableBatchRequest(BaseModel):
+    prompts: list[str] = Field(..., min_length=1, max_length=1000)
+    selected_tables: list[str] = []
+    max_concurrency: Optional[int] = Field(None, ge=1, le=64)
 
 
 class GenerateQueryPlanRequest(BaseModel):
     query: str
 
 
+class EstimateQueryRequest(BaseModel):
+    query: str
+
+
 class RegenerateResponseTableRequest(BaseModel):
     prompt: str
     generated_query: str
@@ -34,24 +63,62 @@ class RunQueryWithRefinementRequest(BaseModel):
 
 class GenerateInputQueryResponseTableRequest(BaseModel):
     query: str
+    progressive: bool = False
+
+
+class SubmitJobRequest(BaseModel):
+    prompt: Optional[str] = None  # Generate and run a query for this prompt ...
+    query: Optional[str] = None  # ... or run this SQL query
+    selected_tables: list[str] = []
+    priority: Literal["interactive", "batch"] = "interactive"
 
 
 class TestQueryRequest(BaseModel):
     query: str
 
 
+def _debug_requested(flag: bool, header: Optional[str]) -> bool:
+    """Check whether full debug info was requested by body flag or X-Debug header."""
+    return flag or (header or "").strip().lower() in ("1", "true", "yes", "on")
+
+
 # Main Pipeline Endpoints
 @router.post("/generate-response-table")
-async def generate_pipeline(request: GeneratePipelineRequest) -> Any:
-    """Generate and execute a response table from a natural language prompt."""
+async def generate_pipeline(
+    request: GeneratePipelineRequest,
+    x_debug: Optional[str] = Header(None),
+) -> Any:
+    """
+    Generate and execute a response table from a natural language prompt.
+
+    Responses carry a compact timing summary; full debug information is only
+    included when requested with include_debug or an X-Debug: true header.
+    """
     try:
-        logger.info(f"Generating response table for prompt: {request.prompt[:100]}...")
-        logger.info(f"Selected tables: {request.selected_tables}")
-        result = query_pipeline_manager.generate_response_table(
-            request.prompt, request.selected_tables
+        logger.info("Generating response table for prompt: %.100s...", request.prompt)
+        logger.info("Selected tables: %s", request.selected_tables)
+        include_debug = _debug_requested(request.include_debug, x_debug)
+
+        # Identical concurrent requests share a single pipeline run
+        key = make_request_key(
+            "generate-response-table"
+            + (":debug" if include_debug else "")
+            + (":progressive" if request.progressive else ""),
+            request.prompt,
+            request.selected_tables,
+        )
+        result = await request_coalescer.do(
+            key,
+            lambda: run_in_threadpool(
+                query_pipeline_manager.generate_response_table,
+                request.prompt,
+                request.selected_tables,
+                include_debug,
+                progressive=request.progressive,
+            ),
         )
         logger.info("Response table generated successfully")
-        return result
+        return FastJSONResponse(result)
 
     except Exception as e:
         error_msg = f"Pipeline generation failed: {str(e)}"
@@ -59,14 +126,41 @@ async def generate_pipeline(request: GeneratePipelineRequest) -> Any:
         raise HTTPException(status_code=500, detail=error_msg)
 
 
+@router.post("/generate-response-table/batch")
+async def generate_pipeline_batch(request: GenerateResponseTableBatchRequest) -> Any:
+    """
+    Generate response tables for many prompts at once.
+
+    Results are streamed back as newline-delimited JSON, one line per prompt
+    in completion order; each line carries the index of its prompt.
+    """
+    logger.info("Generating response tables for batch of %d", len(request.prompts))
+
+    def stream_results():
+        try:
+            for result in query_pipeline_manager.generate_response_table_batch(
+                request.prompts, request.selected_tables, request.max_concurrency
+            ):
+                with STAGE_DURATION.time(stage="serialization"):
+                    line = dumps(result) + b"\n"
+                yield line
+        except Exception as e:
+            logger.error(f"Batch generation failed: {e}")
+            yield dumps({"error": f"Batch generation failed: {str(e)}"}) + b"\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @router.post("/generate-query-plan")
 async def generate_query_plan(request: GenerateQueryPlanRequest) -> Any:
     """Generate a query execution plan from a query string."""
     try:
-        logger.info(f"Generating query plan for: {request.query[:100]}...")
-        result = query_pipeline_manager.generate_query_plan(request.query)
+        logger.info("Generating query plan for: %.100s...", request.query)
+        result = await run_in_threadpool(
+            query_pipeline_manager.generate_query_plan, request.query
+        )
         logger.info("Query plan generated successfully")
-        return result
+        return FastJSONResponse(result)
 
     except Exception as e:
         error_msg = f"Query plan generation failed: {str(e)}"
@@ -74,6 +168,27 @@ async def generate_query_plan(request: GenerateQueryPlanRequest) -> Any:
         raise HTTPException(status_code=500, detail=error_msg)
 
 
+@router.post("/estimate-query")
+async def estimate_query(request: EstimateQueryRequest) -> Any:
+    """
+    Estimate the LLM calls, tokens, cost and time of running a query.
+
+    Nothing is executed against a model, so the UI can show the estimate
+    (and whether the query is within the LLM budget) before running it.
+    """
+    try:
+        logger.info("Estimating query: %.100s...", request.query)
+        result = await run_in_threadpool(
+            query_pipeline_manager.analyze_query, request.query
+        )
+        return FastJSONResponse({"query": request.query, **result})
+
+    except Exception as e:
+        error_msg = f"Query estimation failed: {str(e)}"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+
 @router.post("/regenerate-response-table")
 async def regenerate_response_table(request: RegenerateResponseTableRequest) -> Any:
     """Regenerate a response table based on prompt and previous query."""
@@ -81,11 +196,14 @@ async def regenerate_response_table(request: RegenerateResponseTableRequest) ->
         logger.info(
             f"Regenerating response table for prompt: {request.prompt[:100]}..."
         )
-        result = query_pipeline_manager.regenerate_response_table(
-            request.prompt, request.generated_query, request.selected_tables
+        result = await run_in_threadpool(
+            query_pipeline_manager.regenerate_response_table,
+            request.prompt,
+            request.generated_query,
+            request.selected_tables,
         )
         logger.info("Response table regenerated successfully")
-        return result
+        return FastJSONResponse(result)
 
     except Exception as e:
         error_msg = f"Response table regeneration failed: {str(e)}"
@@ -97,12 +215,15 @@ async def regenerate_response_table(request: RegenerateResponseTableRequest) ->
 async def run_query_with_refinement(request: RunQueryWithRefinementRequest) -> Any:
     """Run a query with pipeline refinement."""
     try:
-        logger.info(f"Running query with refinement: {request.query[:100]}...")
-        result = query_pipeline_manager.run_pipeline_with_refinement(
-            request.query, request.pipeline, request.original_prompt
+        logger.info("Running query with refinement: %.100s...", request.query)
+        result = await run_in_threadpool(
+            query_pipeline_manager.run_pipeline_with_refinement,
+            request.query,
+            request.pipeline,
+            request.original_prompt,
         )
         logger.info("Query with refinement executed successfully")
-        return result
+        return FastJSONResponse(result)
 
     except Exception as e:
         error_msg = f"Query refinement execution failed: {str(e)}"
@@ -116,12 +237,15 @@ async def generate_input_query_response_table(
 ) -> Any:
     """Generate response table from direct query input."""
     try:
-        logger.info(f"Generating input query response for: {request.query[:100]}...")
-        result = query_pipeline_manager.generate_input_query_response_table(
-            request.query
+        logger.info("Generating input query response for: %.100s...", request.query)
+        # Off the event loop, so progress streams are served meanwhile
+        result = await run_in_threadpool(
+            query_pipeline_manager.generate_input_query_response_table,
+            request.query,
+            progressive=request.progressive,
         )
         logger.info("Input query response generated successfully")
-        return result
+        return FastJSONResponse(result)
 
     except Exception as e:
         error_msg = f"Input query response generation failed: {str(e)}"
@@ -129,6 +253,134 @@ async def generate_input_query_response_table(
         raise HTTPException(status_code=500, detail=error_msg)
 
 
+@router.get("/results/{handle}")
+async def get_result(handle: str) -> Any:
+    """
+    Poll the full result of a query that returned a progressive preview.
+
+    The status is "queued" or "running" until the query finishes, then
+    "done" with the result (query, table, execution_time), "failed" with the
+    error or "cancelled". GET /progress/{handle} streams its progress.
+    """
+    entry = result_handles.get(handle)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle")
+    return FastJSONResponse(entry)
+
+
+@router.post("/results/{handle}/cancel")
+async def cancel_result(handle: str) -> Any:
+    """Cancel the full run behind a result handle, e.g. once its preview is enough."""
+    entry = await run_in_threadpool(result_handles.cancel, handle)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle")
+    return FastJSONResponse(entry)
+
+
+@router.post("/jobs")
+async def submit_job(request: SubmitJobRequest) -> Any:
+    """
+    Run a prompt or SQL query as a background job.
+
+    The job outlives the HTTP request: poll GET /jobs/{job_id} for its status
+    and fetch the response table from GET /jobs/{job_id}/result when it is
+    done. Interactive jobs are started before batch jobs.
+    """
+    if (request.prompt is None) == (request.query is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of prompt or query"
+        )
+    if request.query is not None:
+        kind, payload = "query", {"query": request.query}
+    else:
+        kind = "response_table"
+        payload = {
+            "prompt": request.prompt,
+            "selected_tables": request.selected_tables,
+        }
+    job = await run_in_threadpool(job_queue.submit, kind, payload, request.priority)
+    return FastJSONResponse(job, status_code=202)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Any:
+    """
+    Get the status of a background job.
+
+    The status is "queued", "running", "done", "failed" or "cancelled".
+    """
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return FastJSONResponse(job)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str) -> Any:
+    """
+    Get the result of a finished background job.
+
+    Responds with 409 while the job is queued or running, or if it failed
+    or was cancelled (the detail carries the job's status and error).
+    """
+    job = await run_in_threadpool(job_queue.get, job_id, True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if job["status"] != "done":
+        raise HTTPException(
+            status_code=409,
+            detail={"status": job["status"], "error": job["error"]},
+        )
+    return FastJSONResponse(job["result"])
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str) -> Any:
+    """Cancel a queued or running background job."""
+    job = await run_in_threadpool(job_queue.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return FastJSONResponse(job)
+
+
+def _sse(event: str, data: dict) -> bytes:
+    """Format a Server-Sent Event."""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+@router.get("/progress/{request_id}")
+async def stream_progress(request_id: str, request: Request) -> Any:
+    """
+    Stream the progress of a running request as Server-Sent Events.
+
+    The request is identified by its trace ID (send an X-Trace-Id header
+    with the request to watch it) or by a job ID. A "progress" event with
+    the current stage, elapsed time, percentage and rows processed is sent
+    every PROGRESS_INTERVAL_SECONDS while it runs; an "end" event follows
+    once it has finished ("finished") or if it never started ("unknown").
+    """
+
+    async def events():
+        deadline = time.monotonic() + PROGRESS_WAIT
+        seen = False
+        while not await request.is_disconnected():
+            progress = await run_in_threadpool(request_progress, request_id)
+            if progress is not None:
+                seen = True
+                yield _sse("progress", progress)
+            elif seen or time.monotonic() > deadline:
+                status = "finished" if seen else "unknown"
+                yield _sse("end", {"request_id": request_id, "status": status})
+                return
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/generate-plot-config")
 async def generate_plot_config(request: Request) -> Any:
     """Generate plot configuration from prompt and table data."""
@@ -142,10 +394,12 @@ async def generate_plot_config(request: Request) -> Any:
         if not table:
             raise HTTPException(status_code=400, detail="Table data is required")
 
-        logger.info(f"Generating plot config for prompt: {prompt[:100]}...")
-        result = query_pipeline_manager.generate_plot_config(prompt, table)
+        logger.info("Generating plot config for prompt: %.100s...", prompt)
+        result = await run_in_threadpool(
+            query_pipeline_manager.generate_plot_config, prompt, table
+        )
         logger.info("Plot configuration generated successfully")
-        return result
+        return FastJSONResponse(result)
 
     except HTTPException:
         raise  # Re-raise HTTP exceptions as-is
@@ -156,25 +410,26 @@ async def generate_plot_config(request: Request) -> Any:
 
 
 # Debug Endpoints
-@router.get("/debug/info")
-async def get_debug_info() -> Any:
-    """Get current debug information from the query pipeline manager."""
+@router.get("/debug/trace/{trace_id}")
+async def get_trace(trace_id: str) -> Any:
+    """Get the stored trace of a request by the ID from its X-Trace-Id header."""
     try:
-        debug_info = query_pipeline_manager.get_debug_info()
-        logger.debug("Debug info retrieved successfully")
-        return {
-            "debug_info": debug_info,
-            "status": "success",
-        }
+        trace = await run_in_threadpool(trace_store.get, trace_id)
     except Exception as e:
-        error_msg = f"Failed to get debug info: {str(e)}"
+        error_msg = f"Failed to get trace: {str(e)}"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
+    if trace is None:
+        raise HTTPException(
+            status_code=404, detail=f"Trace '{trace_id}' not found or expired"
+        )
+    return {"trace": trace, "status": "success"}
+
 
 @router.post("/debug/clear")
 async def clear_debug_info() -> Any:
-    """Clear debug information."""
+    """Clear aggregated debug information."""
     try:
         query_pipeline_manager.clear_debug_info()
         logger.info("Debug info cleared successfully")
@@ -189,19 +444,19 @@ async def clear_debug_info() -> Any:
 async def test_query_execution(request: TestQueryRequest) -> Any:
     """Test query execution with detailed debug information."""
     try:
-        logger.info(f"Testing query execution: {request.query[:100]}...")
+        logger.info("Testing query execution: %.100s...", request.query)
 
-        # Clear previous debug info
-        query_pipeline_manager.clear_debug_info()
-
-        # Execute query with debug info
-        result = query_pipeline_manager.execute_sql_query(request.query)
+        # Execute query with debug info collected for this request only
+        context = RequestContext()
+        result = await run_in_threadpool(
+            query_pipeline_manager.execute_sql_query, request.query, context
+        )
 
         logger.info("Query test executed successfully")
         return {
             "query": request.query,
             "result": result,
-            "debug_info": query_pipeline_manager.get_debug_info(),
+            "debug_info": query_pipeline_manager.get_debug_info(context),
             "status": "success",
         }
     except Exception as e:
@@ -210,7 +465,7 @@ async def test_query_execution(request: TestQueryRequest) -> Any:
         return {
             "query": request.query,
             "result": None,
-            "debug_info": query_pipeline_manager.get_debug_info(),
+            "debug_info": query_pipeline_manager.get_debug_info(context),
             "error": error_msg,
             "status": "error",
         }
@@ -220,19 +475,19 @@ async def test_query_execution(request: TestQueryRequest) -> Any:
 async def test_query_generation(request: GeneratePipelineRequest) -> Any:
     """Test query generation with detailed debug information."""
     try:
-        logger.info(f"Testing query generation: {request.prompt[:100]}...")
+        logger.info("Testing query generation: %.100s...", request.prompt)
 
-        # Clear previous debug info
-        query_pipeline_manager.clear_debug_info()
-
-        # Generate query with debug info
-        generated_query = query_pipeline_manager.generate_sql_query(request.prompt)
+        # Generate query with debug info collected for this request only
+        context = RequestContext()
+        generated_query = await run_in_threadpool(
+            query_pipeline_manager.generate_sql_query, request.prompt, context=context
+        )
 
         logger.info("Query generation test completed successfully")
         return {
             "prompt": request.prompt,
             "generated_query": generated_query,
-            "debug_info": query_pipeline_manager.get_debug_info(),
+            "debug_info": query_pipeline_manager.get_debug_info(context),
             "status": "success",
         }
     except Exception as e:
@@ -241,7 +496,7 @@ async def test_query_generation(request: GeneratePipelineRequest) -> Any:
         return {
             "prompt": request.prompt,
             "generated_query": None,
-            "debug_info": query_pipeline_manager.get_debug_info(),
+            "debug_info": query_pipeline_manager.get_debug_info(context),
             "error": error_msg,
             "status": "error",
         }
@@ -0,0 +1,140 @@
+"""
+Response compression benchmark over simulated links.
+
+Builds response-table payloads shaped like the sample customers table (wide
+customer_notes text), then reports for each available encoding the payload
+size, compression and decompression time, and the resulting end-to-end time
+on simulated links: one round trip plus size / bandwidth, plus the codec
+time on both ends.
+
+Usage (from the backend directory):
+    python -m benchmarks.compression [--rows 100 1000 10000] [--repeat 5]
+"""
+
+import csv
+import gzip
+import time
+import random
+import argparse
+from pathlib import Path
+
+from app.internal.compression import available_encoders
+from app.internal.responses import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SAMPLE_CSV = Path(__file__).parent.parent / "app/internal/data/customers.csv"
+
+# name: (bandwidth in Mbit/s, round-trip time in seconds)
+LINKS = {
+    "3G (1 Mbit/s, 150 ms)": (1, 0.150),
+    "DSL (10 Mbit/s, 40 ms)": (10, 0.040),
+    "LAN (100 Mbit/s, 2 ms)": (100, 0.002),
+}
+
+DECOMPRESSORS = {
+    "identity": lambda data: data,
+    "gzip": gzip.decompress,
+    "br": lambda data: brotli.decompress(data),
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+def make_result(rows: int, seed: int = 42) -> dict:
+    """
+    Build a response table with customer-like rows.
+
+    Notes are recombined from the sentences in the sample data so that the
+    payload is not just the same ten rows repeated, which would overstate
+    compression ratios.
+    """
+    with open(SAMPLE_CSV, newline="") as csv_file:
+        samples = list(csv.DictReader(csv_file))
+    sentences = [
+        sentence.strip() + "."
+        for sample in samples
+        for sentence in sample["customer_notes"].split(".")
+        if sentence.strip()
+    ]
+
+    rng = random.Random(seed)
+    table = []
+    for i in range(rows):
+        sample = rng.choice(samples)
+        table.append(
+            {
+                **sample,
+                "customer_id": f"C{i:06d}",
+                "customer_notes": " ".join(rng.sample(sentences, k=4)),
+            }
+        )
+    return {
+        "prompt": "Show customers and their notes",
+        "query": "SELECT * FROM customers",
+        "table": table,
+        "execution_time": 0.05,
+        "selected_tables": ["customers"],
+    }
+
+
+def best_time(func, repeat: int) -> tuple[float, bytes]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def encode(encoder_class, level: int, payload: bytes) -> bytes:
+    encoder = encoder_class(level)
+    return encoder.compress(payload) + encoder.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    encoders = available_encoders()
+    print(f"Available encodings: {', '.join(encoders)} (plus identity)\n")
+
+    for rows in args.rows:
+        payload = dumps(make_result(rows))
+        print(f"== {rows} rows, {len(payload) / 1024:.1f} KiB uncompressed ==")
+        header = f"{'encoding':<10} {'KiB':>9} {'ratio':>6} {'enc ms':>8} {'dec ms':>8}"
+        header += "".join(f" {name:>24}" for name in LINKS)
+        print(header)
+
+        candidates = {"identity": (lambda: payload)}
+        for name, (encoder_class, level) in encoders.items():
+            candidates[name] = lambda encoder_class=encoder_class, level=level: encode(
+                encoder_class, level, payload
+            )
+
+        for name, compress in candidates.items():
+            encode_time, data = best_time(compress, args.repeat)
+            decode_time, _ = best_time(lambda: DECOMPRESSORS[name](data), args.repeat)
+            line = (
+                f"{name:<10} {len(data) / 1024:>9.1f} {len(payload) / len(data):>6.1f}"
+                f" {encode_time * 1000:>8.2f} {decode_time * 1000:>8.2f}"
+            )
+            for bandwidth, rtt in LINKS.values():
+                transfer = rtt + len(data) * 8 / (bandwidth * 1_000_000)
+                total = encode_time + transfer + decode_time
+                line += f" {total * 1000:>21.1f} ms"
+            print(line)
+        print()
+
+
+if __name__ == "__main__":
+    main()
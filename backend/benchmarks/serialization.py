@@ -0,0 +1,107 @@
+"""
+Serialization microbenchmark for result table payloads.
+
+Compares the previous response path (jsonable_encoder + stdlib json) with
+the stdlib encoder using json_default and with FastJSONResponse's orjson
+encoder, on result tables of increasing size with the value types DuckDB
+returns (ints, floats, strings, Decimal, date, datetime, NULLs).
+
+Usage (from the backend directory):
+    python -m benchmarks.serialization [--sizes 100 1000 10000] [--repeat 5]
+"""
+
+import json
+import time
+import random
+import argparse
+import datetime
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from app.internal.responses import dumps, json_default
+
+
+def make_result(rows: int, seed: int = 42) -> dict:
+    """Build a response table payload shaped like generate_response_table's."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    table = [
+        {
+            "id": i,
+            "title": f"Paper {i} on query optimization",
+            "score": rng.random(),
+            "price": Decimal(rng.randint(0, 100_000)) / 100,
+            "published": (start + datetime.timedelta(days=i % 365)).date(),
+            "updated_at": start + datetime.timedelta(seconds=i),
+            "summary": None if i % 7 == 0 else "Lorem ipsum dolor sit amet " * 4,
+        }
+        for i in range(rows)
+    ]
+    return {
+        "prompt": "List recent papers with their prices",
+        "query": "SELECT * FROM papers",
+        "table": table,
+        "execution_time": 0.123,
+        "selected_tables": ["papers"],
+    }
+
+
+def jsonable_encoder_stdlib(content) -> bytes:
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def stdlib_default(content) -> bytes:
+    return json.dumps(
+        content, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+SERIALIZERS = {
+    "jsonable_encoder+json": jsonable_encoder_stdlib,
+    "json+json_default": stdlib_default,
+    "FastJSONResponse (dumps)": dumps,
+}
+
+
+def bench(func, content, repeat: int) -> float:
+    """Return the best wall time in seconds over repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    header = (
+        f"{'rows':>8}  {'serializer':<26} {'best ms':>10} {'MB/s':>8} {'speedup':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for rows in args.sizes:
+        content = make_result(rows)
+        size_mb = len(dumps(content)) / 1_000_000
+        baseline = None
+        for name, func in SERIALIZERS.items():
+            elapsed = bench(func, content, args.repeat)
+            baseline = baseline or elapsed
+            print(
+                f"{rows:>8}  {name:<26} {elapsed * 1000:>10.3f} "
+                f"{size_mb / elapsed:>8.1f} {baseline / elapsed:>7.1f}x"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Shared fixtures.
+
+Each test gets its own in-memory database in which llm_complete and
+llm_filter are deterministic SQL macros: their output depends only on the
+prompt and the context values (NULL context included), like a model that
+always answers the same.
+"""
+
+import duckdb
+import pytest
+
+
+@pytest.fixture
+def db():
+    """In-memory database with stand-in LLM functions and sample tables."""
+    connection = duckdb.connect()
+    connection.execute(
+        """
+        CREATE MACRO llm_complete(model, prompt) AS
+            struct_extract(prompt, 'prompt') || ':' || array_to_string(
+                list_transform(
+                    struct_extract(prompt, 'context_columns'),
+                    c -> coalesce(CAST(c.data AS VARCHAR), 'NULL')
+                ),
+                '|'
+            )
+        """
+    )
+    connection.execute(
+        """
+        CREATE MACRO llm_filter(model, prompt) AS
+            list_bool_or(list_transform(
+                struct_extract(prompt, 'context_columns'),
+                c -> coalesce(contains(CAST(c.data AS VARCHAR), 'a'), false)
+            ))
+        """
+    )
+    # 40 customers in 4 segments, some without a name; notes only for some
+    # customers, with repeated and NULL bodies
+    connection.execute(
+        """
+        CREATE TABLE customers AS
+        SELECT i AS id,
+            CASE WHEN i % 9 = 0 THEN NULL ELSE chr(CAST(97 + i % 5 AS INTEGER)) || 'name' || i % 6 END AS name,
+            chr(CAST(97 + i % 4 AS INTEGER)) AS segment
+        FROM range(40) r(i)
+        """
+    )
+    connection.execute(
+        """
+        CREATE TABLE notes AS
+        SELECT i AS id, (i * 7) % 30 AS customer_id,
+            CASE WHEN i % 11 = 0 THEN NULL ELSE 'note ' || chr(CAST(97 + i % 3 AS INTEGER)) || i % 4 END AS body
+        FROM range(60) r(i)
+        """
+    )
+    yield connection
+    connection.close()
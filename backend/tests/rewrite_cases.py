@@ -0,0 +1,97 @@
+"""
+Queries and helpers for the SQL rewriter tests.
+
+The rewriters change the queries users run, so every test runs the original
+and the rewritten query and compares their results, using the stand-in
+llm_complete and llm_filter macros of the db fixture (see conftest.py).
+"""
+
+MODEL = "{'model_name': 'gpt-4o'}"
+
+
+def prompt(*context: str, text: str = "p") -> str:
+    """FlockMTL prompt struct reading the given context expressions."""
+    columns = ", ".join(f"{{'data': {data}}}" for data in context)
+    return f"{{'prompt': '{text}', 'context_columns': [{columns}]}}"
+
+
+def complete(*context: str) -> str:
+    return f"llm_complete({MODEL}, {prompt(*context)})"
+
+
+def llm_filter(*context: str) -> str:
+    return f"llm_filter({MODEL}, {prompt(*context, text='f')})"
+
+
+# Queries the rewriters must not change the results of; every ORDER BY is
+# a total order, so results compare row for row
+QUERIES = {
+    "filter": f"""
+        SELECT id, name FROM customers
+        WHERE segment = 'a' AND {llm_filter("name")} ORDER BY id
+    """,
+    "join_filter": f"""
+        SELECT c.id, n.id AS note_id FROM customers c
+        JOIN notes n ON c.id = n.customer_id
+        WHERE {llm_filter("n.body")} AND c.segment = 'b' ORDER BY 1, 2
+    """,
+    "cte_join": f"""
+        WITH s AS MATERIALIZED (
+            SELECT id, customer_id, {complete("body")} AS summary FROM notes
+        )
+        SELECT c.id, s.id AS note_id, s.summary FROM customers c
+        JOIN s ON c.id = s.customer_id WHERE c.segment = 'a' ORDER BY 2
+    """,
+    "cte_left_join": f"""
+        WITH s AS MATERIALIZED (
+            SELECT id, customer_id, {complete("body")} AS summary FROM notes
+        )
+        SELECT c.id, s.summary FROM customers c
+        LEFT JOIN s ON c.id = s.customer_id
+        WHERE c.segment IN ('a', 'c') ORDER BY c.id, s.id NULLS FIRST
+    """,
+    "subquery_right_join": f"""
+        SELECT c.id, q.summary FROM (
+            SELECT customer_id, id, {complete("body")} AS summary FROM notes
+        ) q
+        RIGHT JOIN customers c ON c.id = q.customer_id
+        WHERE c.segment = 'b' ORDER BY c.id, q.id NULLS FIRST
+    """,
+    "subquery_star_alias": f"""
+        SELECT * FROM (
+            SELECT id AS note_id, body, {complete("body")} AS summary FROM notes
+        ) AS q
+        JOIN customers AS c ON c.id = q.note_id
+        WHERE c.segment = 'c' ORDER BY q.note_id
+    """,
+    "null_context": f"""
+        SELECT id, {complete("body")} AS summary FROM notes ORDER BY id
+    """,
+    "two_context_columns": f"""
+        SELECT n.id, {complete("n.body", "c.name")} AS summary
+        FROM notes AS n LEFT JOIN customers AS c ON c.id = n.customer_id
+        ORDER BY n.id
+    """,
+    "order_by_limit": f"""
+        SELECT id, {complete("body")} AS summary FROM notes
+        ORDER BY id DESC LIMIT 5
+    """,
+    "order_by_output_limit": f"""
+        SELECT id, {complete("body")} AS summary FROM notes
+        ORDER BY summary, id LIMIT 5
+    """,
+    "group_by": f"""
+        SELECT segment, count(*) AS n FROM customers
+        WHERE {llm_filter("name")} GROUP BY segment ORDER BY segment
+    """,
+}
+
+
+def assert_same_results(cursor, original: str, rewritten: str):
+    """Run both queries and check they return the same columns and rows."""
+    expected = cursor.execute(original)
+    expected_columns = [column[0] for column in expected.description]
+    expected_rows = expected.fetchall()
+    actual = cursor.execute(rewritten)
+    assert [column[0] for column in actual.description] == expected_columns
+    assert actual.fetchall() == expected_rows
@@ -0,0 +1,39 @@
+import pytest
+
+import app.internal.query_pipeline_manager as pipeline
+from app.dependencies import query_pipeline_manager
+from app.internal.database import CursorPool
+from app.internal.request_context import RequestCancelled, RequestContext
+from tests.rewrite_cases import QUERIES
+
+
+@pytest.fixture
+def context(db, monkeypatch):
+    monkeypatch.setattr(pipeline, "cursor_pool", CursorPool(db, 2))
+    monkeypatch.setattr(pipeline.result_cache, "enabled", False)
+    monkeypatch.setattr(pipeline.chunked_executor, "enabled", False)
+    monkeypatch.setattr(pipeline.llm_memo, "enabled", False)
+    return RequestContext()
+
+
+def test_check_cancelled(context):
+    context.check_cancelled()
+    context.cancel()
+    with pytest.raises(RequestCancelled):
+        context.check_cancelled()
+
+
+def test_cancel_between_plan_and_query(context, monkeypatch):
+    # No statement is running when the cancel arrives, so nothing is
+    # interrupted; the query must still not run
+    plan_query = pipeline.plan_query
+
+    def plan_then_cancel(cursor, query):
+        planned = plan_query(cursor, query)
+        context.cancel()
+        return planned
+
+    monkeypatch.setattr(pipeline, "plan_query", plan_then_cancel)
+    with pytest.raises(Exception, match="cancelled"):
+        query_pipeline_manager.execute_sql_query(QUERIES["null_context"], context)
+    assert context.execution_result is None
@@ -0,0 +1,67 @@
+import pytest
+
+import app.internal.chunked_execution as chunked_execution
+from app.internal.chunked_execution import ChunkedExecutor
+from app.internal.database import CursorPool
+from app.internal.llm_memo import llm_memo
+from app.internal.request_context import RequestCancelled, RequestContext
+from tests.rewrite_cases import QUERIES
+
+# Queries a chunk plan is made for; the others have calls in subqueries,
+# a LIMIT, an aggregate or an outer join
+SPLIT = ["filter", "join_filter", "null_context"]
+
+
+@pytest.fixture
+def executor(db, monkeypatch):
+    monkeypatch.setattr(chunked_execution, "cursor_pool", CursorPool(db, 4))
+    # The global memo lives on the application's connection
+    monkeypatch.setattr(llm_memo, "enabled", False)
+    executor = ChunkedExecutor(
+        chunks=3, min_model_calls=1, max_concurrent=2, enabled=True
+    )
+    yield executor
+    executor._executor.shutdown()
+
+
+def _rows(table) -> list[tuple]:
+    return [tuple(row.values()) for row in table.to_pylist()]
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_chunks_keep_results(db, executor, name):
+    query = QUERIES[name]
+    plan = executor.plan(db, query, {"model_calls": 1000})
+    assert (plan is not None) == (name in SPLIT)
+    if plan is None:
+        return
+    table, progress = executor.run(db, plan)
+    assert [entry["status"] for entry in progress] == ["done"] * len(plan.queries)
+    assert table.column_names == [column[0] for column in db.execute(query).description]
+    assert _rows(table) == db.execute(query).fetchall()
+
+
+def test_chunks_without_free_cursors(db, executor, monkeypatch):
+    # With every pooled cursor busy, the chunks run on the caller's cursor
+    # instead of waiting for one
+    pool = CursorPool(db, 1)
+    monkeypatch.setattr(chunked_execution, "cursor_pool", pool)
+    query = QUERIES["null_context"]
+    plan = executor.plan(db, query, {"model_calls": 1000})
+    with pool.cursor():
+        table, progress = executor.run(db, plan)
+    assert all(entry["status"] == "done" for entry in progress)
+    assert _rows(table) == db.execute(query).fetchall()
+
+
+def test_small_queries_run_as_one_statement(db, executor):
+    assert executor.plan(db, QUERIES["filter"], {"model_calls": 0}) is None
+
+
+def test_cancelled_chunks_do_not_run(db, executor):
+    context = RequestContext()
+    context.cancel()
+    plan = executor.plan(db, QUERIES["null_context"], {"model_calls": 1000})
+    with pytest.raises(RequestCancelled):
+        executor.run(db, plan, context)
+    assert all(entry["status"] == "failed" for entry in context.chunks)
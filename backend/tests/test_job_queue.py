@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+import app.dependencies as dependencies
+from app.internal.job_queue import JobQueue
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = JobQueue(path=str(tmp_path / "jobs.db"), workers=1)
+    jobs.register("response_table", dependencies._run_response_table_job)
+    return jobs
+
+
+def _wait(jobs, job_id) -> dict:
+    deadline = time.time() + 5
+    while jobs.get(job_id)["status"] in ("queued", "running"):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return jobs.get(job_id, include_result=True)
+
+
+def test_failed_response_table_job(jobs, monkeypatch):
+    # generate_response_table returns its errors instead of raising them
+    failure = {"table": [{"error": "No tables"}], "error": {"message": "No tables"}}
+    monkeypatch.setattr(
+        dependencies.query_pipeline_manager,
+        "generate_response_table",
+        lambda prompt, selected_tables, context: failure,
+    )
+    job = _wait(jobs, jobs.submit("response_table", {"prompt": "p"})["job_id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "No tables"
+    assert job["result"] is None
+
+
+def test_response_table_job(jobs, monkeypatch):
+    monkeypatch.setattr(
+        dependencies.query_pipeline_manager,
+        "generate_response_table",
+        lambda prompt, selected_tables, context: {"prompt": prompt, "table": []},
+    )
+    job = _wait(jobs, jobs.submit("response_table", {"prompt": "p"})["job_id"])
+    assert job["status"] == "done"
+    assert job["result"] == {"prompt": "p", "table": []}
@@ -0,0 +1,65 @@
+import threading
+import time
+import types
+
+from app.internal.llm_client import LLMClient, RateLimiter
+from app.internal.usage import UsageTracker
+
+
+class BlockingCompletions:
+    """Chat completions answering once released, recording peak concurrency."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            self.release.wait(5)
+        finally:
+            with self._lock:
+                self.running -= 1
+        message = types.SimpleNamespace(content="answer")
+        usage = types.SimpleNamespace(prompt_tokens=1, completion_tokens=1)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message)], usage=usage, model=model
+        )
+
+
+def test_hedging_keeps_rate_limiter_concurrency():
+    completions = BlockingCompletions()
+    client = LLMClient(
+        client=types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=completions)
+        ),
+        hedge_enabled=True,
+        hedge_min_samples=1,
+        hedge_min_delay=30,
+        rate_limiter=RateLimiter(max_concurrent=24),
+        usage=UsageTracker(),
+    )
+    # One latency sample turns hedging on for the calls after it
+    completions.release.set()
+    client.complete_text([{"role": "user", "content": "warm"}])
+    completions.release.clear()
+
+    messages = [{"role": "user", "content": "p"}]
+    threads = [
+        threading.Thread(target=client.complete_text, args=(messages,))
+        for _ in range(24)
+    ]
+    for thread in threads:
+        thread.start()
+    # Every call reaches the API at once; none waits for a hedging thread
+    deadline = time.monotonic() + 2
+    while completions.peak < 24 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    completions.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert completions.peak == 24
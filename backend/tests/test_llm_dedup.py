@@ -0,0 +1,32 @@
+import pytest
+
+from app.internal.llm_dedup import DistinctInputRewriter
+from tests.rewrite_cases import QUERIES, assert_same_results, complete
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_rewrite_keeps_results(db, name):
+    query = QUERIES[name]
+    rewritten, _ = DistinctInputRewriter(max_ratio=0.5, min_rows=2).rewrite(db, query)
+    assert_same_results(db, query, rewritten)
+
+
+def test_null_context_is_one_distinct_input(db):
+    query = QUERIES["null_context"]
+    rewritten, report = DistinctInputRewriter(max_ratio=0.5, min_rows=2).rewrite(
+        db, query
+    )
+    assert report[0]["applied"]
+    distinct = db.execute("SELECT count(DISTINCT body) + 1 FROM notes").fetchone()[0]
+    assert report[0]["distinct_inputs"] == distinct
+    assert_same_results(db, query, rewritten)
+
+
+def test_not_applied_over_max_ratio(db):
+    # Every row has its own input, so deduplicating saves nothing
+    query = f"SELECT id, {complete('id')} AS summary FROM notes ORDER BY id"
+    rewritten, report = DistinctInputRewriter(max_ratio=0.5, min_rows=2).rewrite(
+        db, query
+    )
+    assert not report[0]["applied"]
+    assert rewritten == query
@@ -0,0 +1,40 @@
+import pytest
+
+import app.internal.llm_memo as llm_memo_module
+from app.internal.llm_memo import LLMMemo
+from tests.rewrite_cases import QUERIES, assert_same_results
+
+
+@pytest.fixture
+def memo(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_memo_module, "is_flockmtl_available", lambda: True)
+    memo = LLMMemo(db, path=str(tmp_path / "memo.db"), ttl_days=0)
+    memo.enabled = True
+    return memo
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_rewrite_keeps_results(db, memo, name):
+    query = QUERIES[name]
+    # The first run fills the memo, the second one reads it
+    for _ in range(2):
+        rewritten, _ = memo.rewrite(db, query)
+        assert_same_results(db, query, rewritten)
+
+
+def test_second_run_hits_memo(db, memo):
+    query = QUERIES["null_context"]
+    _, first = memo.rewrite(db, query)
+    _, second = memo.rewrite(db, query)
+    assert first[0]["model_calls"] > 0
+    assert second[0]["memo_hits"] == first[0]["distinct_inputs"]
+    assert second[0]["model_calls"] == 0
+
+
+def test_prompt_is_part_of_the_key(db, memo):
+    query = QUERIES["null_context"]
+    memo.rewrite(db, query)
+    changed = query.replace("'prompt': 'p'", "'prompt': 'other'")
+    rewritten, report = memo.rewrite(db, changed)
+    assert report[0]["memo_hits"] == 0
+    assert_same_results(db, changed, rewritten)
@@ -0,0 +1,41 @@
+import pytest
+
+from app.internal.llm_probe import total_llm_calls
+from app.internal.llm_pushdown import FilterPushdownRewriter
+from tests.rewrite_cases import QUERIES, assert_same_results
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_rewrite_keeps_results(db, name):
+    query = QUERIES[name]
+    rewritten, report = FilterPushdownRewriter().rewrite(db, query)
+    assert_same_results(db, query, rewritten)
+    if report:
+        assert total_llm_calls(db, rewritten) < total_llm_calls(db, query)
+
+
+@pytest.mark.parametrize(
+    "name, kind",
+    [
+        ("join_filter", "guard"),
+        ("cte_join", "pull_up"),
+        ("subquery_star_alias", "pull_up"),
+        ("order_by_limit", "top_n"),
+    ],
+)
+def test_rewrite_applies(db, name, kind):
+    _, report = FilterPushdownRewriter().rewrite(db, QUERIES[name])
+    assert kind in [rewrite["kind"] for rewrite in report[0]["rewrites"]]
+
+
+@pytest.mark.parametrize("name", ["cte_left_join", "subquery_right_join"])
+def test_no_pull_up_through_outer_joins(db, name):
+    # Unmatched rows must stay NULL rather than call the model on NULL context
+    _, report = FilterPushdownRewriter().rewrite(db, QUERIES[name])
+    kinds = [rewrite["kind"] for entry in report for rewrite in entry["rewrites"]]
+    assert "pull_up" not in kinds
+
+
+def test_disabled(db):
+    query = QUERIES["join_filter"]
+    assert FilterPushdownRewriter(enabled=False).rewrite(db, query) == (query, [])
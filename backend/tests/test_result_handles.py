@@ -0,0 +1,34 @@
+import threading
+
+from app.internal.request_context import request_progress
+from app.internal.result_handles import ResultHandleStore
+from app.internal.tracing import Trace, current_trace
+
+
+def test_run_outlives_submitting_trace():
+    store = ResultHandleStore(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def work(context):
+        started.set()
+        release.wait(5)
+        return "result"
+
+    trace = Trace("trace", "POST", "/query")
+    token = current_trace.set(trace)
+    try:
+        handle = store.submit(work)
+    finally:
+        current_trace.reset(token)
+    assert started.wait(5)
+
+    # The submitting request completes while the run goes on
+    for context in trace.contexts:
+        context.finish()
+    assert trace.contexts == []
+    assert request_progress(handle) is not None
+
+    release.set()
+    store._executor.shutdown()
+    assert store.get(handle)["status"] == "done"
+    assert request_progress(handle) is None
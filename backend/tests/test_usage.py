@@ -0,0 +1,26 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.internal.usage import UsageContextMiddleware, current_endpoint
+
+
+def test_usage_is_labelled_by_route_template():
+    app = FastAPI()
+
+    @app.get("/data/tables/{table_name}/preview")
+    def preview(table_name: str):
+        return current_endpoint()
+
+    @app.post("/jobs/{job_id}")
+    async def job(job_id: str):
+        return current_endpoint()
+
+    app.add_middleware(UsageContextMiddleware)
+    client = TestClient(app)
+
+    assert (
+        client.get("/data/tables/customers/preview").json()
+        == "/data/tables/{table_name}/preview"
+    )
+    assert client.post("/jobs/1234").json() == "/jobs/{job_id}"
+    assert current_endpoint() == "internal"
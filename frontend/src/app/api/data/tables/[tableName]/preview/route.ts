@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from "next/server";
+import { cacheHeaders, conditionalHeaders } from "../../conditional";
 
 const BACKEND_URL = process.env.BACKEND_URL || "http://localhost:8000";
 
@@ -15,16 +16,25 @@ export async function GET(request: NextRequest, { params }: Params) {
     const limit = url.searchParams.get("limit") || "10";
 
     const response = await fetch(
-      `${BACKEND_URL}/data/tables/${tableName}/preview?limit=${limit}`
+      `${BACKEND_URL}/data/tables/${tableName}/preview?limit=${limit}`,
+      { headers: conditionalHeaders(request) }
     );
 
+    // Unchanged since the client's copy: relay the 304 without a body
+    if (response.status === 304) {
+      return new NextResponse(null, {
+        status: 304,
+        headers: cacheHeaders(response),
+      });
+    }
+
     if (!response.ok) {
       const errorData = await response.json();
       return NextResponse.json(errorData, { status: response.status });
     }
 
     const data = await response.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: cacheHeaders(response) });
   } catch (error) {
     console.error("Table preview error:", error);
     return NextResponse.json(
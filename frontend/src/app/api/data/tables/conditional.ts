@@ -0,0 +1,13 @@
+import { NextRequest } from "next/server";
+
+// Forward the browser's cache validator so the backend can answer 304
+export function conditionalHeaders(request: NextRequest): HeadersInit {
+  const ifNoneMatch = request.headers.get("if-none-match");
+  return ifNoneMatch ? { "If-None-Match": ifNoneMatch } : {};
+}
+
+// Pass the backend's ETag through so the browser revalidates on each poll
+export function cacheHeaders(response: Response): HeadersInit {
+  const etag = response.headers.get("etag");
+  return etag ? { ETag: etag, "Cache-Control": "no-cache" } : {};
+}
@@ -1,10 +1,21 @@
-import { NextResponse } from "next/server";
+import { NextRequest, NextResponse } from "next/server";
+import { cacheHeaders, conditionalHeaders } from "./conditional";
 
 const BACKEND_URL = process.env.BACKEND_URL || "http://localhost:8000";
 
-export async function GET() {
+export async function GET(request: NextRequest) {
   try {
-    const response = await fetch(`${BACKEND_URL}/data/tables`);
+    const response = await fetch(`${BACKEND_URL}/data/tables`, {
+      headers: conditionalHeaders(request),
+    });
+
+    // Unchanged since the client's copy: relay the 304 without a body
+    if (response.status === 304) {
+      return new NextResponse(null, {
+        status: 304,
+        headers: cacheHeaders(response),
+      });
+    }
 
     if (!response.ok) {
       const errorData = await response.json();
@@ -12,7 +23,7 @@ export async function GET() {
     }
 
     const data = await response.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: cacheHeaders(response) });
   } catch (error) {
     console.error("Tables fetch error:", error);
     return NextResponse.json(